@@ -0,0 +1,169 @@
+"""
+Alert rules evaluated by the notification engine (notify.py).
+
+Each rule reads one collection with the sync Firestore client and returns
+the alerts that currently apply. An alert's `event` identifies the
+occurrence (the document plus the due date, expiry date or week it is
+about), so a recipient hears about it once, and again only when it
+recurs: the next PM cycle, a rescheduled due date, another week of low
+stock.
+
+Alerts go to the document's assignee; alerts with no assignee go to
+ALERT_DEFAULT_RECIPIENTS (comma-separated usernames or email addresses).
+User subscriptions (inbox.py) add and remove recipients on top of that.
+Only "high" priority alerts are delivered right away, the rest are
+collected into digests.
+"""
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from database import doc_with_id
+from firestore_codec import to_datetime
+
+ALERT_PM_DUE_DAYS = int(os.environ.get("ALERT_PM_DUE_DAYS", "3"))
+ALERT_WARRANTY_DAYS = int(os.environ.get("ALERT_WARRANTY_DAYS", "30"))
+ALERT_DEFAULT_RECIPIENTS = [
+    recipient.strip() for recipient in os.environ.get("ALERT_DEFAULT_RECIPIENTS", "").split(",") if recipient.strip()
+]
+
+HIGH_PRIORITIES = {"critical", "high"}
+OPEN_WORK_ORDER_STATUSES = ["open", "in-progress"]
+
+
+@dataclass
+class Alert:
+    kind: str
+    event: str
+    title: str
+    priority: str  # "high" or "low"
+    recipients: List[str]
+    collection: str
+    documentId: str
+    details: Dict[str, Any] = field(default_factory=dict)
+    assignee: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "event": self.event,
+            "title": self.title,
+            "priority": self.priority,
+            "collection": self.collection,
+            "documentId": self.documentId,
+            "details": self.details,
+        }
+
+
+def _recipients(assignee: Optional[str]) -> List[str]:
+    return [assignee] if assignee else list(ALERT_DEFAULT_RECIPIENTS)
+
+
+def pm_due(db, now: datetime) -> List[Alert]:
+    """PM schedules due within ALERT_PM_DUE_DAYS, or already past due."""
+    horizon = now + timedelta(days=ALERT_PM_DUE_DAYS)
+    alerts = []
+    for snapshot in db.collection("preventive_maintenance").stream():
+        pm = doc_with_id(snapshot)
+        due = to_datetime(pm.get("nextDue")) if pm else None
+        if due is None or due > horizon:
+            continue
+        overdue = due < now
+        alerts.append(Alert(
+            kind="pm_due",
+            event=f"pm_due:{pm['id']}:{due.date().isoformat()}",
+            title=f"PM {'overdue' if overdue else 'due'}: {pm.get('name') or pm.get('pmNumber') or pm['id']}",
+            priority="high" if overdue or pm.get("priority") in HIGH_PRIORITIES else "low",
+            recipients=_recipients(pm.get("assignedTo")),
+            assignee=pm.get("assignedTo"),
+            collection="preventive_maintenance",
+            documentId=pm["id"],
+            details={"pmNumber": pm.get("pmNumber"), "assetId": pm.get("assetId"),
+                     "location": pm.get("location"), "due": due},
+        ))
+    return alerts
+
+
+def wo_overdue(db, now: datetime) -> List[Alert]:
+    """Open or in-progress work orders past their due date."""
+    alerts = []
+    query = db.collection("work_orders").where("status", "in", OPEN_WORK_ORDER_STATUSES)
+    for snapshot in query.stream():
+        wo = doc_with_id(snapshot)
+        due = to_datetime(wo.get("dueDate")) if wo else None
+        if due is None or due >= now:
+            continue
+        alerts.append(Alert(
+            kind="wo_overdue",
+            event=f"wo_overdue:{wo['id']}:{due.date().isoformat()}",
+            title=f"Work order overdue: {wo.get('workOrderNumber') or wo['id']} {wo.get('title') or ''}".rstrip(),
+            priority="high",
+            recipients=_recipients(wo.get("assignedTo")),
+            assignee=wo.get("assignedTo"),
+            collection="work_orders",
+            documentId=wo["id"],
+            details={"workOrderNumber": wo.get("workOrderNumber"), "assetId": wo.get("assetId"),
+                     "location": wo.get("location"), "due": due},
+        ))
+    return alerts
+
+
+def low_stock(db, now: datetime) -> List[Alert]:
+    """Inventory at or below its minStock; repeated weekly while it stays low."""
+    week = now.strftime("%G-W%V")
+    alerts = []
+    for snapshot in db.collection("inventory").stream():
+        item = doc_with_id(snapshot)
+        if not item or item.get("quantity") is None or item.get("minStock") is None:
+            continue
+        if item["quantity"] > item["minStock"]:
+            continue
+        alerts.append(Alert(
+            kind="low_stock",
+            event=f"low_stock:{item['id']}:{week}",
+            title=f"Low stock: {item.get('name') or item['id']} ({item['quantity']} left, minimum {item['minStock']})",
+            priority="high" if item["quantity"] <= 0 else "low",
+            recipients=list(ALERT_DEFAULT_RECIPIENTS),
+            collection="inventory",
+            documentId=item["id"],
+            details={"partNumber": item.get("partNumber"), "location": item.get("location"),
+                     "quantity": item["quantity"], "minStock": item["minStock"]},
+        ))
+    return alerts
+
+
+def warranty_expiring(db, now: datetime) -> List[Alert]:
+    """Assets whose warranty ends within ALERT_WARRANTY_DAYS."""
+    horizon = now + timedelta(days=ALERT_WARRANTY_DAYS)
+    query = (
+        db.collection("assets")
+        .where("warrantyExpiry", ">=", now)
+        .where("warrantyExpiry", "<=", horizon)
+    )
+    alerts = []
+    for snapshot in query.stream():
+        asset = doc_with_id(snapshot)
+        expiry = to_datetime(asset.get("warrantyExpiry")) if asset else None
+        if expiry is None:
+            continue
+        alerts.append(Alert(
+            kind="warranty_expiring",
+            event=f"warranty_expiring:{asset['id']}:{expiry.date().isoformat()}",
+            title=f"Warranty expiring {expiry.date().isoformat()}: {asset.get('name') or asset['id']}",
+            priority="low",
+            recipients=list(ALERT_DEFAULT_RECIPIENTS),
+            collection="assets",
+            documentId=asset["id"],
+            details={"assetNumber": asset.get("assetNumber"), "location": asset.get("location"),
+                     "criticality": asset.get("criticality"), "expires": expiry},
+        ))
+    return alerts
+
+
+RULES: Dict[str, Callable[[Any, datetime], List[Alert]]] = {
+    "pm_due": pm_due,
+    "wo_overdue": wo_overdue,
+    "low_stock": low_stock,
+    "warranty_expiring": warranty_expiring,
+}
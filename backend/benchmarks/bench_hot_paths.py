@@ -0,0 +1,87 @@
+"""
+Per-row cost of the helpers every list/stats request runs.
+
+    cd backend
+    python -m pytest -c benchmarks/pytest.ini benchmarks --rows 1000,10000
+    python -m pytest -c benchmarks/pytest.ini benchmarks --benchmark-compare --benchmark-compare-fail=mean:20%
+    python -m pytest -c benchmarks/pytest.ini benchmarks --benchmark-save=baseline   # refresh baselines
+    pytest-benchmark --storage file://benchmarks/baselines/pytest compare --group-by=name
+
+Each benchmark is parametrized by row count, so a regression in the
+per-row cost shows up as a proportional jump across the 1k/10k/100k
+columns rather than as noise in a single number. Baselines live in
+benchmarks/baselines/pytest (see pytest.ini).
+"""
+from datetime import datetime
+from typing import List
+
+from database import add_timestamps, doc_with_id
+from models import Asset, WorkOrder
+from responses import adapter_for
+from routes.assets import _serialize_asset_for_response
+from routes.work_orders import _codec as work_order_codec
+from routes.work_orders import sort_newest_first, summarize_work_orders
+
+
+def _rounds(rows: int) -> int:
+    # Keep each benchmark to roughly the same wall time
+    return max(3, 200_000 // rows)
+
+
+def test_doc_with_id(benchmark, work_order_snapshots, rows):
+    result = benchmark.pedantic(
+        lambda: [doc_with_id(snap) for snap in work_order_snapshots],
+        rounds=_rounds(rows), warmup_rounds=1,
+    )
+    assert len(result) == rows
+
+
+def test_add_timestamps(benchmark, rows):
+    documents = [{"title": "Belt", "status": "open"} for _ in range(rows)]
+    benchmark.pedantic(
+        lambda: [add_timestamps(document, is_update=True) for document in documents],
+        rounds=_rounds(rows), warmup_rounds=1,
+    )
+    assert "updatedAt" in documents[0]
+
+
+def test_serialize_asset_for_response(benchmark, asset_snapshots, rows):
+    # The helper converts in place, so every round gets fresh Firestore dicts
+    def setup():
+        return ([snap.to_dict() for snap in asset_snapshots],), {}
+
+    def run(documents: List[dict]):
+        return [_serialize_asset_for_response(document) for document in documents]
+
+    result = benchmark.pedantic(run, setup=setup, rounds=_rounds(rows))
+    assert len(result) == rows
+
+
+def test_work_order_stats_loop(benchmark, work_order_snapshots, rows):
+    now = datetime(2026, 1, 1)
+    result = benchmark.pedantic(
+        summarize_work_orders, args=(work_order_snapshots, now), rounds=_rounds(rows), warmup_rounds=1,
+    )
+    assert result["total"] == rows
+
+
+def test_list_work_orders_sort(benchmark, work_order_snapshots, rows):
+    def setup():
+        return (list(reversed(work_order_snapshots)),), {}
+
+    result = benchmark.pedantic(sort_newest_first, setup=setup, rounds=_rounds(rows))
+    assert len(result) == rows
+
+
+def test_validate_work_order_list(benchmark, work_order_snapshots, rows):
+    documents = [work_order_codec.decode(doc_with_id(snap)) for snap in work_order_snapshots]
+    adapter = adapter_for(List[WorkOrder])
+    result = benchmark.pedantic(adapter.validate_python, args=(documents,), rounds=_rounds(rows), warmup_rounds=1)
+    assert len(result) == rows
+
+
+def test_validate_asset_list(benchmark, asset_snapshots, rows):
+    documents = [_serialize_asset_for_response(doc_with_id(snap)) for snap in asset_snapshots]
+    adapter = adapter_for(List[Asset])
+    result = benchmark.pedantic(adapter.validate_python, args=(documents,), rounds=_rounds(rows), warmup_rounds=1)
+    assert len(result) == rows
@@ -0,0 +1,124 @@
+"""
+Compares the default FastAPI list response path with the FAST_JSON path.
+
+For each list model it reports the bytes on the wire (raw, gzip, brotli)
+and the CPU time spent turning N Firestore-shaped rows into a response body.
+
+    cd backend
+    python -m benchmarks.bench_list_responses --rows 1000 --repeat 20
+"""
+import argparse
+import asyncio
+import gzip
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import Asset, InventoryItem, Location, WorkOrder
+from responses import encode_model, encode_trusted
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _work_order(i: int, now: datetime) -> dict:
+    return {
+        "_id": f"wo{i:06d}", "id": f"wo{i:06d}", "workOrderNumber": f"WO-{1700000000 + i}",
+        "title": "Replace drive belt on conveyor line", "description": "Belt shows cracking near the tensioner",
+        "assetId": f"asset{i % 500:05d}", "assetName": "Conveyor 3", "priority": ("low", "medium", "high")[i % 3],
+        "status": ("open", "in-progress", "completed")[i % 3], "type": "corrective", "assignedTo": "tech01",
+        "createdBy": "System", "createdDate": now - timedelta(days=i % 90), "dueDate": now + timedelta(days=i % 14),
+        "completedDate": None, "estimatedTime": 2.5, "actualTime": None, "location": "Mill Floor",
+        "cost": 120.0, "partsUsed": ["BELT-42", "BOLT-8"], "notes": "", "createdAt": now, "updatedAt": now,
+    }
+
+
+def _asset(i: int, now: datetime) -> dict:
+    return {
+        "_id": f"asset{i:05d}", "id": f"asset{i:05d}", "assetNumber": f"ASSET-{i:05d}", "name": f"Pump {i}",
+        "category": "Pumps", "manufacturer": "Grundfos", "model": "CR 10", "serialNumber": f"SN{i:08d}",
+        "purchaseDate": now.date(), "installDate": now.date(), "warrantyExpiry": now.date(), "location": "Boiler House",
+        "status": "operational", "condition": "good", "maintenanceCost": 0, "downtime": 0, "criticality": "high",
+        "specifications": {"power": "7.5kW", "flow": "10m3/h"}, "imageUrl": None, "imageThumbUrl": None,
+        "createdAt": now, "updatedAt": now,
+    }
+
+
+def _location(i: int, now: datetime) -> dict:
+    return {
+        "_id": f"loc{i:04d}", "id": f"loc{i:04d}", "locationId": f"LOC-{i:04d}", "name": f"Building {i}",
+        "type": "building", "address": "Madampe", "city": "Madampe", "state": "NW", "zipCode": "61230",
+        "coordinates": {"lat": 7.5, "lng": 79.8}, "size": 1200, "floors": 2, "imageUrl": None,
+        "imageThumbUrl": None, "assetCount": 12, "activeWOs": 3, "createdAt": now, "updatedAt": now,
+    }
+
+
+def _inventory(i: int, now: datetime) -> dict:
+    return {
+        "_id": f"inv{i:05d}", "id": f"inv{i:05d}", "partNumber": f"PN-{i:05d}", "name": "Bearing 6204",
+        "category": "Bearings", "description": "Deep groove ball bearing", "quantity": 40, "minStock": 10,
+        "maxStock": 100, "unit": "pcs", "unitCost": 4.2, "location": "Store A", "supplier": "SKF",
+        "status": "in-stock", "createdAt": now, "updatedAt": now,
+    }
+
+
+FACTORIES: Dict[type, Callable[[int, datetime], dict]] = {
+    WorkOrder: _work_order,
+    Asset: _asset,
+    Location: _location,
+    InventoryItem: _inventory,
+}
+
+
+def _default_path(model) -> Callable[[List[dict]], bytes]:
+    field = create_response_field(name="Response", type_=List[model], mode="serialization")
+
+    def encode(rows: List[dict]) -> bytes:
+        content = asyncio.run(serialize_response(field=field, response_content=rows, is_coroutine=True))
+        return JSONResponse(content).body
+
+    return encode
+
+
+def _measure(encode: Callable[[List[dict]], bytes], rows: List[dict], repeat: int):
+    body = encode(rows)
+    started = time.process_time()
+    for _ in range(repeat):
+        encode(rows)
+    cpu_ms = (time.process_time() - started) / repeat * 1000
+    return body, cpu_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    header = f"{'model':<14}{'path':<16}{'cpu ms/req':>12}{'raw bytes':>12}{'gzip':>10}{'brotli':>10}"
+    print(f"{args.rows} rows per request, {args.repeat} repetitions")
+    print(header)
+    print("-" * len(header))
+    for model, factory in FACTORIES.items():
+        rows = [factory(i, now) for i in range(args.rows)]
+        paths = {
+            "default": _default_path(model),
+            "fast": lambda data, m=model: encode_model(List[m], data),
+            "fast-trusted": encode_trusted,
+        }
+        for name, encode in paths.items():
+            body, cpu_ms = _measure(encode, rows, args.repeat)
+            gz = len(gzip.compress(body, compresslevel=6))
+            br = len(brotli.compress(body, quality=4)) if brotli else 0
+            print(f"{model.__name__:<14}{name:<16}{cpu_ms:>12.2f}{len(body):>12}{gz:>10}{br:>10}")
+
+
+if __name__ == "__main__":
+    main()
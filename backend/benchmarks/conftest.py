@@ -0,0 +1,56 @@
+"""
+Fixtures for the pytest-benchmark microbenchmarks (bench_*.py).
+
+Rows come from benchmarks.dataset, so they have the same Firestore shape
+(encoded dates, DatetimeWithNanoseconds after a round trip) the routers
+see in production.
+"""
+import os
+
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+
+from functools import lru_cache
+from typing import List, Tuple
+
+import pytest
+
+from benchmarks import dataset
+from fake_firestore import FakeFirestore
+
+DEFAULT_ROWS = "1000,10000,100000"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--rows", default=os.environ.get("BENCH_ROWS", DEFAULT_ROWS),
+        help="comma separated row counts to benchmark (default: %(default)s)",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "rows" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("rows").split(",") if size]
+        metafunc.parametrize("rows", sizes, ids=[f"{size}" for size in sizes])
+
+
+@lru_cache(maxsize=None)
+def _snapshots(collection: str, rows: int) -> Tuple:
+    spec = dataset.DatasetSpec(
+        locations=50, assets=max(rows, 1000), work_orders=rows, pm_schedules=0,
+        inventory=0, transactions_per_item=0,
+    )
+    fake = FakeFirestore()
+    for chunk in range(dataset.chunk_count(spec, collection)):
+        fake.load(collection, dataset.generate_chunk(spec, collection, chunk, validate=False))
+    snapshots = tuple(fake.collection(collection).limit(rows).stream())
+    return snapshots
+
+
+@pytest.fixture
+def work_order_snapshots(rows) -> List:
+    return list(_snapshots("work_orders", rows))
+
+
+@pytest.fixture
+def asset_snapshots(rows) -> List:
+    return list(_snapshots("assets", rows))
@@ -0,0 +1,457 @@
+"""
+Seeded synthetic CMMS dataset at production-like cardinalities.
+
+Generates locations, assets, work orders, preventive maintenance schedules,
+inventory items and their consumption history (inventory_transactions)
+with skewed, realistic distributions:
+
+- assets per location and work orders per asset follow heavy-tailed
+  lognormal popularity weights, so a few hot assets carry most of the history;
+- work order status and priority are skewed towards completed/medium;
+- created dates grow over the time window; due, completed and actual
+  times come from gamma/exponential/lognormal draws.
+
+Every collection is produced in fixed-size chunks, each from its own
+SeedSequence(seed, collection, chunk). Output is therefore identical for a
+given seed no matter how many worker processes are used. Document ids are
+positional (asset000042, wo0001234, ...), so callers can address documents
+without reading them back.
+
+Rows are validated against the API models (the first chunk of each
+collection by default, or all with --validate all) and stored in the
+Firestore shape produced by firestore_codec.
+
+    cd backend
+    python -m benchmarks.dataset --scale production --out data/prod --workers 8
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.dataset --target firestore
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import orjson
+from pydantic import TypeAdapter
+
+from firestore_codec import codec_for
+from models import Asset, InventoryItem, Location, PreventiveMaintenance, WorkOrder
+
+CHUNK_SIZE = 10_000
+FIRESTORE_BATCH_LIMIT = 500
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    locations: int
+    assets: int
+    work_orders: int
+    pm_schedules: int
+    inventory: int
+    # Mean consumption transactions per inventory item
+    transactions_per_item: float
+    days: int = 3 * 365
+    seed: int = 7
+    end: str = "2026-01-01"
+
+
+SCALES = {
+    "small": DatasetSpec(locations=20, assets=1_000, work_orders=10_000, pm_schedules=400,
+                         inventory=500, transactions_per_item=10),
+    "medium": DatasetSpec(locations=100, assets=10_000, work_orders=100_000, pm_schedules=4_000,
+                          inventory=2_000, transactions_per_item=20),
+    "production": DatasetSpec(locations=300, assets=50_000, work_orders=1_000_000, pm_schedules=20_000,
+                              inventory=5_000, transactions_per_item=40),
+}
+
+COLLECTIONS = ("locations", "assets", "work_orders", "preventive_maintenance", "inventory",
+               "inventory_transactions")
+MODELS = {
+    "locations": Location,
+    "assets": Asset,
+    "work_orders": WorkOrder,
+    "preventive_maintenance": PreventiveMaintenance,
+    "inventory": InventoryItem,
+}
+
+WO_STATUSES = np.array(["open", "in-progress", "on-hold", "completed", "cancelled"])
+WO_STATUS_P = [0.12, 0.08, 0.03, 0.72, 0.05]
+PRIORITIES = np.array(["low", "medium", "high", "critical"])
+PRIORITY_P = [0.30, 0.45, 0.20, 0.05]
+WO_TYPES = np.array(["corrective", "preventive", "inspection", "emergency"])
+WO_TYPE_P = [0.45, 0.40, 0.10, 0.05]
+ASSET_CATEGORIES = np.array(["Pumps", "Motors", "Conveyors", "Boilers", "Compressors", "HVAC", "Electrical", "Vehicles"])
+ASSET_STATUSES = np.array(["operational", "maintenance", "down", "retired"])
+ASSET_STATUS_P = [0.86, 0.08, 0.04, 0.02]
+CONDITIONS = np.array(["excellent", "good", "fair", "poor"])
+FREQUENCIES = np.array(["daily", "weekly", "monthly", "quarterly", "yearly"])
+FREQUENCY_DAYS = np.array([1, 7, 30, 91, 365])
+FREQUENCY_P = [0.05, 0.20, 0.40, 0.25, 0.10]
+PART_CATEGORIES = np.array(["Bearings", "Belts", "Filters", "Seals", "Fasteners", "Lubricants", "Electrical"])
+LOCATION_TYPES = np.array(["building", "floor", "room", "area", "yard"])
+
+
+def location_id(i) -> str:
+    return f"loc{i:05d}"
+
+
+def asset_id(i) -> str:
+    return f"asset{i:06d}"
+
+
+def work_order_id(i) -> str:
+    return f"wo{i:07d}"
+
+
+def inventory_id(i) -> str:
+    return f"inv{i:05d}"
+
+
+def _rng(spec: DatasetSpec, collection: str, chunk: int) -> np.random.Generator:
+    return np.random.Generator(np.random.PCG64(
+        np.random.SeedSequence([spec.seed, COLLECTIONS.index(collection), chunk])
+    ))
+
+
+@lru_cache(maxsize=None)
+def _weights(spec: DatasetSpec, name: str, size: int, sigma: float) -> np.ndarray:
+    # Shared popularity weights (same for every chunk) from a lognormal draw
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence([spec.seed, zlib.crc32(name.encode()), size])))
+    weights = rng.lognormal(0.0, sigma, size)
+    return weights / weights.sum()
+
+
+@lru_cache(maxsize=None)
+def _asset_locations(spec: DatasetSpec) -> np.ndarray:
+    # Location index of every asset, shared by assets and their work orders
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence([spec.seed, zlib.crc32(b"asset-locations")])))
+    return rng.choice(spec.locations, spec.assets, p=_weights(spec, "locations", spec.locations, 1.2))
+
+
+def _end(spec: DatasetSpec) -> np.datetime64:
+    return np.datetime64(spec.end, "s")
+
+
+def _to_datetimes(values: np.ndarray) -> List[datetime]:
+    return values.astype("datetime64[us]").tolist()
+
+
+def _created_offsets(rng: np.random.Generator, spec: DatasetSpec, n: int) -> np.ndarray:
+    # Activity grows over time: sqrt of a uniform skews towards recent dates
+    seconds = spec.days * 86400
+    return (np.sqrt(rng.random(n)) * seconds).astype("int64") - seconds
+
+
+def _chunk_bounds(total: int, chunk: int):
+    start = chunk * CHUNK_SIZE
+    return start, min(total, start + CHUNK_SIZE)
+
+
+def gen_locations(spec: DatasetSpec, chunk: int) -> List[dict]:
+    start, stop = _chunk_bounds(spec.locations, chunk)
+    n = stop - start
+    rng = _rng(spec, "locations", chunk)
+    created = _to_datetimes(_end(spec) - np.timedelta64(spec.days, "D") + rng.integers(0, 86400 * 30, n).astype("timedelta64[s]"))
+    types = rng.choice(LOCATION_TYPES, n, p=[0.3, 0.25, 0.25, 0.15, 0.05])
+    sizes = rng.lognormal(6.5, 0.8, n).astype(int)
+    floors = rng.integers(1, 6, n)
+    lat = 7.43 + rng.normal(0, 0.02, n)
+    lng = 79.84 + rng.normal(0, 0.02, n)
+    rows = []
+    for k in range(n):
+        i = start + k
+        rows.append({
+            "id": location_id(i), "locationId": f"LOC-{i:05d}", "name": f"{types[k].title()} {i}",
+            "type": str(types[k]), "address": "Madampe", "city": "Madampe", "state": "North Western",
+            "zipCode": "61230", "coordinates": {"lat": float(lat[k]), "lng": float(lng[k])},
+            "size": int(sizes[k]), "floors": int(floors[k]), "imageUrl": None,
+            "assetCount": 0, "activeWOs": 0, "createdAt": created[k], "updatedAt": created[k],
+        })
+    return rows
+
+
+def gen_assets(spec: DatasetSpec, chunk: int) -> List[dict]:
+    start, stop = _chunk_bounds(spec.assets, chunk)
+    n = stop - start
+    rng = _rng(spec, "assets", chunk)
+    locations = _asset_locations(spec)[start:stop]
+    categories = rng.choice(ASSET_CATEGORIES, n)
+    statuses = rng.choice(ASSET_STATUSES, n, p=ASSET_STATUS_P)
+    conditions = rng.choice(CONDITIONS, n, p=[0.2, 0.5, 0.22, 0.08])
+    criticality = rng.choice(PRIORITIES, n, p=[0.25, 0.45, 0.22, 0.08])
+    purchase = _end(spec) - rng.integers(30, 365 * 15, n).astype("timedelta64[D]")
+    install = purchase + rng.integers(0, 90, n).astype("timedelta64[D]")
+    warranty = purchase + (rng.choice([1, 2, 3, 5], n) * 365).astype("timedelta64[D]")
+    cost = np.round(rng.lognormal(7, 1.2, n), 2)
+    downtime = rng.poisson(6, n)
+    purchase_d, install_d, warranty_d = (a.astype("datetime64[D]").tolist() for a in (purchase, install, warranty))
+    created = _to_datetimes(install)
+    rows = []
+    for k in range(n):
+        i = start + k
+        rows.append({
+            "id": asset_id(i), "assetNumber": f"AST-{i:06d}", "name": f"{categories[k][:-1]} {i}",
+            "category": str(categories[k]), "manufacturer": "Generic", "model": f"M{i % 97}",
+            "serialNumber": f"SN{i:09d}", "purchaseDate": purchase_d[k], "installDate": install_d[k],
+            "warrantyExpiry": warranty_d[k], "location": location_id(int(locations[k])),
+            "status": str(statuses[k]), "condition": str(conditions[k]),
+            "maintenanceCost": float(cost[k]), "downtime": int(downtime[k]),
+            "criticality": str(criticality[k]), "specifications": {}, "imageUrl": None,
+            "createdAt": created[k], "updatedAt": created[k],
+        })
+    return rows
+
+
+def gen_work_orders(spec: DatasetSpec, chunk: int) -> List[dict]:
+    start, stop = _chunk_bounds(spec.work_orders, chunk)
+    n = stop - start
+    rng = _rng(spec, "work_orders", chunk)
+    asset_p = _weights(spec, "assets", spec.assets, 1.5)
+    assets = rng.choice(spec.assets, n, p=asset_p)
+    locations = _asset_locations(spec)[assets]
+    statuses = rng.choice(WO_STATUSES, n, p=WO_STATUS_P)
+    priorities = rng.choice(PRIORITIES, n, p=PRIORITY_P)
+    types = rng.choice(WO_TYPES, n, p=WO_TYPE_P)
+    created = _end(spec) + _created_offsets(rng, spec, n).astype("timedelta64[s]")
+    due = created + (rng.gamma(2.0, 3.0, n) * 86400).astype("int64").astype("timedelta64[s]")
+    completed_at = created + (rng.exponential(4.0, n) * 86400).astype("int64").astype("timedelta64[s]")
+    estimated = np.round(rng.lognormal(0.7, 0.6, n), 1)
+    actual = np.round(estimated * rng.lognormal(0.05, 0.35, n), 1)
+    cost = np.round(rng.lognormal(4.5, 1.1, n), 2)
+    technicians = rng.integers(0, 60, n)
+    created_l, due_l, completed_l = _to_datetimes(created), _to_datetimes(due), _to_datetimes(completed_at)
+    rows = []
+    for k in range(n):
+        i = start + k
+        status = str(statuses[k])
+        done = status == "completed"
+        rows.append({
+            "id": work_order_id(i), "workOrderNumber": f"WO-{i:07d}", "title": f"{types[k].title()} work",
+            "description": "", "assetId": asset_id(int(assets[k])), "priority": str(priorities[k]),
+            "status": status, "type": str(types[k]), "assignedTo": f"tech{int(technicians[k]):02d}",
+            "createdBy": "System", "createdDate": created_l[k], "dueDate": due_l[k],
+            "completedDate": completed_l[k] if done else None, "estimatedTime": float(estimated[k]),
+            "actualTime": float(actual[k]) if done else None, "location": location_id(int(locations[k])),
+            "cost": float(cost[k]) if done else 0.0, "partsUsed": [], "notes": "",
+            "createdAt": created_l[k], "updatedAt": completed_l[k] if done else created_l[k],
+        })
+    return rows
+
+
+def gen_pm_schedules(spec: DatasetSpec, chunk: int) -> List[dict]:
+    start, stop = _chunk_bounds(spec.pm_schedules, chunk)
+    n = stop - start
+    rng = _rng(spec, "preventive_maintenance", chunk)
+    assets = rng.choice(spec.assets, n, p=_weights(spec, "assets", spec.assets, 1.5))
+    freq_index = rng.choice(len(FREQUENCIES), n, p=FREQUENCY_P)
+    period = FREQUENCY_DAYS[freq_index]
+    # Last completion somewhere within one period before the end; some overdue
+    last = _end(spec).astype("datetime64[D]") - (rng.random(n) * period * 1.2).astype("int64").astype("timedelta64[D]")
+    next_due = last + period.astype("timedelta64[D]")
+    duration = np.round(rng.lognormal(0.3, 0.5, n), 1)
+    priorities = rng.choice(PRIORITIES, n, p=PRIORITY_P)
+    last_l, next_l = last.tolist(), next_due.tolist()
+    created = datetime.fromisoformat(spec.end) - timedelta(days=spec.days)
+    rows = []
+    for k in range(n):
+        i = start + k
+        rows.append({
+            "id": f"pm{i:06d}", "pmNumber": f"PM-{i:06d}", "name": f"{FREQUENCIES[freq_index[k]].title()} service",
+            "assetId": asset_id(int(assets[k])), "frequency": str(FREQUENCIES[freq_index[k]]),
+            "lastCompleted": last_l[k], "nextDue": next_l[k], "estimatedDuration": float(duration[k]),
+            "assignedTo": f"tech{i % 60:02d}", "priority": str(priorities[k]),
+            "tasks": ["Inspect", "Lubricate", "Record readings"], "partsRequired": [], "active": True,
+            "createdAt": created, "updatedAt": created,
+        })
+    return rows
+
+
+def gen_inventory(spec: DatasetSpec, chunk: int) -> List[dict]:
+    start, stop = _chunk_bounds(spec.inventory, chunk)
+    n = stop - start
+    rng = _rng(spec, "inventory", chunk)
+    categories = rng.choice(PART_CATEGORIES, n)
+    min_stock = rng.integers(2, 30, n)
+    max_stock = min_stock * rng.integers(3, 10, n)
+    quantity = np.minimum(max_stock, rng.poisson(max_stock * 0.5))
+    unit_cost = np.round(rng.lognormal(2.5, 1.0, n), 2)
+    created = datetime.fromisoformat(spec.end) - timedelta(days=spec.days)
+    rows = []
+    for k in range(n):
+        i = start + k
+        qty, low = int(quantity[k]), int(min_stock[k])
+        rows.append({
+            "id": inventory_id(i), "partNumber": f"PN-{i:05d}", "name": f"{categories[k]} part {i}",
+            "category": str(categories[k]), "description": "", "quantity": qty, "minStock": low,
+            "maxStock": int(max_stock[k]), "unit": "pcs", "unitCost": float(unit_cost[k]),
+            "location": "Main Store", "supplier": f"Supplier {i % 40}",
+            "status": "out-of-stock" if qty == 0 else ("low-stock" if qty <= low else "in-stock"),
+            "createdAt": created, "updatedAt": created,
+        })
+    return rows
+
+
+def gen_transactions(spec: DatasetSpec, chunk: int) -> List[dict]:
+    # One chunk of inventory items produces all of their transactions
+    start, stop = _chunk_bounds(spec.inventory, chunk)
+    n = stop - start
+    rng = _rng(spec, "inventory_transactions", chunk)
+    per_item = rng.poisson(rng.lognormal(np.log(spec.transactions_per_item), 0.8, n))
+    total = int(per_item.sum())
+    items = np.repeat(np.arange(start, stop), per_item)
+    when = _to_datetimes(_end(spec) + _created_offsets(rng, spec, total).astype("timedelta64[s]"))
+    is_issue = rng.random(total) < 0.85
+    quantity = np.where(is_issue, -rng.geometric(0.4, total), rng.integers(10, 100, total))
+    work_orders = rng.integers(0, max(spec.work_orders, 1), total)
+    rows = []
+    for k in range(total):
+        issue = bool(is_issue[k])
+        rows.append({
+            "id": f"txn{chunk:05d}{k:08d}", "itemId": inventory_id(int(items[k])),
+            "partNumber": f"PN-{int(items[k]):05d}", "type": "issue" if issue else "receipt",
+            "quantity": int(quantity[k]), "workOrderId": work_order_id(int(work_orders[k])) if issue else None,
+            "date": when[k], "createdAt": when[k],
+        })
+    return rows
+
+
+GENERATORS: Dict[str, Callable[[DatasetSpec, int], List[dict]]] = {
+    "locations": gen_locations,
+    "assets": gen_assets,
+    "work_orders": gen_work_orders,
+    "preventive_maintenance": gen_pm_schedules,
+    "inventory": gen_inventory,
+    "inventory_transactions": gen_transactions,
+}
+
+
+def chunk_count(spec: DatasetSpec, collection: str) -> int:
+    total = {
+        "locations": spec.locations,
+        "assets": spec.assets,
+        "work_orders": spec.work_orders,
+        "preventive_maintenance": spec.pm_schedules,
+        "inventory": spec.inventory,
+        "inventory_transactions": spec.inventory,
+    }[collection]
+    return (total + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+
+def generate_chunk(spec: DatasetSpec, collection: str, chunk: int, validate: bool) -> List[dict]:
+    """Returns one chunk of Firestore-shaped documents."""
+    rows = GENERATORS[collection](spec, chunk)
+    model = MODELS.get(collection)
+    if model is not None:
+        if validate:
+            TypeAdapter(List[model]).validate_python(rows)
+        codec = codec_for(model)
+        for row in rows:
+            row["_id"] = row["id"]
+            codec.encode(row)
+    return rows
+
+
+def _write_ndjson_chunk(spec: DatasetSpec, collection: str, chunk: int, validate: bool, out: str) -> int:
+    rows = generate_chunk(spec, collection, chunk, validate)
+    path = Path(out) / collection / f"part-{chunk:05d}.ndjson"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_APPEND_NEWLINE
+    with open(path, "wb") as handle:
+        for row in rows:
+            handle.write(orjson.dumps(row, option=option))
+    return len(rows)
+
+
+def _tasks(spec: DatasetSpec, collections, validate: str) -> Iterator[tuple]:
+    for collection in collections:
+        for chunk in range(chunk_count(spec, collection)):
+            yield collection, chunk, validate == "all" or (validate == "sample" and chunk == 0)
+
+
+def write_ndjson(spec: DatasetSpec, out: Path, workers: int, collections=COLLECTIONS, validate: str = "sample") -> Dict[str, int]:
+    counts = {collection: 0 for collection in collections}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (collection, pool.submit(_write_ndjson_chunk, spec, collection, chunk, check, str(out)))
+            for collection, chunk, check in _tasks(spec, collections, validate)
+        ]
+        for collection, future in futures:
+            counts[collection] += future.result()
+    (out / "spec.json").write_bytes(orjson.dumps(asdict(spec), option=orjson.OPT_INDENT_2))
+    return counts
+
+
+def _commit(db, collection: str, rows: List[dict]) -> int:
+    batch = db.batch()
+    reference = db.collection(collection)
+    for row in rows:
+        batch.set(reference.document(row["id"]), row)
+    batch.commit()
+    return len(rows)
+
+
+def write_firestore(db, spec: DatasetSpec, workers: int, collections=COLLECTIONS, validate: str = "sample") -> Dict[str, int]:
+    """
+    Streams the dataset into a Firestore client. The in-memory stand-in is
+    bulk-loaded directly; a real client or the emulator gets parallel
+    500-document batches.
+    """
+    target = getattr(db, "unwrapped", db)
+    counts = {collection: 0 for collection in collections}
+    with ProcessPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=workers * 2) as writers:
+        futures = [
+            (collection, pool.submit(generate_chunk, spec, collection, chunk, check))
+            for collection, chunk, check in _tasks(spec, collections, validate)
+        ]
+        pending = []
+        for collection, future in futures:
+            rows = future.result()
+            if hasattr(target, "load"):
+                counts[collection] += target.load(collection, rows)
+                continue
+            for start in range(0, len(rows), FIRESTORE_BATCH_LIMIT):
+                pending.append((collection, writers.submit(
+                    _commit, db, collection, rows[start:start + FIRESTORE_BATCH_LIMIT]
+                )))
+        for collection, write in pending:
+            counts[collection] += write.result()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=None, help="override the scale's seed")
+    parser.add_argument("--target", choices=("ndjson", "firestore"), default="ndjson")
+    parser.add_argument("--out", type=Path, default=Path("benchmarks/data"), help="NDJSON output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--collections", nargs="*", choices=COLLECTIONS, default=list(COLLECTIONS))
+    parser.add_argument("--validate", choices=("none", "sample", "all"), default="sample",
+                        help="validate rows against the API models (sample = first chunk per collection)")
+    args = parser.parse_args()
+
+    spec = SCALES[args.scale]
+    if args.seed is not None:
+        spec = replace(spec, seed=args.seed)
+    started = time.perf_counter()
+    if args.target == "ndjson":
+        counts = write_ndjson(spec, args.out, args.workers, args.collections, args.validate)
+    else:
+        from database import get_database
+        counts = write_firestore(get_database(), spec, args.workers, args.collections, args.validate)
+    elapsed = time.perf_counter() - started
+    for collection, count in counts.items():
+        print(f"{collection:<26}{count:>10}")
+    total = sum(counts.values())
+    print(f"{total} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
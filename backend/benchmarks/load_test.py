@@ -0,0 +1,319 @@
+"""
+Concurrent load test of every router against the in-memory Firestore.
+
+Seeds fake_firestore with a deterministic dataset, then drives each
+scenario through the full ASGI stack (middleware, routing, threadpool,
+serialization) with N concurrent clients. For each scenario it records
+throughput, p50/p99 latency and Firestore documents read per request (from
+the X-Firestore-Reads header), and compares them with the committed
+baselines in benchmarks/baselines/load_test.json.
+
+    cd backend
+    python -m benchmarks.load_test                      # run and compare
+    python -m benchmarks.load_test --check              # exit 1 on regression
+    python -m benchmarks.load_test --update-baseline    # rewrite baselines
+    python -m benchmarks.load_test --dataset medium     # generated dataset (benchmarks/dataset.py)
+
+With --url the same scenarios go over HTTP to a running server instead,
+e.g. gunicorn serving benchmarks.seeded_app (the app with this dataset
+preloaded before fork, see that module):
+
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --label gunicorn-w4
+
+Reads per request are deterministic and compared strictly; latency
+depends on the machine, so p99 only fails beyond --latency-tolerance.
+"""
+import os
+
+# Must be set before the app modules read their configuration
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ["FIRESTORE_COST_HEADERS"] = "1"
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from database import get_database
+from firestore_codec import codec_for
+from models import Asset, Document, InventoryItem, Location, PreventiveMaintenance, ServiceRequest, WorkOrder
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "load_test.json"
+
+SCALES = {
+    # locations, assets, work orders, inventory, service requests, documents, PM schedules
+    "small": (20, 200, 1000, 200, 200, 50, 100),
+    "medium": (100, 2000, 10000, 1000, 1000, 300, 1000),
+}
+
+STATUSES = ("open", "in-progress", "completed")
+PRIORITIES = ("low", "medium", "high", "critical")
+
+
+def seed(db, scale: str, seed_value: int = 42) -> Dict[str, List[str]]:
+    """
+    Loads a deterministic dataset into a FakeFirestore. Returns the ids per
+    collection so scenarios can address existing documents.
+    """
+    rng = random.Random(seed_value)
+    n_loc, n_assets, n_wo, n_inv, n_sr, n_docs, n_pm = SCALES[scale]
+    now = datetime.utcnow().replace(microsecond=0)
+    fake = db.unwrapped if hasattr(db, "unwrapped") else db
+    fake.reset()
+
+    locations = [f"loc{i:04d}" for i in range(n_loc)]
+    assets = [f"asset{i:05d}" for i in range(n_assets)]
+
+    def load(collection: str, model, rows: List[dict]) -> List[str]:
+        codec = codec_for(model)
+        for row in rows:
+            row["_id"] = row["id"]
+            codec.encode(row)
+        fake.load(collection, rows)
+        return [row["id"] for row in rows]
+
+    ids = {
+        "locations": load("locations", Location, [{
+            "id": loc, "locationId": f"LOC-{i:04d}", "name": f"Building {i}", "type": "building",
+            "address": "Madampe", "city": "Madampe", "state": "NW", "zipCode": "61230",
+            "coordinates": {"lat": 7.5, "lng": 79.8}, "size": 1200, "floors": 2, "imageUrl": None,
+            "assetCount": 0, "activeWOs": 0, "createdAt": now, "updatedAt": now,
+        } for i, loc in enumerate(locations)]),
+        "assets": load("assets", Asset, [{
+            "id": asset, "assetNumber": f"ASSET-{i:05d}", "name": f"Pump {i}", "category": "Pumps",
+            "manufacturer": "Grundfos", "model": "CR 10", "serialNumber": f"SN{i:08d}",
+            "purchaseDate": (now - timedelta(days=900)).date(), "installDate": (now - timedelta(days=800)).date(),
+            "warrantyExpiry": (now + timedelta(days=100)).date(), "location": rng.choice(locations),
+            "status": "operational", "condition": "good", "maintenanceCost": 0, "downtime": 0,
+            "criticality": "high", "specifications": {"power": "7.5kW"}, "imageUrl": None,
+            "createdAt": now, "updatedAt": now,
+        } for i, asset in enumerate(assets)]),
+        "work_orders": load("work_orders", WorkOrder, [{
+            "id": f"wo{i:06d}", "workOrderNumber": f"WO-{1700000000 + i}", "title": "Replace drive belt",
+            "description": "Belt shows cracking", "assetId": rng.choice(assets),
+            "priority": rng.choice(PRIORITIES), "status": rng.choices(STATUSES, weights=(3, 2, 5))[0],
+            "type": "corrective", "assignedTo": f"tech{rng.randrange(20):02d}", "createdBy": "System",
+            "createdDate": now - timedelta(days=rng.randrange(365)), "dueDate": now + timedelta(days=rng.randrange(-30, 30)),
+            "completedDate": None, "estimatedTime": 2.5, "actualTime": None, "location": rng.choice(locations),
+            "cost": 120.0, "partsUsed": ["BELT-42"], "notes": "", "createdAt": now, "updatedAt": now,
+        } for i in range(n_wo)]),
+        "inventory": load("inventory", InventoryItem, [{
+            "id": f"inv{i:05d}", "partNumber": f"PN-{i:05d}", "name": "Bearing 6204", "category": "Bearings",
+            "description": "Deep groove ball bearing", "quantity": rng.randrange(100), "minStock": 10,
+            "maxStock": 100, "unit": "pcs", "unitCost": 4.2, "location": "Store A", "supplier": "SKF",
+            "status": "in-stock", "createdAt": now, "updatedAt": now,
+        } for i in range(n_inv)]),
+        "service_requests": load("service_requests", ServiceRequest, [{
+            "id": f"sr{i:05d}", "requestNumber": f"SR-{i:05d}", "title": "Leaking valve",
+            "description": "Valve leaking at flange", "requestedBy": "Operator", "department": "Production",
+            "location": rng.choice(locations), "priority": rng.choice(PRIORITIES), "status": "open",
+            "category": "mechanical", "createdDate": now - timedelta(days=rng.randrange(90)),
+            "updatedAt": now, "attachments": [],
+        } for i in range(n_sr)]),
+        "documents": load("documents", Document, [{
+            "id": f"doc{i:04d}", "documentNumber": f"DOC-{i:04d}", "name": f"Manual {i}",
+            "description": "Operating manual", "category": "manual", "fileType": "application/pdf",
+            "fileName": f"manual{i}.pdf", "filePath": f"uploads/documents/manual{i}.pdf", "fileSize": 1024,
+            "uploadedBy": "admin", "uploadedDate": now, "tags": ["pump"], "createdAt": now, "updatedAt": now,
+        } for i in range(n_docs)]),
+        "preventive_maintenance": load("preventive_maintenance", PreventiveMaintenance, [{
+            "id": f"pm{i:05d}", "pmNumber": f"PM-{i:05d}", "name": "Quarterly inspection",
+            "assetId": rng.choice(assets), "frequency": "quarterly",
+            "nextDue": (now + timedelta(days=rng.randrange(-5, 60))).date(), "estimatedDuration": 1.5,
+            "assignedTo": "tech01", "priority": "medium", "tasks": ["Inspect"], "partsRequired": [],
+            "active": True, "createdAt": now, "updatedAt": now,
+        } for i in range(n_pm)]),
+    }
+    return ids
+
+
+def load_generated(db, scale: str) -> Dict[str, List[str]]:
+    """Loads a benchmarks.dataset scale instead of the built-in dataset."""
+    from benchmarks import dataset
+
+    db.unwrapped.reset()
+    dataset.write_firestore(db, dataset.SCALES[scale], workers=os.cpu_count() or 2)
+    return generated_ids(scale)
+
+
+def generated_ids(scale: str) -> Dict[str, List[str]]:
+    from benchmarks import dataset
+
+    spec = dataset.SCALES[scale]
+    return {
+        "locations": [dataset.location_id(i) for i in range(spec.locations)],
+        "assets": [dataset.asset_id(i) for i in range(spec.assets)],
+        "work_orders": [dataset.work_order_id(i) for i in range(spec.work_orders)],
+        "inventory": [dataset.inventory_id(i) for i in range(spec.inventory)],
+    }
+
+
+def scenarios(ids: Dict[str, List[str]]) -> Dict[str, Callable[[random.Random], dict]]:
+    def get(path: str) -> dict:
+        return {"method": "GET", "url": path}
+
+    due = (datetime.utcnow() + timedelta(days=7)).isoformat()
+    return {
+        "work_orders.list": lambda rng: get("/api/work-orders?limit=100"),
+        "work_orders.list_filtered": lambda rng: get(f"/api/work-orders?status={rng.choice(STATUSES)}&limit=50"),
+        "work_orders.get": lambda rng: get(f"/api/work-orders/{rng.choice(ids['work_orders'])}"),
+        "work_orders.stats": lambda rng: get("/api/work-orders/stats/summary"),
+        "work_orders.create": lambda rng: {"method": "POST", "url": "/api/work-orders", "json": {
+            "title": "Load test", "priority": "low", "type": "corrective", "dueDate": due,
+        }},
+        "assets.list": lambda rng: get("/api/assets?limit=100"),
+        "assets.get": lambda rng: get(f"/api/assets/{rng.choice(ids['assets'])}"),
+        "locations.list": lambda rng: get("/api/locations?limit=20"),
+        "locations.get": lambda rng: get(f"/api/locations/{rng.choice(ids['locations'])}"),
+        "inventory.list": lambda rng: get("/api/inventory"),
+        "inventory.update": lambda rng: {
+            "method": "PUT", "url": f"/api/inventory/{rng.choice(ids['inventory'])}",
+            "json": {"quantity": rng.randrange(100)},
+        },
+        "service_requests.list": lambda rng: get("/api/service-requests"),
+        "documents.list": lambda rng: get("/api/documents"),
+        "notifications.alerts": lambda rng: get("/api/notifications/alerts"),
+    }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request, requests: int, concurrency: int, seed_value: int) -> dict:
+    latencies: List[float] = []
+    reads: List[int] = []
+    errors = 0
+    remaining = requests
+
+    async def worker(worker_id: int) -> None:
+        nonlocal remaining, errors
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            spec = make_request(rng)
+            started = time.perf_counter()
+            response = await client.request(**spec)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            reads.append(int(response.headers.get("x-firestore-reads", 0)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "reads_per_request": round(statistics.mean(reads), 1) if reads else 0.0,
+    }
+
+
+def compare(name: str, result: dict, baseline: Optional[dict], latency_tolerance: float) -> List[str]:
+    if not baseline:
+        return []
+    problems = []
+    if result["reads_per_request"] > baseline["reads_per_request"] * 1.05 + 0.5:
+        problems.append(f"reads/request {baseline['reads_per_request']} -> {result['reads_per_request']}")
+    if result["p99_ms"] > baseline["p99_ms"] * (1 + latency_tolerance):
+        problems.append(f"p99 {baseline['p99_ms']}ms -> {result['p99_ms']}ms")
+    if result["errors"] > baseline.get("errors", 0):
+        problems.append(f"errors {baseline.get('errors', 0)} -> {result['errors']}")
+    return [f"{name}: {problem}" for problem in problems]
+
+
+def remote_ids(args) -> Dict[str, List[str]]:
+    """Ids the server under --url was seeded with; the dataset is deterministic."""
+    from fake_firestore import FakeFirestore
+
+    return generated_ids(args.dataset) if args.dataset else seed(FakeFirestore(), args.scale, args.seed)
+
+
+async def main_async(args) -> int:
+    # Per-request cost logs would drown the report
+    logging.getLogger("firestore_cost").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.url:
+        ids = remote_ids(args)
+        client = httpx.AsyncClient(base_url=args.url, timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        import server
+
+        db = get_database()
+        ids = load_generated(db, args.dataset) if args.dataset else seed(db, args.scale, args.seed)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://loadtest")
+    selected = scenarios(ids)
+    if args.only:
+        selected = {name: fn for name, fn in selected.items() if any(part in name for part in args.only)}
+
+    baselines = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    label = f"dataset-{args.dataset}" if args.dataset else args.scale
+    key = f"{label}/c{args.concurrency}"
+    if args.url:
+        key += f"/{args.label}"
+    baseline_set = baselines.get(key, {})
+    results = {}
+    problems: List[str] = []
+
+    async with client:
+        header = f"{'scenario':<28}{'rps':>9}{'p50 ms':>10}{'p99 ms':>10}{'reads/req':>11}{'errors':>8}  vs baseline"
+        print(f"scale={label} concurrency={args.concurrency} requests/scenario={args.requests} target={args.url or 'in-process'}")
+        print(header)
+        print("-" * len(header))
+        for name, make_request in selected.items():
+            result = await run_scenario(client, make_request, args.requests, args.concurrency, args.seed)
+            results[name] = result
+            baseline = baseline_set.get(name)
+            regressions = compare(name, result, baseline, args.latency_tolerance)
+            problems.extend(regressions)
+            note = "REGRESSION" if regressions else ("ok" if baseline else "no baseline")
+            print(f"{name:<28}{result['throughput_rps']:>9}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                  f"{result['reads_per_request']:>11}{result['errors']:>8}  {note}")
+
+    if args.update_baseline:
+        baselines[key] = {**baseline_set, **results}
+        BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"Baselines written to {BASELINE_PATH}")
+    for problem in problems:
+        print(f"  {problem}")
+    return 1 if problems and args.check else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dataset", help="load this benchmarks.dataset scale instead of --scale")
+    parser.add_argument("--only", nargs="*", help="run scenarios whose name contains any of these")
+    parser.add_argument("--latency-tolerance", type=float, default=0.5,
+                        help="allowed relative p99 increase before reporting a regression")
+    parser.add_argument("--url", help="drive a running server (e.g. gunicorn + benchmarks.seeded_app) over HTTP")
+    parser.add_argument("--label", default="http", help="baseline key suffix for --url runs, e.g. gunicorn-w4")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on regressions")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
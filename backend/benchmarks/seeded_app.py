@@ -0,0 +1,25 @@
+"""
+server:app with the load-test dataset loaded into the in-memory Firestore
+at import time, for driving a multi-process server over HTTP:
+
+    cd backend
+    LOAD_TEST_SCALE=small WEB_CONCURRENCY=4 gunicorn -c gunicorn.conf.py benchmarks.seeded_app:app
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --label gunicorn-w4
+
+With preload_app the master seeds once and every worker inherits the
+data across fork; writes made by one worker are not seen by the others.
+LOAD_TEST_DATASET=<scale> loads a benchmarks.dataset scale instead.
+"""
+import os
+
+# Imported first: sets FIRESTORE_BACKEND=memory and friends before the app reads them
+from benchmarks.load_test import load_generated, seed
+from database import get_database
+from server import app
+
+if os.environ.get("LOAD_TEST_DATASET"):
+    load_generated(get_database(), os.environ["LOAD_TEST_DATASET"])
+else:
+    seed(get_database(), os.environ.get("LOAD_TEST_SCALE", "small"), int(os.environ.get("LOAD_TEST_SEED", "42")))
+
+__all__ = ["app"]
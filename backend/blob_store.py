@@ -0,0 +1,380 @@
+"""
+Content-addressed store shared by every upload route.
+
+Blobs are keyed by the SHA-256 of their content and sharded two levels deep:
+
+    uploads/blobs/ab/cd/abcd...ef.jpg  ->  /uploads/blobs/ab/cd/abcd...ef.jpg
+
+Uploading bytes that are already stored only bumps the reference count kept
+in the "blobs" collection, so duplicates cost no extra disk. Counts change
+in Firestore transactions, so they hold across worker processes: release()
+moves an unreferenced file aside, deletes the blob document only if no
+upload took a reference in the meantime, and puts the file back otherwise.
+
+Run `python blob_store.py` from the backend directory to fold the legacy
+per-route directories into the store; legacy files are replaced by hard
+links so their existing URLs keep working, and asset, location, document
+and service request records that point at them are moved to the blob URL
+with one reference each. Rerunning it only picks up what is left.
+"""
+import argparse
+import hashlib
+import logging
+import mimetypes
+import os
+import uuid
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from database import get_database
+from uploads import StoredUpload, save_upload, CHUNK_SIZE
+from static_files import is_compressible, precompress
+import jobs
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+BLOBS_DIR = BASE_DIR / "uploads" / "blobs"
+STAGING_DIR = BLOBS_DIR / ".staging"
+BLOBS_URL_PREFIX = "/uploads/blobs"
+BLOBS_COLLECTION = "blobs"
+
+LEGACY_DIRS = [
+    BASE_DIR / "uploaded_assets",
+    BASE_DIR / "uploads" / "assets",
+    BASE_DIR / "uploads" / "locations",
+    BASE_DIR / "uploads" / "service_requests",
+    BASE_DIR / "uploaded_documents",
+]
+
+# Firestore limit: 500 writes per batch; a migrated record takes two
+MIGRATION_BATCH_RECORDS = 250
+
+
+def blob_path(sha256: str, extension: str) -> Path:
+    return BLOBS_DIR / sha256[:2] / sha256[2:4] / f"{sha256}{extension}"
+
+
+def blob_url(path: Path) -> str:
+    return f"{BLOBS_URL_PREFIX}/{path.relative_to(BLOBS_DIR).as_posix()}"
+
+
+def sha256_from_reference(reference: Optional[str]) -> Optional[str]:
+    """
+    Extracts the content hash from a blob URL or file path, or returns None
+    for anything that does not point into the store (e.g. legacy uploads).
+    """
+    if not reference:
+        return None
+    normalized = str(reference).replace("\\", "/")
+    prefixes = (BLOBS_URL_PREFIX + "/", BLOBS_DIR.as_posix() + "/", "uploads/blobs/")
+    if not normalized.startswith(prefixes):
+        return None
+    stem = os.path.splitext(normalized.rsplit("/", 1)[-1])[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    return None
+
+
+def _canonical_extension(content_type: str, fallback: str) -> str:
+    # Derive the extension from the sniffed type so identical bytes uploaded
+    # as "photo.JPG" and "photo.jpeg" land on the same blob.
+    return mimetypes.guess_extension(content_type or "") or fallback or ".bin"
+
+
+def _blob_fields(stored: StoredUpload, relative_path: str) -> dict:
+    from firebase_admin import firestore  # deferred with the client, see database.py
+
+    return {
+        "sha256": stored.sha256,
+        "path": relative_path,
+        "size": stored.size,
+        "contentType": stored.content_type,
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def _take_reference(transaction, blob_ref, fields: dict) -> int:
+    snapshot = blob_ref.get(transaction=transaction)
+    count = max((snapshot.to_dict() or {}).get("refCount", 0), 0) if snapshot.exists else 0
+    transaction.set(blob_ref, {**fields, "refCount": count + 1})
+    return count + 1
+
+
+def _drop_reference(transaction, blob_ref) -> Optional[dict]:
+    # Returns the blob when this was its last reference
+    snapshot = blob_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    from firebase_admin import firestore
+
+    blob = snapshot.to_dict() or {}
+    count = blob.get("refCount", 0) - 1
+    transaction.update(blob_ref, {"refCount": max(count, 0), "updatedAt": firestore.SERVER_TIMESTAMP})
+    return blob if count <= 0 else None
+
+
+def _delete_if_unreferenced(transaction, blob_ref) -> bool:
+    snapshot = blob_ref.get(transaction=transaction)
+    if snapshot.exists and (snapshot.to_dict() or {}).get("refCount", 0) > 0:
+        return False
+    if snapshot.exists:
+        transaction.delete(blob_ref)
+    return True
+
+
+def put(staged: StoredUpload) -> StoredUpload:
+    """
+    Takes one reference on the blob for a staged upload, then moves the
+    upload into the store (or drops it if the content is already there).
+    """
+    from firebase_admin import firestore
+
+    extension = _canonical_extension(staged.content_type, staged.path.suffix)
+    target = blob_path(staged.sha256, extension)
+    relative_path = target.relative_to(BASE_DIR).as_posix()
+
+    db = get_database()
+    blob_ref = db.collection(BLOBS_COLLECTION).document(staged.sha256)
+    try:
+        firestore.transactional(_take_reference)(db.transaction(), blob_ref, _blob_fields(staged, relative_path))
+    except Exception:
+        staged.path.unlink(missing_ok=True)
+        raise
+
+    # The reference is taken first: a release that races with this either
+    # sees it and keeps the file, or has already moved the file aside, in
+    # which case it is stored again here.
+    if target.exists():
+        staged.path.unlink(missing_ok=True)
+        created = False
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged.path, target)
+        created = True
+        if is_compressible(staged.content_type):
+            schedule_precompress(target)
+
+    stored = replace(staged, path=target, filename=target.name, url=blob_url(target), created=created)
+    logger.info("%s blob %s", "Stored" if created else "Deduplicated", target.name)
+    return stored
+
+
+@jobs.handler("precompress", concurrency=1)
+def _precompress_job(payload: dict) -> None:
+    path = Path(payload["path"])
+    if not path.exists():
+        raise jobs.PermanentJobError(f"{path} no longer exists")
+    precompress(path)
+
+
+def schedule_precompress(path: Path) -> None:
+    """
+    Writes the .gz/.br siblings for a new text blob in the background (a
+    durable job), or right away with JOBS_ENABLED off. Until then the blob
+    is served uncompressed.
+    """
+    if jobs.JOBS_ENABLED:
+        jobs.enqueue("precompress", {"path": str(path)}, key=str(path))
+    else:
+        precompress(path)
+
+
+def store_upload(file: UploadFile, **kwargs) -> StoredUpload:
+    """
+    Streams an upload into the store. Accepts the same limits as
+    uploads.save_upload (max_bytes, default_extension, allowed_types).
+    """
+    staged = save_upload(file, STAGING_DIR, uuid.uuid4().hex, **kwargs)
+    return put(staged)
+
+
+async def store_upload_async(file: UploadFile, **kwargs) -> StoredUpload:
+    return await run_in_threadpool(store_upload, file, **kwargs)
+
+
+def release(reference: Optional[str]) -> None:
+    """
+    Drops one reference to the blob behind a URL or path; the file and its
+    derivatives are removed once nothing references it any more. Blobs
+    without a document (e.g. relinked with --skip-refcounts) are left alone.
+    """
+    sha256 = sha256_from_reference(reference)
+    if not sha256:
+        return
+
+    from firebase_admin import firestore
+
+    db = get_database()
+    blob_ref = db.collection(BLOBS_COLLECTION).document(sha256)
+    blob = firestore.transactional(_drop_reference)(db.transaction(), blob_ref)
+    if blob is None or not blob.get("path"):
+        return
+
+    # Move the file aside rather than deleting it, so it can be put back if
+    # an upload of the same content takes a reference before we are done.
+    path = BASE_DIR / blob["path"]
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    aside: Optional[Path] = STAGING_DIR / f"{uuid.uuid4().hex}.released"
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        aside = None
+
+    if not firestore.transactional(_delete_if_unreferenced)(db.transaction(), blob_ref):
+        if aside is not None:
+            if path.exists():
+                aside.unlink(missing_ok=True)
+            else:
+                os.replace(aside, path)
+        logger.info("Blob %s was referenced again, keeping it", sha256)
+        return
+
+    if aside is not None:
+        aside.unlink(missing_ok=True)
+    # Re-check: an upload after the delete may already have stored it again
+    if not path.exists():
+        siblings = [path.with_name(path.name + suffix) for suffix in (".gz", ".br")]
+        for candidate in [*siblings, *path.parent.glob(f"thumbs/{sha256}_*")]:
+            candidate.unlink(missing_ok=True)
+    logger.info("Removed unreferenced blob %s", sha256)
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _legacy_key(reference: Optional[str]) -> Optional[Path]:
+    # Legacy records hold URLs ("/uploads/assets/x.jpg") or paths relative
+    # to the backend directory ("uploaded_documents/x.pdf")
+    if not isinstance(reference, str) or not reference or sha256_from_reference(reference):
+        return None
+    path = Path(reference)
+    if not path.is_absolute() or not path.exists():
+        path = BASE_DIR / reference.replace("\\", "/").lstrip("/")
+    return path.resolve()
+
+
+def _migrate_records(db, linked: Dict[Path, StoredUpload]) -> int:
+    """
+    Points records at the blob URL of their legacy file and takes one
+    reference per record, in the same batch, so a rerun finds nothing to do.
+    Returns the number of references taken.
+    """
+    from firebase_admin import firestore
+
+    updates: List[Tuple[object, dict, List[str]]] = []
+
+    def blob_reference(value, strip_slash: bool = False) -> Optional[Tuple[str, str]]:
+        blob = linked.get(_legacy_key(value))
+        if blob is None:
+            return None
+        return blob.sha256, blob.url.lstrip("/") if strip_slash else blob.url
+
+    for collection, field in (("assets", "imageUrl"), ("locations", "imageUrl"), ("documents", "filePath")):
+        for snapshot in db.collection(collection).stream():
+            found = blob_reference((snapshot.to_dict() or {}).get(field), strip_slash=field == "filePath")
+            if found:
+                updates.append((snapshot.reference, {field: found[1]}, [found[0]]))
+
+    for snapshot in db.collection("service_requests").stream():
+        attachments = (snapshot.to_dict() or {}).get("attachments") or []
+        hashes = []
+        for attachment in attachments:
+            found = blob_reference(attachment.get("fileUrl")) if isinstance(attachment, dict) else None
+            if found:
+                attachment["fileUrl"], attachment["sha256"] = found[1], found[0]
+                hashes.append(found[0])
+        if hashes:
+            updates.append((snapshot.reference, {"attachments": attachments}, hashes))
+
+    blobs = {blob.sha256: blob for blob in linked.values()}
+    references = 0
+    for start in range(0, len(updates), MIGRATION_BATCH_RECORDS):
+        batch = db.batch()
+        counts: Dict[str, int] = {}
+        for record_ref, fields, hashes in updates[start:start + MIGRATION_BATCH_RECORDS]:
+            batch.update(record_ref, fields)
+            for sha256 in hashes:
+                counts[sha256] = counts.get(sha256, 0) + 1
+        for sha256, count in counts.items():
+            blob = blobs[sha256]
+            fields = _blob_fields(blob, blob.path.relative_to(BASE_DIR).as_posix())
+            batch.set(db.collection(BLOBS_COLLECTION).document(sha256),
+                      {**fields, "refCount": firestore.Increment(count)}, merge=True)
+            references += count
+        batch.commit()
+    return references
+
+
+def migrate_legacy(directories: Iterable[Path], update_refcounts: bool = True) -> int:
+    """
+    Folds existing per-route upload directories into the store. Each legacy
+    file becomes a hard link to its blob, so duplicates share one inode and
+    old URLs keep resolving. With update_refcounts, records pointing at
+    legacy files are moved to their blob (see _migrate_records). Returns
+    the number of bytes reclaimed.
+    """
+    from uploads import sniff_content_type, SNIFF_BYTES
+
+    reclaimed = 0
+    linked: Dict[Path, StoredUpload] = {}
+    for directory in directories:
+        if not directory.is_dir():
+            continue
+        for path in sorted(directory.iterdir()):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            sha256 = _hash_file(path)
+            with open(path, "rb") as handle:
+                content_type = sniff_content_type(handle.read(SNIFF_BYTES), mimetypes.guess_type(path.name)[0])
+            target = blob_path(sha256, _canonical_extension(content_type, path.suffix.lower()))
+            stat = path.stat()
+
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.link(path, target)
+            elif not os.path.samefile(path, target):
+                tmp_link = path.with_name(f".{path.name}.link")
+                os.link(target, tmp_link)
+                os.replace(tmp_link, path)
+                reclaimed += stat.st_size
+
+            linked[path.resolve()] = StoredUpload(
+                path=target, filename=target.name, size=stat.st_size,
+                sha256=sha256, content_type=content_type, url=blob_url(target),
+            )
+
+    if update_refcounts and linked:
+        references = _migrate_records(get_database(), linked)
+        logger.info("Moved %d legacy references to the blob store", references)
+    return reclaimed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deduplicate legacy upload directories into the blob store.")
+    parser.add_argument("directories", nargs="*", type=Path, default=LEGACY_DIRS)
+    parser.add_argument(
+        "--skip-refcounts",
+        action="store_true",
+        help="Only relink files on disk; do not move records to the blob store",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    reclaimed = migrate_legacy(args.directories, update_refcounts=not args.skip_refcounts)
+    print(f"Reclaimed {reclaimed / (1024 * 1024):.1f} MB")
+    # Migrated records now point at blob URLs, whose thumbs/ are not rendered yet
+    print("Run `python images.py` to render thumbnails for migrated images")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Per-worker concurrency limits.
+
+- THREADPOOL_SIZE sets how many sync routes a worker runs at once (the
+  AnyIO default thread limiter, 40 out of the box). Applied from the
+  startup hook, since the limiter belongs to the running event loop.
+- FIRESTORE_MAX_CONCURRENCY caps in-flight Firestore RPCs per worker
+  (0 = unlimited). Routes beyond the cap wait for a slot instead of
+  piling more streams onto the gRPC channel. A thread holds at most one
+  slot, so a route that issues a get() while iterating a query cannot
+  deadlock against itself. Async routes (database.get_async_database)
+  take slots from an asyncio semaphore of the same size, held per task.
+
+Both are per process; with gunicorn the totals scale with the worker
+count (see gunicorn.conf.py).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import anyio.to_thread
+
+logger = logging.getLogger(__name__)
+
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", "0"))
+FIRESTORE_MAX_CONCURRENCY = int(os.environ.get("FIRESTORE_MAX_CONCURRENCY", "0"))
+
+
+def configure_threadpool(size: int = THREADPOOL_SIZE) -> None:
+    """Resizes the AnyIO worker pool; must run on the event loop."""
+    if size > 0:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = size
+        logger.info("Threadpool size set to %d", size)
+
+
+_task_holds_slot = contextvars.ContextVar("firestore_slot_held", default=False)
+
+
+class FirestoreSlots:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_use = 0
+        self.waits = 0
+        self._semaphore: Optional[threading.BoundedSemaphore] = (
+            threading.BoundedSemaphore(limit) if limit > 0 else None
+        )
+        self._held = threading.local()
+        self._lock = threading.Lock()
+        # asyncio semaphores are bound to the loop that first uses them
+        self._async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @contextmanager
+    def slot(self):
+        if self._semaphore is None or getattr(self._held, "value", False):
+            yield
+            return
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            self._semaphore.acquire()
+        self._held.value = True
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._held.value = False
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        if self._semaphore is None or _task_holds_slot.get():
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.limit)
+        if semaphore.locked():
+            with self._lock:
+                self.waits += 1
+        async with semaphore:
+            _task_holds_slot.set(True)
+            with self._lock:
+                self.in_use += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_use -= 1
+                # set(), not reset(): an abandoned stream may be closed
+                # from another context by the loop's asyncgen finalizer
+                _task_holds_slot.set(False)
+
+    def reset(self, limit: Optional[int] = None) -> None:
+        """Fresh state, e.g. after fork, where another thread may have held a slot."""
+        self.__init__(self.limit if limit is None else limit)
+
+
+firestore_slots = FirestoreSlots(FIRESTORE_MAX_CONCURRENCY)
@@ -1,23 +1,64 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+import asyncio
+import logging
 import os
+import sys
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime
 
+from fastapi.concurrency import run_in_threadpool
+
+from firestore_instrumentation import instrument, instrument_async
+
+# firebase_admin (and the google.cloud/grpc stack behind it) is imported
+# inside connect_to_firestore: it is the largest import in the app and
+# startup no longer blocks on it (see start_warmup).
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
 class Database:
     db = None
+    # AsyncClient channels belong to one event loop
+    async_db = None
+    async_loop = None
 
 db_instance = Database()
 
+# "firebase" (default) or "memory" for the in-process stand-in in fake_firestore.py
+FIRESTORE_BACKEND = os.environ.get("FIRESTORE_BACKEND", "firebase").lower()
+
+# Collection queried (limit 1) by the warm-up and readiness checks
+WARMUP_COLLECTION = os.environ.get("FIRESTORE_WARMUP_COLLECTION", "work_orders")
+# How long a successful check keeps /readyz green before it pings again
+READY_CHECK_SECONDS = float(os.environ.get("FIRESTORE_READY_CHECK_SECONDS", "30"))
+WARMUP_RETRY_SECONDS = float(os.environ.get("FIRESTORE_WARMUP_RETRY_SECONDS", "5"))
+
+_connect_lock = threading.Lock()
+
 def connect_to_firestore():
     """
     Initializes the Firestore client.
     """
+    with _connect_lock:
+        _connect()
+
+def _connect():
+    if db_instance.db is None and FIRESTORE_BACKEND == "memory":
+        from fake_firestore import FakeFirestore
+        latency_ms = float(os.environ.get("FAKE_FIRESTORE_LATENCY_MS", "0"))
+        db_instance.db = instrument(FakeFirestore(latency_ms=latency_ms))
+        print("Using in-memory Firestore stand-in")
+        return
+
     if db_instance.db is None:
+        import firebase_admin
+        from firebase_admin import credentials
+        from firebase_admin import firestore
+
         try:
             # Get the path to the service account key from .env
             cred_path = os.environ.get('FIREBASE_CREDENTIALS_PATH', 'serviceAccountKey.json')
@@ -27,7 +68,8 @@ def connect_to_firestore():
                 cred = credentials.Certificate(cred_path)
                 firebase_admin.initialize_app(cred)
             
-            db_instance.db = firestore.client()
+            # Wrapped so reads/writes can be counted (see firestore_instrumentation)
+            db_instance.db = instrument(firestore.client())
             print("Connected to Firebase Firestore!")
             
         except Exception as e:
@@ -42,6 +84,130 @@ def get_database():
         connect_to_firestore()
     return db_instance.db
 
+async def get_async_database():
+    """
+    Returns the google.cloud.firestore.AsyncClient for `async def` routes,
+    built from the same firebase app (or in-memory store) as the sync
+    client. The first call waits for the sync connection in a thread, so
+    a cold start does not block the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if db_instance.async_db is not None and db_instance.async_loop is loop:
+        return db_instance.async_db
+
+    sync_db = db_instance.db or await run_in_threadpool(get_database)
+    from fake_firestore import AsyncFakeFirestore, FakeFirestore
+
+    if isinstance(sync_db.unwrapped, FakeFirestore):
+        client = AsyncFakeFirestore(sync_db.unwrapped)
+    else:
+        import firebase_admin
+        from google.cloud import firestore
+
+        app = firebase_admin.get_app()
+        client = firestore.AsyncClient(
+            project=sync_db.unwrapped.project, credentials=app.credential.get_credential(),
+        )
+    db_instance.async_db = instrument_async(client)
+    db_instance.async_loop = loop
+    return db_instance.async_db
+
+def set_database(client):
+    """
+    Replaces the Firestore client, e.g. with fake_firestore.FakeFirestore in
+    benchmarks. Returns the previous client.
+    """
+    previous = db_instance.db
+    db_instance.db = instrument(client)
+    db_instance.async_db = db_instance.async_loop = None
+    return previous
+
+class Readiness:
+    """
+    Whether Firestore has answered recently. The warm-up thread sets it once
+    the first RPC succeeds; /readyz re-checks once it is older than
+    READY_CHECK_SECONDS so a worker that loses Firestore drops out of
+    rotation.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = 0.0
+        self.ok = False
+        self.error = None
+        self.warming = False
+
+    def fresh(self) -> bool:
+        return self.ok and time.monotonic() - self.checked_at < READY_CHECK_SECONDS
+
+    def snapshot(self) -> dict:
+        age = time.monotonic() - self.checked_at if self.checked_at else None
+        return {
+            "ready": self.ok,
+            "warming": self.warming,
+            "lastCheckSeconds": round(age, 3) if age is not None else None,
+            "error": self.error,
+        }
+
+readiness = Readiness()
+
+def ping_firestore() -> bool:
+    """
+    One cheap RPC (a limit-1 query) so the client opens its channel and
+    fetches credentials. Records the outcome on `readiness`. Runs at most
+    one ping at a time; concurrent callers get the last known state.
+    """
+    if not readiness.lock.acquire(blocking=False):
+        return readiness.ok
+    try:
+        list(get_database().collection(WARMUP_COLLECTION).limit(1).stream())
+    except Exception as e:
+        readiness.ok, readiness.error = False, f"{type(e).__name__}: {e}"
+        logger.warning("Firestore check failed: %s", readiness.error)
+    else:
+        readiness.ok, readiness.error = True, None
+    finally:
+        readiness.checked_at = time.monotonic()
+        readiness.lock.release()
+    return readiness.ok
+
+def _warm_up():
+    started = time.perf_counter()
+    while not ping_firestore():
+        time.sleep(WARMUP_RETRY_SECONDS)
+    readiness.warming = False
+    logger.info("Firestore warm-up finished in %.2fs", time.perf_counter() - started)
+
+def start_warmup() -> threading.Thread:
+    """
+    Imports firebase_admin, creates the client and issues the first RPC on a
+    daemon thread, so the server starts accepting (liveness) traffic at once.
+    Retries every WARMUP_RETRY_SECONDS until Firestore answers.
+    """
+    readiness.warming = True
+    thread = threading.Thread(target=_warm_up, name="firestore-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def reset_after_fork():
+    """
+    Called in each gunicorn worker after fork (see gunicorn.conf.py). gRPC
+    channels must not be shared with the parent, so any client created
+    before the fork is dropped and the worker builds its own on warm-up.
+    The in-memory stand-in has no channel and is kept, so data seeded in a
+    preloaded master is visible to every worker.
+    """
+    global _connect_lock
+    _connect_lock = threading.Lock()
+    readiness.__init__()
+    db_instance.async_db = db_instance.async_loop = None
+    if FIRESTORE_BACKEND != "memory":
+        db_instance.db = None
+        firebase_admin = sys.modules.get("firebase_admin")
+        if firebase_admin is not None:
+            # firestore.client() caches the client on the app; drop both
+            # without closing them, since the channel belongs to the parent.
+            firebase_admin._apps.clear()
+
 def close_firestore_connection():
     """
     Placeholder for closing connection. 
@@ -0,0 +1,809 @@
+"""
+In-memory stand-in for the google-cloud-firestore client.
+
+Implements the subset of the API the routers use — collection/document
+references, where/order_by/limit/offset/select queries, stream/get,
+get_all, batches, transactions (including @firestore.transactional),
+field transforms (SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion,
+ArrayRemove) and on_snapshot listeners — with the same value semantics as
+the real client: naive datetimes are stored as UTC, reads return
+timezone-aware DatetimeWithNanoseconds, and every read returns a copy.
+
+Select it with FIRESTORE_BACKEND=memory, or inject an instance with
+database.set_database(). AsyncFakeFirestore exposes the same store through
+the google.cloud.firestore.AsyncClient API for the async routers.
+
+It is meant for benchmarks and local runs without credentials, not as a
+full emulator: composite index rules, cursors other than start_after (a
+snapshot or a dict of order_by values), and aggregation queries are not
+modelled.
+"""
+import asyncio
+import random
+import string
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1 import transforms
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+def _auto_id() -> str:
+    return "".join(random.choices(_ID_CHARS, k=20))
+
+
+def _now() -> DatetimeWithNanoseconds:
+    now = datetime.now(timezone.utc)
+    return DatetimeWithNanoseconds(
+        now.year, now.month, now.day, now.hour, now.minute, now.second, now.microsecond, tzinfo=timezone.utc
+    )
+
+
+def _to_stored(value: Any) -> Any:
+    """Normalizes a value the way a round trip through Firestore would."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        else:
+            value = value.astimezone(timezone.utc)
+        return DatetimeWithNanoseconds(
+            value.year, value.month, value.day, value.hour, value.minute,
+            value.second, value.microsecond, tzinfo=timezone.utc,
+        )
+    if isinstance(value, date):
+        # The real client rejects plain dates as well
+        raise TypeError(f"Cannot convert to a Firestore Value: {value!r}")
+    if isinstance(value, dict):
+        return {key: _to_stored(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_stored(item) for item in value]
+    return value
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+_MISSING = object()
+
+
+def _get_path(data: Dict[str, Any], field_path: str) -> Any:
+    value: Any = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_path(data: Dict[str, Any], field_path: str, value: Any) -> None:
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    if value is transforms.DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = value
+
+
+def _apply(current: Any, value: Any, now: datetime) -> Any:
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, transforms.ArrayUnion):
+        base = list(current) if isinstance(current, list) else []
+        return base + [_to_stored(item) for item in value.values if item not in base]
+    if isinstance(value, transforms.ArrayRemove):
+        base = list(current) if isinstance(current, list) else []
+        return [item for item in base if item not in value.values]
+    if value is transforms.DELETE_FIELD:
+        return value
+    if isinstance(value, dict):
+        return _merge_into({}, value, now)
+    return _to_stored(value)
+
+
+def _merge_into(target: Dict[str, Any], data: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    # set(..., merge=True) semantics: nested maps are merged, not replaced
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_into(target[key], value, now)
+            continue
+        result = _apply(target.get(key, _MISSING), value, now)
+        if result is transforms.DELETE_FIELD:
+            target.pop(key, None)
+        else:
+            target[key] = result
+    return target
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    if left is _MISSING:
+        # Documents without the field never match, not even !=
+        return False
+    try:
+        if op == "==":
+            return left == right
+        if op == "!=":
+            return left != right and left is not None
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        if op == ">":
+            return left > right
+        if op == ">=":
+            return left >= right
+        if op == "in":
+            return left in right
+        if op == "not-in":
+            return left not in right and left is not None
+        if op == "array-contains":
+            return isinstance(left, list) and right in left
+        if op == "array-contains-any":
+            return isinstance(left, list) and any(item in left for item in right)
+    except TypeError:
+        # Firestore only compares values of the same type
+        return False
+    raise ValueError(f"Unsupported operator {op!r}")
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # Firestore orders mixed types by type first: null < bool < number < timestamp < string
+    if value is None or value is _MISSING:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, repr(value))
+
+
+class _Store:
+    def __init__(self) -> None:
+        # collection path -> document id -> (data, create_time, update_time)
+        self.collections: Dict[str, Dict[str, Tuple[dict, datetime, datetime]]] = {}
+        self.lock = threading.RLock()
+        self.listeners: Dict[str, List[Callable]] = {}
+
+
+class DocumentSnapshot:
+    __slots__ = ("reference", "_data", "exists", "create_time", "update_time", "read_time")
+
+    def __init__(self, reference, data: Optional[dict], create_time=None, update_time=None) -> None:
+        self.reference = reference
+        self._data = data
+        self.exists = data is not None
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = None
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    def to_dict(self) -> Optional[dict]:
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        value = _get_path(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _copy(value)
+
+
+class DocumentReference:
+    def __init__(self, client: "FakeFirestore", collection_path: str, document_id: str) -> None:
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self) -> "CollectionReference":
+        return CollectionReference(self._client, self._collection_path)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __repr__(self) -> str:
+        return f"<FakeDocumentReference {self.path}>"
+
+    def collection(self, collection_id: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None, **kwargs) -> DocumentSnapshot:
+        self._client._latency()
+        return self._client._read(self, field_paths)
+
+    def create(self, document_data: dict, **kwargs):
+        return self._client._write(self, "create", document_data)
+
+    def set(self, document_data: dict, merge: bool = False, **kwargs):
+        return self._client._write(self, "merge" if merge else "set", document_data)
+
+    def update(self, field_updates: dict, **kwargs):
+        return self._client._write(self, "update", field_updates)
+
+    def delete(self, **kwargs):
+        return self._client._write(self, "delete", None)
+
+    def on_snapshot(self, callback: Callable) -> "Watch":
+        def filtered(docs, changes, read_time):
+            changes = [change for change in changes if change.document.reference == self]
+            if changes:
+                callback([change.document for change in changes], changes, read_time)
+        return self._client._listen(self._collection_path, filtered, initial=[self.get()])
+
+
+class Query:
+    def __init__(self, client: "FakeFirestore", collection_path: str, filters=(), orders=(),
+                 limit: Optional[int] = None, offset: int = 0, projection=None, start_after=None) -> None:
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._projection = projection
+        self._start_after = start_after
+
+    def _copy(self, **changes) -> "Query":
+        params = dict(
+            filters=self._filters, orders=self._orders, limit=self._limit, offset=self._offset,
+            projection=self._projection, start_after=self._start_after,
+        )
+        params.update(changes)
+        return Query(self._client, self._collection_path, **params)
+
+    def where(self, field_path: str = None, op_string: str = None, value: Any = None, *, filter=None) -> "Query":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, _to_stored(value)),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip: int) -> "Query":
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths: Iterable[str]) -> "Query":
+        return self._copy(projection=tuple(field_paths))
+
+    def start_after(self, document_fields_or_snapshot) -> "Query":
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def _after_fields(self, row, cursor: dict) -> bool:
+        # start_after({"field": value, ...}) over the order_by fields
+        for field, direction in self._orders:
+            if field not in cursor:
+                break
+            value = _sort_key(row[0] if field == "__name__" else _get_path(row[1], field))
+            bound = _sort_key(cursor[field])
+            if value != bound:
+                return value < bound if direction == DESCENDING else value > bound
+        return False
+
+    def _matching(self) -> List[Tuple[str, dict, datetime, datetime]]:
+        store = self._client._store
+        with store.lock:
+            documents = list(store.collections.get(self._collection_path, {}).items())
+        rows = [
+            (doc_id, data, created, updated)
+            for doc_id, (data, created, updated) in documents
+            if all(_compare(op, _get_path(data, field), value) for field, op, value in self._filters)
+        ]
+        # Stable sorts applied last-key-first give a multi-key ordering;
+        # documents are ordered by id when no order is given, as in Firestore.
+        rows.sort(key=lambda row: row[0])
+        for field, direction in reversed(self._orders):
+            if field != "__name__":
+                # Like Firestore, order_by excludes documents missing the field
+                rows = [row for row in rows if _get_path(row[1], field) is not _MISSING]
+            rows.sort(
+                key=lambda row: row[0] if field == "__name__" else _sort_key(_get_path(row[1], field)),
+                reverse=(direction == DESCENDING),
+            )
+        if isinstance(self._start_after, dict):
+            rows = [row for row in rows if self._after_fields(row, self._start_after)]
+        elif self._start_after is not None:
+            cursor_id = getattr(self._start_after, "id", None)
+            ids = [row[0] for row in rows]
+            if cursor_id in ids:
+                rows = rows[ids.index(cursor_id) + 1:]
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def stream(self, transaction=None, **kwargs) -> Iterator[DocumentSnapshot]:
+        self._client._latency()
+        for doc_id, data, created, updated in self._matching():
+            if self._projection is not None:
+                data = {field: data[field] for field in self._projection if field in data}
+            yield DocumentSnapshot(
+                DocumentReference(self._client, self._collection_path, doc_id), data, created, updated
+            )
+
+    def get(self, transaction=None, **kwargs) -> List[DocumentSnapshot]:
+        return list(self.stream(transaction=transaction))
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "FakeFirestore", path: str) -> None:
+        super().__init__(client, path)
+
+    @property
+    def id(self) -> str:
+        return self._collection_path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> Optional[DocumentReference]:
+        if "/" not in self._collection_path:
+            return None
+        parent_path, _ = self._collection_path.rsplit("/", 1)
+        collection_path, document_id = parent_path.rsplit("/", 1)
+        return DocumentReference(self._client, collection_path, document_id)
+
+    def document(self, document_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._client, self._collection_path, document_id or _auto_id())
+
+    def add(self, document_data: dict, document_id: Optional[str] = None):
+        reference = self.document(document_id)
+        result = reference.create(document_data)
+        return result.update_time, reference
+
+    def list_documents(self, page_size: Optional[int] = None) -> Iterator[DocumentReference]:
+        store = self._client._store
+        with store.lock:
+            ids = list(store.collections.get(self._collection_path, {}))
+        for doc_id in ids:
+            yield DocumentReference(self._client, self._collection_path, doc_id)
+
+    def on_snapshot(self, callback: Callable) -> "Watch":
+        return self._client._listen(self._collection_path, callback, initial=self.get())
+
+
+class WriteBatch:
+    def __init__(self, client: "FakeFirestore") -> None:
+        self._client = client
+        self._writes: List[Tuple[DocumentReference, str, Optional[dict]]] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def create(self, reference, document_data: dict) -> None:
+        self._writes.append((reference, "create", document_data))
+
+    def set(self, reference, document_data: dict, merge: bool = False) -> None:
+        self._writes.append((reference, "merge" if merge else "set", document_data))
+
+    def update(self, reference, field_updates: dict, option=None) -> None:
+        self._writes.append((reference, "update", field_updates))
+
+    def delete(self, reference, option=None) -> None:
+        self._writes.append((reference, "delete", None))
+
+    def commit(self, **kwargs) -> list:
+        writes, self._writes = self._writes, []
+        with self._client._store.lock:
+            # Validate first so a failing write leaves the batch unapplied
+            for reference, op, _ in writes:
+                self._client._check(_unwrap(reference), op)
+            return [self._client._write(_unwrap(reference), op, data, latency=False)
+                    for reference, op, data in writes]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+
+
+class Transaction(WriteBatch):
+    """
+    Serializes transactions with the store lock: reads inside a
+    transaction see a consistent state and commits cannot interleave.
+    """
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client: "FakeFirestore") -> None:
+        super().__init__(client)
+        self._id = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._writes = []
+
+    def _begin(self, retry_id=None) -> None:
+        self._client._store.lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self) -> list:
+        try:
+            return self.commit()
+        finally:
+            self._end()
+
+    def _rollback(self) -> None:
+        self._writes = []
+        self._end()
+
+    def _end(self) -> None:
+        if self._id is not None:
+            self._id = None
+            self._client._store.lock.release()
+
+    def get(self, ref_or_query, **kwargs):
+        target = _unwrap(ref_or_query)
+        if isinstance(target, DocumentReference):
+            return iter([target.get()])
+        return target.stream()
+
+    def get_all(self, references, **kwargs):
+        return self._client.get_all(references)
+
+
+class Watch:
+    def __init__(self, store: _Store, collection_path: str, callback: Callable) -> None:
+        self._store = store
+        self._collection_path = collection_path
+        self._callback = callback
+
+    def unsubscribe(self) -> None:
+        with self._store.lock:
+            listeners = self._store.listeners.get(self._collection_path, [])
+            if self._callback in listeners:
+                listeners.remove(self._callback)
+
+
+def _unwrap(reference):
+    # Accept instrumented wrappers (see firestore_instrumentation)
+    return getattr(reference, "_target", reference)
+
+
+class FakeFirestore:
+    """
+    Drop-in for google.cloud.firestore.Client backed by process memory.
+    latency_ms adds a fixed delay per RPC to approximate network round trips.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, project: str = "fake-project") -> None:
+        self.project = project
+        self.latency_ms = latency_ms
+        self._store = _Store()
+
+    def _latency(self) -> None:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    # -- references --------------------------------------------------------
+
+    def collection(self, *path: str) -> CollectionReference:
+        return CollectionReference(self, "/".join(path))
+
+    def document(self, *path: str) -> DocumentReference:
+        collection_path, document_id = "/".join(path).rsplit("/", 1)
+        return DocumentReference(self, collection_path, document_id)
+
+    def collections(self) -> List[CollectionReference]:
+        with self._store.lock:
+            paths = [path for path, docs in self._store.collections.items() if docs and "/" not in path]
+        return [CollectionReference(self, path) for path in paths]
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs) -> Iterator[DocumentSnapshot]:
+        self._latency()
+        # One round trip for the whole batch of references
+        for reference in references:
+            yield self._read(_unwrap(reference), field_paths)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs) -> Transaction:
+        return Transaction(self)
+
+    def close(self) -> None:
+        pass
+
+    # -- storage -----------------------------------------------------------
+
+    def _read(self, reference: DocumentReference, field_paths=None) -> DocumentSnapshot:
+        with self._store.lock:
+            entry = self._store.collections.get(reference._collection_path, {}).get(reference.id)
+        if entry is None:
+            return DocumentSnapshot(reference, None)
+        data, created, updated = entry
+        if field_paths:
+            data = {field: data[field] for field in field_paths if field in data}
+        return DocumentSnapshot(reference, data, created, updated)
+
+    def _check(self, reference: DocumentReference, op: str) -> None:
+        exists = reference.id in self._store.collections.get(reference._collection_path, {})
+        if op == "create" and exists:
+            raise AlreadyExists(f"Document already exists: {reference.path}")
+        if op == "update" and not exists:
+            raise NotFound(f"No document to update: {reference.path}")
+
+    def _write(self, reference: DocumentReference, op: str, data: Optional[dict], latency: bool = True):
+        reference = _unwrap(reference)
+        if latency:
+            self._latency()
+        now = _now()
+        store = self._store
+        with store.lock:
+            self._check(reference, op)
+            documents = store.collections.setdefault(reference._collection_path, {})
+            previous = documents.get(reference.id)
+            if op == "delete":
+                documents.pop(reference.id, None)
+                change = "REMOVED" if previous else None
+            else:
+                if op in ("merge", "update") and previous is not None:
+                    stored = _copy(previous[0])
+                else:
+                    stored = {}
+                if op == "update":
+                    # Keys are field paths; "a.b" updates a nested field
+                    for key, value in data.items():
+                        _set_path(stored, key, _apply(_get_path(stored, key), value, now))
+                else:
+                    _merge_into(stored, data, now)
+                created = previous[1] if previous is not None else now
+                documents[reference.id] = (stored, created, now)
+                change = "MODIFIED" if previous is not None else "ADDED"
+            listeners = list(store.listeners.get(reference._collection_path, ()))
+        if change and listeners:
+            snapshot = self._read(reference) if change != "REMOVED" else DocumentSnapshot(
+                reference, previous[0], previous[1], previous[2]
+            )
+            event = SimpleNamespace(type=SimpleNamespace(name=change), document=snapshot)
+            for callback in listeners:
+                callback([snapshot], [event], now)
+        return SimpleNamespace(update_time=now)
+
+    def _listen(self, collection_path: str, callback: Callable, initial: List[DocumentSnapshot]) -> Watch:
+        with self._store.lock:
+            self._store.listeners.setdefault(collection_path, []).append(callback)
+        existing = [snapshot for snapshot in initial if snapshot.exists]
+        added = [SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=snapshot) for snapshot in existing]
+        callback(existing, added, _now())
+        return Watch(self._store, collection_path, callback)
+
+    # -- helpers for seeding and inspection ---------------------------------
+
+    def load(self, collection_path: str, documents: Iterable[dict], id_field: str = "id") -> int:
+        """
+        Bulk-inserts documents without per-write overhead. Uses
+        document[id_field] as the id when present.
+        """
+        now = _now()
+        count = 0
+        with self._store.lock:
+            target = self._store.collections.setdefault(collection_path, {})
+            for document in documents:
+                document_id = document.get(id_field) or _auto_id()
+                target[document_id] = (_to_stored(document), now, now)
+                count += 1
+        return count
+
+    def count(self, collection_path: str) -> int:
+        with self._store.lock:
+            return len(self._store.collections.get(collection_path, {}))
+
+    def reset(self) -> None:
+        with self._store.lock:
+            self._store.collections.clear()
+
+
+# -- AsyncClient API -------------------------------------------------------
+
+def _sync_reference(reference):
+    # Instrumented wrapper -> async reference -> sync reference
+    reference = _unwrap(reference)
+    return getattr(reference, "_sync", reference)
+
+
+class AsyncDocumentReference:
+    def __init__(self, client: "AsyncFakeFirestore", sync: DocumentReference) -> None:
+        self._client = client
+        self._sync = sync
+
+    @property
+    def id(self) -> str:
+        return self._sync.id
+
+    @property
+    def path(self) -> str:
+        return self._sync.path
+
+    @property
+    def parent(self) -> "AsyncCollectionReference":
+        return AsyncCollectionReference(self._client, self._sync.parent)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, AsyncDocumentReference) and self._sync == other._sync
+
+    def __hash__(self) -> int:
+        return hash(self._sync)
+
+    def collection(self, collection_id: str) -> "AsyncCollectionReference":
+        return AsyncCollectionReference(self._client, self._sync.collection(collection_id))
+
+    async def get(self, field_paths=None, transaction=None, **kwargs) -> DocumentSnapshot:
+        await self._client._latency()
+        return self._sync.get(field_paths)
+
+    async def create(self, document_data: dict, **kwargs):
+        await self._client._latency()
+        return self._sync.create(document_data)
+
+    async def set(self, document_data: dict, merge: bool = False, **kwargs):
+        await self._client._latency()
+        return self._sync.set(document_data, merge=merge)
+
+    async def update(self, field_updates: dict, **kwargs):
+        await self._client._latency()
+        return self._sync.update(field_updates)
+
+    async def delete(self, **kwargs):
+        await self._client._latency()
+        return self._sync.delete()
+
+
+class AsyncQuery:
+    def __init__(self, client: "AsyncFakeFirestore", sync: Query) -> None:
+        self._client = client
+        self._sync = sync
+
+    def _wrap(self, sync: Query) -> "AsyncQuery":
+        return AsyncQuery(self._client, sync)
+
+    def where(self, *args, **kwargs) -> "AsyncQuery":
+        return self._wrap(self._sync.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs) -> "AsyncQuery":
+        return self._wrap(self._sync.order_by(*args, **kwargs))
+
+    def limit(self, count: int) -> "AsyncQuery":
+        return self._wrap(self._sync.limit(count))
+
+    def offset(self, num_to_skip: int) -> "AsyncQuery":
+        return self._wrap(self._sync.offset(num_to_skip))
+
+    def select(self, field_paths: Iterable[str]) -> "AsyncQuery":
+        return self._wrap(self._sync.select(field_paths))
+
+    def start_after(self, document_fields_or_snapshot) -> "AsyncQuery":
+        return self._wrap(self._sync.start_after(document_fields_or_snapshot))
+
+    async def stream(self, transaction=None, **kwargs):
+        await self._client._latency()
+        for snapshot in self._sync.stream():
+            yield snapshot
+
+    async def get(self, transaction=None, **kwargs) -> List[DocumentSnapshot]:
+        return [snapshot async for snapshot in self.stream()]
+
+
+class AsyncCollectionReference(AsyncQuery):
+    @property
+    def id(self) -> str:
+        return self._sync.id
+
+    @property
+    def parent(self) -> Optional[AsyncDocumentReference]:
+        parent = self._sync.parent
+        return AsyncDocumentReference(self._client, parent) if parent is not None else None
+
+    def document(self, document_id: Optional[str] = None) -> AsyncDocumentReference:
+        return AsyncDocumentReference(self._client, self._sync.document(document_id))
+
+    async def add(self, document_data: dict, document_id: Optional[str] = None):
+        await self._client._latency()
+        update_time, reference = self._sync.add(document_data, document_id)
+        return update_time, AsyncDocumentReference(self._client, reference)
+
+    async def list_documents(self, page_size: Optional[int] = None):
+        await self._client._latency()
+        for reference in self._sync.list_documents(page_size):
+            yield AsyncDocumentReference(self._client, reference)
+
+
+class AsyncWriteBatch:
+    def __init__(self, client: "AsyncFakeFirestore") -> None:
+        self._client = client
+        self._sync = WriteBatch(client._shadow)
+
+    def __len__(self) -> int:
+        return len(self._sync)
+
+    def create(self, reference, document_data: dict) -> None:
+        self._sync.create(_sync_reference(reference), document_data)
+
+    def set(self, reference, document_data: dict, merge: bool = False) -> None:
+        self._sync.set(_sync_reference(reference), document_data, merge=merge)
+
+    def update(self, reference, field_updates: dict, option=None) -> None:
+        self._sync.update(_sync_reference(reference), field_updates)
+
+    def delete(self, reference, option=None) -> None:
+        self._sync.delete(_sync_reference(reference))
+
+    async def commit(self, **kwargs) -> list:
+        await self._client._latency()
+        return self._sync.commit()
+
+
+class AsyncFakeFirestore:
+    """
+    Drop-in for google.cloud.firestore.AsyncClient over a FakeFirestore's
+    store, so data seeded through the sync client is visible to async
+    routes. RPC latency is an asyncio.sleep instead of a blocking one.
+    """
+
+    def __init__(self, source: FakeFirestore) -> None:
+        self.project = source.project
+        self._source = source
+        # Same store, no blocking latency; the async wrappers add their own
+        self._shadow = FakeFirestore(project=source.project)
+        self._shadow._store = source._store
+
+    async def _latency(self) -> None:
+        if self._source.latency_ms:
+            await asyncio.sleep(self._source.latency_ms / 1000.0)
+
+    def collection(self, *path: str) -> AsyncCollectionReference:
+        return AsyncCollectionReference(self, self._shadow.collection(*path))
+
+    def document(self, *path: str) -> AsyncDocumentReference:
+        return AsyncDocumentReference(self, self._shadow.document(*path))
+
+    async def collections(self):
+        for reference in self._shadow.collections():
+            yield AsyncCollectionReference(self, reference)
+
+    async def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        await self._latency()
+        for reference in references:
+            yield self._shadow._read(_sync_reference(reference), field_paths)
+
+    def batch(self) -> AsyncWriteBatch:
+        return AsyncWriteBatch(self)
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,115 @@
+"""
+Firestore <-> API value conversion, compiled once per Pydantic model.
+
+Firestore has no date type and returns timezone-aware Timestamps
+(DatetimeWithNanoseconds), while the API models use plain dates for
+calendar fields and the routers compare against naive UTC datetimes.
+Each model's codec works out up front which fields are dates and which
+are datetimes, so converting a document is a single pass over just
+those fields instead of an isinstance chain per row.
+"""
+import typing
+from datetime import date, datetime, time, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+
+def to_datetime(value: Any) -> Optional[datetime]:
+    """
+    Normalizes Firestore/API temporal values to a naive UTC datetime.
+    Returns None for None and for values that cannot be interpreted.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        if type(value) is not datetime:
+            # Drop DatetimeWithNanoseconds and other subclasses
+            value = datetime(
+                value.year, value.month, value.day, value.hour,
+                value.minute, value.second, value.microsecond,
+            )
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.min)
+    if hasattr(value, "to_datetime"):  # protobuf Timestamp
+        return to_datetime(value.to_datetime())
+    if isinstance(value, str):
+        try:
+            return to_datetime(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        except ValueError:
+            return None
+    return None
+
+
+def to_date(value: Any) -> Optional[date]:
+    if type(value) is date:
+        return value
+    converted = to_datetime(value)
+    return converted.date() if converted is not None else None
+
+
+def _temporal_kind(annotation: Any) -> Optional[type]:
+    # Unwrap Optional[...] / Union[..., None]
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+    if annotation is datetime:
+        return datetime
+    if annotation is date:
+        return date
+    return None
+
+
+class ModelCodec:
+    def __init__(self, model: Type[BaseModel]) -> None:
+        date_fields = []
+        datetime_fields = []
+        for name, field in model.model_fields.items():
+            kind = _temporal_kind(field.annotation)
+            if kind is date:
+                date_fields.append(name)
+            elif kind is datetime:
+                datetime_fields.append(name)
+        self.model = model
+        self.date_fields: Tuple[str, ...] = tuple(date_fields)
+        self.datetime_fields: Tuple[str, ...] = tuple(datetime_fields)
+
+    def encode(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        API -> Firestore: plain dates become midnight datetimes, since
+        Firestore can only store timestamps. Mutates and returns data.
+        """
+        for field in self.date_fields:
+            value = data.get(field)
+            if value is not None and not isinstance(value, datetime):
+                data[field] = to_datetime(value)
+        return data
+
+    def decode(self, data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Firestore -> API: Timestamps/strings become datetimes and date fields
+        become dates. Mutates and returns data.
+        """
+        if not data:
+            return data
+        for field in self.datetime_fields:
+            value = data.get(field)
+            if value is not None and not isinstance(value, datetime):
+                data[field] = to_datetime(value)
+        for field in self.date_fields:
+            value = data.get(field)
+            if isinstance(value, datetime):
+                # Stored as UTC midnight, so the UTC calendar date is the value
+                data[field] = value.date()
+            elif value is not None and type(value) is not date:
+                data[field] = to_date(value)
+        return data
+
+
+@lru_cache(maxsize=None)
+def codec_for(model: Type[BaseModel]) -> ModelCodec:
+    return ModelCodec(model)
@@ -0,0 +1,156 @@
+"""
+Per-request Firestore cost accounting.
+
+FirestoreCostMiddleware binds a RequestCost to a context variable for the
+duration of each request; the firestore_instrumentation observer charges
+every document read, write and delete and every RPC to it. Sync routes run
+in the AnyIO threadpool with a copy of the request context, so the same
+RequestCost object is updated from worker threads.
+
+The totals are returned as X-Firestore-Reads / -Writes / -Deletes / -RPCs
+headers (when FIRESTORE_COST_HEADERS is on) and logged with structured
+fields. List endpoints report how many rows they returned (see
+responses.list_response); a request whose documents read per row returned
+exceeds FIRESTORE_AMPLIFICATION_THRESHOLD is logged as a warning and
+marked with X-Firestore-Read-Amplification.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from firestore_instrumentation import add_observer
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_COST_HEADERS = os.environ.get("FIRESTORE_COST_HEADERS", "1").lower() in ("1", "true", "yes")
+FIRESTORE_AMPLIFICATION_THRESHOLD = float(os.environ.get("FIRESTORE_AMPLIFICATION_THRESHOLD", "10"))
+# Ignore amplification on requests that read only a handful of documents
+FIRESTORE_AMPLIFICATION_MIN_READS = int(os.environ.get("FIRESTORE_AMPLIFICATION_MIN_READS", "50"))
+
+COST_HEADERS = ["X-Firestore-Reads", "X-Firestore-Writes", "X-Firestore-Deletes",
+                "X-Firestore-RPCs", "X-Firestore-Read-Amplification"]
+
+
+class RequestCost:
+    __slots__ = ("reads", "writes", "deletes", "rpcs", "rpc_seconds", "rows", "_lock")
+
+    def __init__(self) -> None:
+        self.reads = 0
+        self.writes = 0
+        self.deletes = 0
+        self.rpcs = 0
+        self.rpc_seconds = 0.0
+        self.rows: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def charge(self, op: str, docs: int, seconds: float) -> None:
+        with self._lock:
+            self.rpcs += 1
+            self.rpc_seconds += seconds
+            if op in ("get", "query"):
+                self.reads += docs
+            elif op == "delete":
+                self.deletes += docs
+            else:
+                self.writes += docs
+
+    @property
+    def amplification(self) -> float:
+        # Endpoints that return a single object (stats, details) count as one row
+        return self.reads / max(self.rows or 1, 1)
+
+    def is_amplified(self) -> bool:
+        return (
+            self.reads >= FIRESTORE_AMPLIFICATION_MIN_READS
+            and self.amplification > FIRESTORE_AMPLIFICATION_THRESHOLD
+        )
+
+
+_current: contextvars.ContextVar[Optional[RequestCost]] = contextvars.ContextVar(
+    "firestore_request_cost", default=None
+)
+
+
+def current_cost() -> Optional[RequestCost]:
+    return _current.get()
+
+
+def record_rows(count: int) -> None:
+    """Records how many rows the current request returns."""
+    cost = _current.get()
+    if cost is not None:
+        cost.rows = count
+
+
+def _observe(collection: str, op: str, docs: int, seconds: float) -> None:
+    cost = _current.get()
+    if cost is not None:
+        cost.charge(op, docs, seconds)
+
+
+add_observer(_observe)
+
+
+class FirestoreCostMiddleware:
+    def __init__(self, app: ASGIApp, emit_headers: bool = FIRESTORE_COST_HEADERS) -> None:
+        self.app = app
+        self.emit_headers = emit_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cost = RequestCost()
+        token = _current.set(cost)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.emit_headers and cost.rpcs:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-Firestore-Reads"] = str(cost.reads)
+                    headers["X-Firestore-Writes"] = str(cost.writes)
+                    headers["X-Firestore-Deletes"] = str(cost.deletes)
+                    headers["X-Firestore-RPCs"] = str(cost.rpcs)
+                    if cost.is_amplified():
+                        headers["X-Firestore-Read-Amplification"] = f"{cost.amplification:.1f}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if cost.rpcs:
+                self._log(scope, cost, status, time.perf_counter() - started)
+
+    @staticmethod
+    def _log(scope: Scope, cost: RequestCost, status: int, elapsed: float) -> None:
+        route = getattr(scope.get("route"), "path", scope["path"])
+        fields = {
+            "method": scope["method"],
+            "route": route,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 1),
+            "firestore_reads": cost.reads,
+            "firestore_writes": cost.writes,
+            "firestore_deletes": cost.deletes,
+            "firestore_rpcs": cost.rpcs,
+            "firestore_rpc_ms": round(cost.rpc_seconds * 1000, 1),
+            "rows": cost.rows,
+            "read_amplification": round(cost.amplification, 1),
+        }
+        summary = " ".join(f"{key}={value}" for key, value in fields.items())
+        if cost.is_amplified():
+            logger.warning(f"High Firestore read amplification: {summary}", extra=fields)
+        else:
+            logger.info(f"Firestore cost: {summary}", extra=fields)
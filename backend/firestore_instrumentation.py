@@ -0,0 +1,444 @@
+"""
+Thin instrumentation layer around the Firestore client.
+
+connect_to_firestore wraps the client so every document get, get_all,
+query stream, write and delete is reported to registered observers as
+observer(collection, op, docs, seconds), where op is one of "get",
+"query", "write", "delete" or "commit" and docs is the number of
+documents read or written. Transactions are wrapped too: their reads are
+reported like the client's, and their commit as "commit" on the
+"transaction" collection. Everything else passes straight through to the
+underlying google-cloud-firestore objects, so the wrappers can be handed
+to transactions and batches like the real references.
+
+Observers run inline on the calling thread and must be cheap.
+
+Every RPC also takes a concurrency.firestore_slots slot, which is a no-op
+unless FIRESTORE_MAX_CONCURRENCY is set.
+
+instrument_async wraps a google.cloud.firestore.AsyncClient (or
+fake_firestore.AsyncFakeFirestore) the same way: the chaining methods are
+shared, and the RPC methods become coroutines / async generators.
+"""
+import time
+from typing import Callable, List
+
+from concurrency import firestore_slots
+
+Observer = Callable[[str, str, int, float], None]
+
+_observers: List[Observer] = []
+
+
+def add_observer(observer: Observer) -> None:
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_observer(observer: Observer) -> None:
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+def _notify(collection: str, op: str, docs: int, seconds: float) -> None:
+    for observer in _observers:
+        observer(collection, op, docs, seconds)
+
+
+def _collection_name(ref) -> str:
+    # Subcollections are reported by their own id, e.g. "comments"
+    return getattr(ref, "id", None) or "unknown"
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, _Proxy) else value
+
+
+def _get_all_collection(references: list) -> str:
+    names = {
+        ref._collection if isinstance(ref, _Proxy) else _collection_name(ref.parent) for ref in references
+    }
+    return names.pop() if len(names) == 1 else "multiple"
+
+
+def _instrumented_get_all(get_all, references, *args, **kwargs):
+    # One RPC for all references; each one is billed as a read, found or not
+    references = list(references)
+    started = time.perf_counter()
+    try:
+        with firestore_slots.slot():
+            yield from get_all([_unwrap(ref) for ref in references], *args, **kwargs)
+    finally:
+        _notify(_get_all_collection(references), "get", max(len(references), 1), time.perf_counter() - started)
+
+
+class _Proxy:
+    __slots__ = ("_target", "_collection")
+
+    def __init__(self, target, collection: str) -> None:
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_collection", collection)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __eq__(self, other):
+        if isinstance(other, _Proxy):
+            other = other._target
+        return self._target == other
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"<instrumented {self._target!r}>"
+
+
+class InstrumentedQuery(_Proxy):
+    __slots__ = ()
+
+    def _wrap(self, result):
+        return InstrumentedQuery(result, self._collection)
+
+    def where(self, *args, **kwargs):
+        return self._wrap(self._target.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return self._wrap(self._target.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return self._wrap(self._target.limit(*args, **kwargs))
+
+    def limit_to_last(self, *args, **kwargs):
+        return self._wrap(self._target.limit_to_last(*args, **kwargs))
+
+    def offset(self, *args, **kwargs):
+        return self._wrap(self._target.offset(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        return self._wrap(self._target.select(*args, **kwargs))
+
+    def start_at(self, *args, **kwargs):
+        return self._wrap(self._target.start_at(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return self._wrap(self._target.start_after(*args, **kwargs))
+
+    def end_at(self, *args, **kwargs):
+        return self._wrap(self._target.end_at(*args, **kwargs))
+
+    def end_before(self, *args, **kwargs):
+        return self._wrap(self._target.end_before(*args, **kwargs))
+
+    def stream(self, *args, **kwargs):
+        started = time.perf_counter()
+        docs = 0
+        try:
+            with firestore_slots.slot():
+                for snapshot in self._target.stream(*args, **kwargs):
+                    docs += 1
+                    yield snapshot
+        finally:
+            # An empty result is still billed as one read
+            _notify(self._collection, "query", max(docs, 1), time.perf_counter() - started)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+
+class InstrumentedDocument(_Proxy):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with firestore_slots.slot():
+                return self._target.get(*args, **kwargs)
+        finally:
+            _notify(self._collection, "get", 1, time.perf_counter() - started)
+
+    def _write(self, op: str, method: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with firestore_slots.slot():
+                return getattr(self._target, method)(*args, **kwargs)
+        finally:
+            _notify(self._collection, op, 1, time.perf_counter() - started)
+
+    def set(self, *args, **kwargs):
+        return self._write("write", "set", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write("write", "create", *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write("write", "update", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", "delete", *args, **kwargs)
+
+    def collection(self, *args, **kwargs):
+        ref = self._target.collection(*args, **kwargs)
+        return InstrumentedCollection(ref, _collection_name(ref))
+
+
+class InstrumentedCollection(InstrumentedQuery):
+    __slots__ = ()
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._target.document(*args, **kwargs), self._collection)
+
+    def add(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with firestore_slots.slot():
+                return self._target.add(*args, **kwargs)
+        finally:
+            _notify(self._collection, "write", 1, time.perf_counter() - started)
+
+    def list_documents(self, *args, **kwargs):
+        for ref in self._target.list_documents(*args, **kwargs):
+            yield InstrumentedDocument(ref, self._collection)
+
+
+class InstrumentedBatch(_Proxy):
+    __slots__ = ("_writes",)
+
+    def __init__(self, target) -> None:
+        super().__init__(target, "batch")
+        object.__setattr__(self, "_writes", 0)
+
+    def _count(self, method: str, *args, **kwargs):
+        object.__setattr__(self, "_writes", self._writes + 1)
+        return getattr(self._target, method)(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._count("set", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._count("create", *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._count("update", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._count("delete", *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with firestore_slots.slot():
+                return self._target.commit(*args, **kwargs)
+        finally:
+            _notify("batch", "commit", self._writes, time.perf_counter() - started)
+
+
+class InstrumentedTransaction(InstrumentedBatch):
+    """
+    Reads through transaction.get/get_all are reported like the client's.
+    firestore.transactional commits with _commit() and starts every
+    attempt with _clean_up(), so those count the writes.
+    """
+    __slots__ = ()
+
+    def __init__(self, target) -> None:
+        super().__init__(target)
+        object.__setattr__(self, "_collection", "transaction")
+
+    def _clean_up(self, *args, **kwargs):
+        object.__setattr__(self, "_writes", 0)
+        return self._target._clean_up(*args, **kwargs)
+
+    def get(self, ref_or_query, *args, **kwargs):
+        if isinstance(ref_or_query, InstrumentedDocument):
+            return _instrumented_get_all(
+                lambda references, *a, **k: self._target.get(references[0], *a, **k),
+                [ref_or_query], *args, **kwargs,
+            )
+        if isinstance(ref_or_query, InstrumentedQuery):
+            return self._stream(ref_or_query, *args, **kwargs)
+        return self._target.get(ref_or_query, *args, **kwargs)
+
+    def _stream(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        docs = 0
+        try:
+            with firestore_slots.slot():
+                for snapshot in self._target.get(query._target, *args, **kwargs):
+                    docs += 1
+                    yield snapshot
+        finally:
+            _notify(query._collection, "query", max(docs, 1), time.perf_counter() - started)
+
+    def get_all(self, references, *args, **kwargs):
+        return _instrumented_get_all(self._target.get_all, references, *args, **kwargs)
+
+    def _commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with firestore_slots.slot():
+                return self._target._commit(*args, **kwargs)
+        finally:
+            _notify("transaction", "commit", self._writes, time.perf_counter() - started)
+
+    def commit(self, *args, **kwargs):
+        return self._commit(*args, **kwargs)
+
+
+class InstrumentedClient(_Proxy):
+    __slots__ = ()
+
+    def __init__(self, client) -> None:
+        super().__init__(client, "")
+
+    def collection(self, *args, **kwargs):
+        ref = self._target.collection(*args, **kwargs)
+        return InstrumentedCollection(ref, _collection_name(ref))
+
+    def document(self, *args, **kwargs):
+        ref = self._target.document(*args, **kwargs)
+        return InstrumentedDocument(ref, _collection_name(ref.parent))
+
+    def batch(self, *args, **kwargs):
+        return InstrumentedBatch(self._target.batch(*args, **kwargs))
+
+    def transaction(self, *args, **kwargs):
+        return InstrumentedTransaction(self._target.transaction(*args, **kwargs))
+
+    def get_all(self, references, *args, **kwargs):
+        return _instrumented_get_all(self._target.get_all, references, *args, **kwargs)
+
+    @property
+    def unwrapped(self):
+        return self._target
+
+
+def instrument(client):
+    if client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
+
+
+# -- AsyncClient ------------------------------------------------------------
+
+class AsyncInstrumentedQuery(InstrumentedQuery):
+    __slots__ = ()
+
+    def _wrap(self, result):
+        return AsyncInstrumentedQuery(result, self._collection)
+
+    async def stream(self, *args, **kwargs):
+        started = time.perf_counter()
+        docs = 0
+        try:
+            async with firestore_slots.async_slot():
+                async for snapshot in self._target.stream(*args, **kwargs):
+                    docs += 1
+                    yield snapshot
+        finally:
+            _notify(self._collection, "query", max(docs, 1), time.perf_counter() - started)
+
+    async def get(self, *args, **kwargs):
+        return [snapshot async for snapshot in self.stream(*args, **kwargs)]
+
+
+class AsyncInstrumentedDocument(_Proxy):
+    __slots__ = ()
+
+    async def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with firestore_slots.async_slot():
+                return await self._target.get(*args, **kwargs)
+        finally:
+            _notify(self._collection, "get", 1, time.perf_counter() - started)
+
+    async def _write(self, op: str, method: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with firestore_slots.async_slot():
+                return await getattr(self._target, method)(*args, **kwargs)
+        finally:
+            _notify(self._collection, op, 1, time.perf_counter() - started)
+
+    def set(self, *args, **kwargs):
+        return self._write("write", "set", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write("write", "create", *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write("write", "update", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", "delete", *args, **kwargs)
+
+    def collection(self, *args, **kwargs):
+        ref = self._target.collection(*args, **kwargs)
+        return AsyncInstrumentedCollection(ref, _collection_name(ref))
+
+
+class AsyncInstrumentedCollection(AsyncInstrumentedQuery):
+    __slots__ = ()
+
+    def document(self, *args, **kwargs):
+        return AsyncInstrumentedDocument(self._target.document(*args, **kwargs), self._collection)
+
+    async def add(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with firestore_slots.async_slot():
+                return await self._target.add(*args, **kwargs)
+        finally:
+            _notify(self._collection, "write", 1, time.perf_counter() - started)
+
+    async def list_documents(self, *args, **kwargs):
+        async for ref in self._target.list_documents(*args, **kwargs):
+            yield AsyncInstrumentedDocument(ref, self._collection)
+
+
+class AsyncInstrumentedBatch(InstrumentedBatch):
+    __slots__ = ()
+
+    async def commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with firestore_slots.async_slot():
+                return await self._target.commit(*args, **kwargs)
+        finally:
+            _notify("batch", "commit", self._writes, time.perf_counter() - started)
+
+
+class AsyncInstrumentedClient(InstrumentedClient):
+    __slots__ = ()
+
+    def collection(self, *args, **kwargs):
+        ref = self._target.collection(*args, **kwargs)
+        return AsyncInstrumentedCollection(ref, _collection_name(ref))
+
+    def document(self, *args, **kwargs):
+        ref = self._target.document(*args, **kwargs)
+        return AsyncInstrumentedDocument(ref, _collection_name(ref.parent))
+
+    def batch(self, *args, **kwargs):
+        return AsyncInstrumentedBatch(self._target.batch(*args, **kwargs))
+
+    def transaction(self, *args, **kwargs):
+        # Transactions run on the sync client (see routes/notifications.py)
+        return self._target.transaction(*args, **kwargs)
+
+    async def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        started = time.perf_counter()
+        try:
+            async with firestore_slots.async_slot():
+                async for snapshot in self._target.get_all([_unwrap(ref) for ref in references], *args, **kwargs):
+                    yield snapshot
+        finally:
+            _notify(_get_all_collection(references), "get", max(len(references), 1), time.perf_counter() - started)
+
+
+def instrument_async(client):
+    if client is None or isinstance(client, AsyncInstrumentedClient):
+        return client
+    return AsyncInstrumentedClient(client)
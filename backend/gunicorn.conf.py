@@ -0,0 +1,60 @@
+"""
+Production entry point: a preloaded app forked into uvicorn workers.
+
+    cd backend
+    gunicorn -c gunicorn.conf.py server:app
+
+The master imports the app once (preload_app), so workers share its code
+pages and fork in milliseconds. Firestore/gRPC clients are never created
+in the master: startup hooks run per worker, and post_fork drops anything
+that was created before the fork anyway (database.reset_after_fork).
+Workers are recycled after MAX_REQUESTS (+ jitter) requests to cap memory
+growth. gunicorn does not run on Windows; use start_backend.bat there.
+
+Settings (environment):
+    WEB_CONCURRENCY            workers (default: 2 x CPUs + 1)
+    BIND                       listen address (default 0.0.0.0:8000)
+    MAX_REQUESTS               requests before a worker is recycled (default 5000, 0 = never)
+    MAX_REQUESTS_JITTER        spread so workers do not restart together (default 500)
+    WORKER_TIMEOUT             seconds a silent worker may hang before it is killed (default 60)
+    GRACEFUL_TIMEOUT           seconds to finish in-flight requests on restart (default 30)
+    THREADPOOL_SIZE            sync-route threads per worker (concurrency.py)
+    FIRESTORE_MAX_CONCURRENCY  in-flight Firestore RPCs per worker (concurrency.py)
+
+Everything kept in memory is per worker: metrics (/metrics shows the
+worker that answered the scrape), rate-limit buckets, the principal cache
+and the revocation list. Rate limits are therefore effectively multiplied
+by the worker count. The write-behind journal (write_behind.py) is shared
+through its SQLite file; one worker at a time flushes it. The job queue
+(jobs.py) is shared the same way, and per-type job concurrency limits
+apply across workers. Idempotency keys are shared through Firestore
+(idempotency.py).
+"""
+import multiprocessing
+import os
+
+wsgi_app = "server:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+preload_app = True
+max_requests = int(os.environ.get("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", "500"))
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = os.environ.get("ACCESS_LOG") or None
+
+
+def post_fork(server, worker):
+    import database
+    import jobs
+    import write_behind
+    from concurrency import firestore_slots
+
+    database.reset_after_fork()
+    firestore_slots.reset()
+    write_behind.journal.reset_after_fork()
+    jobs.queue.reset_after_fork()
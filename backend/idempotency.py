@@ -0,0 +1,367 @@
+"""
+Idempotency-Key support for POST requests.
+
+Clients on flaky site Wi-Fi retry creates, and without a key every retry
+makes another document (and another work order number). A POST under
+IDEMPOTENCY_PREFIX that carries an Idempotency-Key header runs once: its
+response (status, content type, body) is stored with a fingerprint of
+the request and replayed, marked Idempotent-Replayed: true, for every
+retry with the same key within IDEMPOTENCY_TTL_SECONDS. Reusing a key
+for a different request (method, path, query or body) is a 422. Only
+JSON (or empty) bodies are covered, buffered up to
+IDEMPOTENCY_MAX_REQUEST_BYTES (413 beyond that); multipart uploads and
+forms pass through untouched.
+
+Records live in the idempotency_keys collection, one document per
+(path, key), behind a per-worker LRU cache. Give the collection a TTL
+policy so Firestore deletes expired records:
+
+    gcloud firestore fields ttls update expiresAt \\
+        --collection-group=idempotency_keys --enable-ttl
+
+Requests with the same key are serialized: within a worker on an asyncio
+lock, across workers by create()-ing a pending record before running the
+route. A request that finds the key pending waits up to
+IDEMPOTENCY_WAIT_SECONDS for the stored response, then gets a 409.
+Claims left behind by a crashed worker expire after
+IDEMPOTENCY_LOCK_SECONDS. 5xx and 429 responses are not stored, so those
+requests can be retried. When Firestore cannot be reached, keys are only
+deduplicated within the worker.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Union
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import get_async_database
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_ENABLED = os.environ.get("IDEMPOTENCY_ENABLED", "1").lower() in ("1", "true", "yes")
+IDEMPOTENCY_PREFIX = os.environ.get("IDEMPOTENCY_PREFIX", "/api")
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "2048"))
+# Firestore documents are capped at 1 MiB; larger responses are not stored
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.environ.get("IDEMPOTENCY_MAX_BODY_BYTES", str(256 * 1024)))
+# Keyed request bodies are buffered to fingerprint them; larger ones get 413
+IDEMPOTENCY_MAX_REQUEST_BYTES = int(os.environ.get("IDEMPOTENCY_MAX_REQUEST_BYTES", str(1024 * 1024)))
+
+COLLECTION = "idempotency_keys"
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Headers that describe the payload; the rest (CORS, cost headers) are per response
+STORED_HEADERS = ("content-type", "location")
+
+
+@dataclass
+class Record:
+    fingerprint: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    expires: float  # epoch seconds
+
+    def response(self) -> Response:
+        return Response(self.body, status_code=self.status, headers={**self.headers, REPLAYED_HEADER: "true"})
+
+    def to_document(self) -> dict:
+        return {
+            "state": "done",
+            "fingerprint": self.fingerprint,
+            "status": self.status,
+            "headers": self.headers,
+            "body": self.body,
+            "expiresAt": datetime.fromtimestamp(self.expires, timezone.utc),
+        }
+
+    @classmethod
+    def from_document(cls, data: dict) -> "Record":
+        return cls(
+            fingerprint=data["fingerprint"],
+            status=int(data["status"]),
+            headers=dict(data.get("headers") or {}),
+            body=bytes(data.get("body") or b""),
+            expires=_epoch(data.get("expiresAt")),
+        )
+
+
+# Returned by claim() when another request still holds the key
+BUSY = object()
+
+
+def _epoch(value) -> float:
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _fingerprint(scope: Scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _document_id(path: str, key: str) -> str:
+    return hashlib.sha256(f"{path}\n{key}".encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, cache_size: int = IDEMPOTENCY_CACHE_SIZE) -> None:
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Record]" = OrderedDict()
+        self._locks: Dict[str, list] = {}
+        self.replays = 0
+        self.conflicts = 0
+        self.stored = 0
+
+    @asynccontextmanager
+    async def lock(self, doc_id: str):
+        """Serializes requests for one key within this worker."""
+        entry = self._locks.get(doc_id)
+        if entry is None:
+            entry = self._locks[doc_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[doc_id]
+
+    def _cached(self, doc_id: str) -> Optional[Record]:
+        record = self._cache.get(doc_id)
+        if record is None:
+            return None
+        if record.expires <= time.time():
+            del self._cache[doc_id]
+            return None
+        self._cache.move_to_end(doc_id)
+        return record
+
+    def _remember(self, doc_id: str, record: Record) -> None:
+        self._cache[doc_id] = record
+        self._cache.move_to_end(doc_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _reference(self, doc_id: str):
+        db = await get_async_database()
+        return db.collection(COLLECTION).document(doc_id)
+
+    async def claim(self, doc_id: str, fingerprint: str) -> Union[Record, object, None]:
+        """
+        Returns the stored Record for the key, BUSY if another worker is
+        still running it, or None once this request owns the key.
+        """
+        from google.api_core.exceptions import AlreadyExists
+
+        record = self._cached(doc_id)
+        if record is not None:
+            return record
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.05
+        while True:
+            try:
+                reference = await self._reference(doc_id)
+                await reference.create({
+                    "state": "pending",
+                    "fingerprint": fingerprint,
+                    "lockedUntil": datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                    "expiresAt": datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+                })
+                return None
+            except AlreadyExists:
+                pass
+            except Exception as e:
+                logger.warning("Idempotency store unavailable, deduplicating in this worker only: %s", e)
+                return None
+
+            try:
+                snapshot = await reference.get()
+            except Exception as e:
+                logger.warning("Idempotency store unavailable, deduplicating in this worker only: %s", e)
+                return None
+            data = snapshot.to_dict() if snapshot.exists else None
+            if data is None:
+                continue
+
+            now = time.time()
+            if data.get("state") == "done" and _epoch(data.get("expiresAt")) > now:
+                record = Record.from_document(data)
+                self._remember(doc_id, record)
+                return record
+            if data.get("state") == "pending" and _epoch(data.get("lockedUntil")) > now:
+                if time.monotonic() >= deadline:
+                    return BUSY
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                continue
+            # Expired record, or a claim abandoned by a crashed worker
+            await self.release(doc_id)
+
+    async def save(self, doc_id: str, record: Record) -> None:
+        self._remember(doc_id, record)
+        self.stored += 1
+        try:
+            reference = await self._reference(doc_id)
+            await reference.set(record.to_document())
+        except Exception as e:
+            logger.warning("Could not store idempotency record %s: %s", doc_id, e)
+
+    async def release(self, doc_id: str) -> None:
+        """Drops a claim so the request can be retried."""
+        try:
+            reference = await self._reference(doc_id)
+            await reference.delete()
+        except Exception as e:
+            logger.warning("Could not release idempotency key %s: %s", doc_id, e)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "inFlight": len(self._locks),
+            "stored": self.stored,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+        }
+
+
+store = IdempotencyStore()
+
+
+def _is_json(headers: Headers) -> bool:
+    # No content type covers the empty-body POSTs
+    content_type = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    return not content_type or content_type == "application/json" or content_type.endswith("+json")
+
+
+async def _read_body(receive: Receive, limit: int) -> Optional[bytes]:
+    """The request body, or None once it grows past `limit` bytes."""
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, idempotency_store: IdempotencyStore = store,
+                 prefix: str = IDEMPOTENCY_PREFIX) -> None:
+        self.app = app
+        self.store = idempotency_store
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get("idempotency-key")
+        # Uploads (multipart) and forms stream straight to the route with
+        # their own size limits; keys only apply to JSON bodies
+        if key is None or not _is_json(headers):
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse({"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"},
+                                    status_code=400)
+            await response(scope, receive, send)
+            return
+
+        too_large = JSONResponse({"detail": "Request body too large for an Idempotency-Key request"},
+                                 status_code=413)
+        declared = headers.get("content-length", "")
+        if declared.isdigit() and int(declared) > IDEMPOTENCY_MAX_REQUEST_BYTES:
+            await too_large(scope, receive, send)
+            return
+        body = await _read_body(receive, IDEMPOTENCY_MAX_REQUEST_BYTES)
+        if body is None:
+            await too_large(scope, receive, send)
+            return
+        fingerprint = _fingerprint(scope, body)
+        doc_id = _document_id(scope["path"], key)
+        async with self.store.lock(doc_id):
+            outcome = await self.store.claim(doc_id, fingerprint)
+            if outcome is BUSY:
+                self.store.conflicts += 1
+                response = JSONResponse({"detail": "A request with this Idempotency-Key is still in progress"},
+                                        status_code=409, headers={"Retry-After": "1"})
+            elif isinstance(outcome, Record) and outcome.fingerprint != fingerprint:
+                self.store.conflicts += 1
+                response = JSONResponse({"detail": "Idempotency-Key was already used for a different request"},
+                                        status_code=422)
+            elif isinstance(outcome, Record):
+                self.store.replays += 1
+                response = outcome.response()
+            else:
+                await self._run(scope, body, receive, send, doc_id, fingerprint)
+                return
+        await response(scope, receive, send)
+
+    async def _run(self, scope: Scope, body: bytes, receive: Receive, send: Send,
+                   doc_id: str, fingerprint: str) -> None:
+        body_sent = False
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture)
+        except BaseException:
+            await self.store.release(doc_id)
+            raise
+
+        content = b"".join(chunks)
+        status = start["status"] if start else 500
+        if status >= 500 or status == 429 or len(content) > IDEMPOTENCY_MAX_BODY_BYTES:
+            await self.store.release(doc_id)
+            return
+        headers = Headers(raw=start["headers"])
+        await self.store.save(doc_id, Record(
+            fingerprint=fingerprint,
+            status=status,
+            headers={name: headers[name] for name in STORED_HEADERS if name in headers},
+            body=content,
+            expires=time.time() + IDEMPOTENCY_TTL_SECONDS,
+        ))
@@ -0,0 +1,248 @@
+"""
+Image derivatives for asset and location photos.
+
+Every uploaded image gets a thumbnail and a medium web-optimized variant,
+rendered on a small process pool so request threads never do pixel work.
+Uploads queue an image_derivatives job (jobs.py), so rendering that was
+interrupted by a restart is picked up again.
+Derivatives live in a "thumbs" directory next to the original:
+
+    /uploads/assets/<name>.jpeg -> /uploads/assets/thumbs/<name>_thumb.webp
+
+Run `python images.py` from the backend directory to backfill derivatives
+for images uploaded before the pipeline existed or moved into the blob
+store by `python blob_store.py`.
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import jobs
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional; uploads keep working without derivatives
+    Image = None
+    ImageOps = None
+    features = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# URL prefix -> directory served under it (mirrors the mounts in server.py)
+STATIC_ROOTS = {
+    "/uploads": BASE_DIR / "uploads",
+    "/uploaded_assets": BASE_DIR / "uploaded_assets",
+}
+
+DERIVATIVES_DIRNAME = "thumbs"
+VARIANTS = {
+    "thumb": 320,
+    "medium": 1280,
+}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+if features is not None and features.check("webp"):
+    DERIVATIVE_EXTENSION = ".webp"
+    _SAVE_OPTIONS: Dict[str, Any] = {"format": "WEBP", "quality": 80, "method": 4}
+else:
+    DERIVATIVE_EXTENSION = ".jpg"
+    _SAVE_OPTIONS = {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def derivative_path(source: Path, variant: str) -> Path:
+    source = Path(source)
+    return source.parent / DERIVATIVES_DIRNAME / f"{source.stem}_{variant}{DERIVATIVE_EXTENSION}"
+
+
+def url_to_path(url: Optional[str]) -> Optional[Path]:
+    """
+    Maps a static URL such as /uploads/assets/x.jpg to its file on disk.
+    """
+    if not url:
+        return None
+    for prefix, root in STATIC_ROOTS.items():
+        if url.startswith(prefix + "/"):
+            relative = url[len(prefix) + 1:]
+            path = (root / relative).resolve()
+            if root.resolve() in path.parents:
+                return path
+    return None
+
+
+def derivative_url(image_url: Optional[str], variant: str = "thumb") -> Optional[str]:
+    if not image_url or "/" not in image_url:
+        return None
+    directory, filename = image_url.rsplit("/", 1)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/{DERIVATIVES_DIRNAME}/{stem}_{variant}{DERIVATIVE_EXTENSION}"
+
+
+def attach_thumbnail_url(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Sets imageThumbUrl on an asset/location dict once its thumbnail has been
+    rendered; until then clients fall back to imageUrl.
+    """
+    if not data:
+        return data
+    image_url = data.get("imageUrl")
+    thumb_url = derivative_url(image_url)
+    source = url_to_path(image_url)
+    if thumb_url and source is not None and derivative_path(source, "thumb").exists():
+        data["imageThumbUrl"] = thumb_url
+    else:
+        data["imageThumbUrl"] = None
+    return data
+
+
+def render_derivatives(source: str, force: bool = False) -> Dict[str, str]:
+    """
+    Renders every variant for one image. Runs inside the process pool, so it
+    only takes and returns plain, picklable values.
+    """
+    if Image is None:
+        return {}
+
+    source_path = Path(source)
+    outputs = {variant: derivative_path(source_path, variant) for variant in VARIANTS}
+    if not force and all(
+        path.exists() and path.stat().st_mtime >= source_path.stat().st_mtime
+        for path in outputs.values()
+    ):
+        return {variant: str(path) for variant, path in outputs.items()}
+
+    with Image.open(source_path) as original:
+        # Apply the EXIF orientation to the pixels; the EXIF block itself is
+        # dropped because no exif= argument is passed when saving.
+        image = ImageOps.exif_transpose(original)
+        if _SAVE_OPTIONS["format"] == "JPEG" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+
+        outputs[next(iter(outputs))].parent.mkdir(parents=True, exist_ok=True)
+        for variant, max_edge in VARIANTS.items():
+            rendered = image.copy()
+            rendered.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            target = outputs[variant]
+            tmp_path = target.with_name(f".{target.name}.part")
+            rendered.save(tmp_path, **_SAVE_OPTIONS)
+            os.replace(tmp_path, target)
+
+    return {variant: str(path) for variant, path in outputs.items()}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def _log_failure(future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.warning("Failed to render image derivatives: %s", error)
+
+
+@jobs.handler("image_derivatives", concurrency=IMAGE_WORKERS)
+def _render_job(payload: dict) -> None:
+    if not Path(payload["source"]).exists():
+        raise jobs.PermanentJobError(f"{payload['source']} no longer exists")
+    _get_executor().submit(render_derivatives, payload["source"]).result()
+
+
+def schedule_derivatives(source: Path):
+    """
+    Queues derivative rendering for a freshly stored image and returns
+    immediately: a durable job (see jobs.py), or a process-pool future
+    with JOBS_ENABLED off. Returns None when Pillow is not installed.
+    """
+    if Image is None:
+        logger.debug("Pillow not installed, skipping derivatives for %s", source)
+        return None
+    if jobs.JOBS_ENABLED:
+        return jobs.enqueue("image_derivatives", {"source": str(source)}, key=str(source))
+    future = _get_executor().submit(render_derivatives, str(source))
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def iter_images(directories: Iterable[Path]) -> Iterable[Path]:
+    """
+    Images under the given directories, recursively (the blob store is
+    sharded two levels deep). Derivative and hidden (staging) directories
+    are skipped.
+    """
+    for directory in directories:
+        if not directory.is_dir():
+            continue
+        for root, dirnames, filenames in os.walk(directory):
+            dirnames[:] = sorted(
+                name for name in dirnames if name != DERIVATIVES_DIRNAME and not name.startswith(".")
+            )
+            for filename in sorted(filenames):
+                path = Path(root) / filename
+                if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file():
+                    yield path
+
+
+def backfill(directories: Iterable[Path], force: bool = False) -> int:
+    """
+    Renders derivatives for every image already present in the given
+    directories. Returns the number of images processed successfully.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is required to render image derivatives")
+
+    sources: List[str] = [str(path) for path in iter_images(directories)]
+    processed = 0
+    executor = _get_executor()
+    futures = [executor.submit(render_derivatives, source, force) for source in sources]
+    for source, future in zip(sources, futures):
+        try:
+            future.result()
+            processed += 1
+        except Exception as e:
+            logger.warning("Skipping %s: %s", source, e)
+    return processed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill thumbnail and medium image variants.")
+    parser.add_argument(
+        "directories",
+        nargs="*",
+        type=Path,
+        default=[
+            BASE_DIR / "uploads" / "blobs",
+            BASE_DIR / "uploaded_assets",
+            BASE_DIR / "uploads" / "assets",
+            BASE_DIR / "uploads" / "locations",
+        ],
+    )
+    parser.add_argument("--force", action="store_true", help="Re-render existing derivatives")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        count = backfill(args.directories, force=args.force)
+    finally:
+        shutdown_executor()
+    print(f"Rendered derivatives for {count} images")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Per-user alert inboxes and subscriptions.
+
+The alert evaluator (notify.evaluate) writes every new (recipient, event)
+into the recipient's inbox, in the same batch that records it for
+delivery:
+
+    inboxes/{username}                 {"unread": n, "total": n, "updatedAt"}
+    inboxes/{username}/items/{id}      the alert, "read", "createdAt", "sortKey"
+
+Unread and total counts are kept with Increment, so reading an inbox is
+one query on the user's own items subcollection ordered by sortKey (a
+single-field index), plus a get of the counter document. sortKey is
+unique, so it doubles as the pagination cursor. Marking items read flips
+"read" and decrements "unread" in one transaction, so the counter cannot
+drift below the number of unread items.
+
+Subscriptions (notification_subscriptions/{username}) widen or narrow
+what a user receives besides the alerts assigned to them: alerts for
+given locations or for assets of given criticalities, optionally limited
+to some alert kinds. With deliver=False the user gets inbox items only,
+no email or webhook.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from alerts import Alert
+from models import NotificationSubscription
+
+INBOXES = "inboxes"
+ITEMS = "items"
+SUBSCRIPTIONS = "notification_subscriptions"
+
+
+def inbox_id(username: str) -> str:
+    # Document ids cannot contain "/"
+    return username.replace("/", "_")
+
+
+def sort_key(created: datetime, notification_id: str) -> str:
+    return f"{created:%Y%m%d%H%M%S%f}-{notification_id}"
+
+
+def load_subscriptions(db) -> Dict[str, NotificationSubscription]:
+    return {
+        snapshot.id: NotificationSubscription(**(snapshot.to_dict() or {}))
+        for snapshot in db.collection(SUBSCRIPTIONS).stream()
+    }
+
+
+def _asset_criticality(db, alerts: List[Alert]) -> Dict[str, str]:
+    asset_ids = sorted({alert.details["assetId"] for alert in alerts if alert.details.get("assetId")})
+    if not asset_ids:
+        return {}
+    collection = db.collection("assets")
+    return {
+        snapshot.id: (snapshot.to_dict() or {}).get("criticality")
+        for snapshot in db.get_all([collection.document(asset_id) for asset_id in asset_ids])
+        if snapshot.exists
+    }
+
+
+def recipients(db, alerts: List[Alert],
+               subscriptions: Dict[str, NotificationSubscription]) -> List[Tuple[str, Alert]]:
+    """
+    (recipient, alert) pairs after applying subscriptions: assignees keep
+    their alerts unless they opted out, subscribers are added by location
+    and asset criticality.
+    """
+    criticality: Dict[str, str] = {}
+    if any(subscription.assetCriticalities for subscription in subscriptions.values()):
+        criticality = _asset_criticality(db, alerts)
+
+    pairs: List[Tuple[str, Alert]] = []
+    for alert in alerts:
+        chosen: Set[str] = set()
+        for recipient in alert.recipients:
+            subscription = subscriptions.get(inbox_id(recipient))
+            if subscription is None:
+                chosen.add(recipient)
+            elif subscription.wants(alert.kind) and (recipient != alert.assignee or subscription.assignedToMe):
+                chosen.add(recipient)
+        location = alert.details.get("location")
+        level = alert.details.get("criticality") or criticality.get(alert.details.get("assetId"))
+        for username, subscription in subscriptions.items():
+            if username in chosen or not subscription.wants(alert.kind):
+                continue
+            if (location and location in subscription.locations) or (
+                level and level in subscription.assetCriticalities
+            ):
+                chosen.add(username)
+        pairs.extend((recipient, alert) for recipient in sorted(chosen))
+    return pairs
+
+
+def add_items(db, batch, items: Iterable[Tuple[str, str, Alert]], now: datetime) -> None:
+    """Adds (notification id, recipient, alert) items and bumps the counters."""
+    from firebase_admin import firestore  # deferred with the client, see database.py
+
+    added: Dict[str, int] = {}
+    for notification_id, recipient, alert in items:
+        inbox = db.collection(INBOXES).document(inbox_id(recipient))
+        batch.set(inbox.collection(ITEMS).document(notification_id), {
+            **alert.to_dict(),
+            "read": False,
+            "createdAt": now,
+            "sortKey": sort_key(now, notification_id),
+        })
+        added[recipient] = added.get(recipient, 0) + 1
+    for recipient, count in added.items():
+        batch.set(db.collection(INBOXES).document(inbox_id(recipient)), {
+            "username": recipient,
+            "unread": firestore.Increment(count),
+            "total": firestore.Increment(count),
+            "updatedAt": now,
+        }, merge=True)
+
+
+def item_with_id(snapshot) -> Optional[dict]:
+    if not snapshot.exists:
+        return None
+    data = snapshot.to_dict()
+    data["id"] = snapshot.id
+    return data
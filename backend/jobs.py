@@ -0,0 +1,434 @@
+"""
+Durable background jobs for slow side effects.
+
+Request handlers call enqueue() and return; the job is a row in a local
+SQLite queue (WAL mode, next to the write-behind journal) and survives
+restarts. Each worker process runs a dispatcher thread that claims due
+jobs for the types it has handlers for and runs them on a thread pool of
+JOBS_WORKERS threads:
+
+- handlers are registered with @handler("type", concurrency=N); N is the
+  most jobs of that type running at once across all worker processes
+  (counted in the queue itself);
+- a failed job is retried after an exponential backoff with jitter, up to
+  its max_attempts, then moved to the dead_jobs table. Raising
+  PermanentJobError dead-letters it at once;
+- a claimed job belongs to its worker for the type's lease_seconds; jobs
+  of a worker that died are picked up again once the lease expires, so
+  handlers must be safe to run twice;
+- jobs enqueued with a key are not queued again while one with the same
+  type and key is still waiting;
+- handlers registered with every=N seconds are periodic: start() queues
+  the first run and each run queues the next, keyed by the type, so one
+  chain runs however many workers there are.
+
+Handlers take the payload dict (JSON; datetimes and dates survive) and run
+in a worker thread, so they use the sync Firestore client. Queue depth,
+waiting times and dead jobs are shown at GET /api/admin/jobs.
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from write_behind import decode, encode
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+JOBS_ENABLED = os.environ.get("JOBS_ENABLED", "1").lower() in ("1", "true", "yes")
+JOBS_PATH = Path(os.environ.get("JOBS_PATH", str(BASE_DIR / "data" / "jobs.sqlite3")))
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", "4"))
+JOBS_POLL_SECONDS = float(os.environ.get("JOBS_POLL_SECONDS", "1.0"))
+JOBS_RETRY_SECONDS = float(os.environ.get("JOBS_RETRY_SECONDS", "5"))
+JOBS_MAX_BACKOFF_SECONDS = float(os.environ.get("JOBS_MAX_BACKOFF_SECONDS", "600"))
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", "5"))
+# Samples kept per job type for the latency figures
+LATENCY_SAMPLES = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    key TEXT,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    locked_by TEXT,
+    locked_until REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (type, status, run_at);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_queued_key ON jobs (type, key)
+    WHERE key IS NOT NULL AND status = 'queued';
+CREATE TABLE IF NOT EXISTS dead_jobs (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    key TEXT,
+    payload TEXT,
+    attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT
+);
+"""
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for failures that retrying cannot fix."""
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    function: Callable[[dict], None]
+    concurrency: int
+    max_attempts: int
+    lease_seconds: float
+    every: Optional[float] = None
+
+
+@dataclass
+class _Claimed:
+    id: int
+    type: str
+    payload: Optional[dict]
+    attempts: int
+    max_attempts: int
+    created_at: float
+    claimed_at: float
+
+
+class JobQueue:
+    def __init__(self, path: Path, workers: int = JOBS_WORKERS) -> None:
+        self.path = path
+        self.workers = workers
+        self.handlers: Dict[str, JobType] = {}
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._active = 0
+        self._lock = threading.Lock()
+        self._holder = f"{os.getpid()}-{id(self)}"
+        self._latency: Dict[str, Deque[Tuple[float, float]]] = {}
+        self.completed = 0
+        self.failed = 0
+
+    # -- connections --
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "pid", None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # NORMAL: survives process crashes and keeps enqueue() cheap
+            # enough to call from async routes
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], object]):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(connection)
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    # -- registration and enqueueing --
+
+    def register(self, name: str, function: Callable[[dict], None], concurrency: int = 1,
+                 max_attempts: int = JOBS_MAX_ATTEMPTS, lease_seconds: float = 300.0,
+                 every: Optional[float] = None) -> None:
+        self.handlers[name] = JobType(name, function, concurrency, max_attempts, lease_seconds, every)
+
+    def enqueue(self, job_type: str, payload: Optional[dict] = None, delay: float = 0.0,
+                key: Optional[str] = None, max_attempts: Optional[int] = None) -> Optional[int]:
+        """
+        Queues a job and returns its id, or None when a job with the same
+        type and key is already waiting.
+        """
+        if max_attempts is None:
+            spec = self.handlers.get(job_type)
+            max_attempts = spec.max_attempts if spec else JOBS_MAX_ATTEMPTS
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO jobs (type, key, payload, max_attempts, run_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_type, key, encode(payload), max_attempts, now + delay, now),
+        )
+        if not cursor.rowcount:
+            return None
+        if delay <= 0:
+            self._wake.set()
+        return cursor.lastrowid
+
+    # -- dispatching --
+
+    def _claim(self, capacity: int) -> List[_Claimed]:
+        def claim(connection: sqlite3.Connection) -> List[_Claimed]:
+            now = time.time()
+            claimed: List[_Claimed] = []
+            for spec in self.handlers.values():
+                if len(claimed) >= capacity:
+                    break
+                running, = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE type = ? AND status = 'running' AND locked_until > ?",
+                    (spec.name, now),
+                ).fetchone()
+                limit = min(spec.concurrency - running, capacity - len(claimed))
+                if limit <= 0:
+                    continue
+                # Running jobs whose lease ran out belong to a worker that died
+                rows = connection.execute(
+                    "SELECT id, payload, attempts, max_attempts, created_at FROM jobs "
+                    "WHERE type = ? AND ((status = 'queued' AND run_at <= ?) "
+                    "OR (status = 'running' AND locked_until <= ?)) "
+                    "ORDER BY run_at, id LIMIT ?",
+                    (spec.name, now, now, limit),
+                ).fetchall()
+                for job_id, payload, attempts, max_attempts, created_at in rows:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, "
+                        "locked_until = ? WHERE id = ?",
+                        (self._holder, now + spec.lease_seconds, job_id),
+                    )
+                    claimed.append(_Claimed(job_id, spec.name, decode(payload), attempts + 1,
+                                            max_attempts, created_at, now))
+            return claimed
+
+        return self._transaction(claim)
+
+    def _run_job(self, job: _Claimed) -> None:
+        started = time.time()
+        spec = self.handlers[job.type]
+        try:
+            if spec.every:
+                # Queued before running, so a failing run does not end the chain
+                self.enqueue(job.type, delay=spec.every, key=job.type)
+            spec.function(job.payload or {})
+        except Exception as error:
+            self._fail(job, error)
+        else:
+            self._connection().execute(
+                "DELETE FROM jobs WHERE id = ? AND locked_by = ?", (job.id, self._holder)
+            )
+            with self._lock:
+                self.completed += 1
+                samples = self._latency.setdefault(job.type, deque(maxlen=LATENCY_SAMPLES))
+                samples.append((job.claimed_at - job.created_at, time.time() - started))
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._wake.set()
+
+    def _fail(self, job: _Claimed, error: Exception) -> None:
+        message = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self.failed += 1
+        if isinstance(error, PermanentJobError) or job.attempts >= job.max_attempts:
+            logger.error("Job %s (%s) failed permanently after %d attempts: %s",
+                         job.id, job.type, job.attempts, message)
+
+            def bury(connection: sqlite3.Connection) -> None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO dead_jobs (id, type, key, payload, attempts, created_at, failed_at, error) "
+                    "SELECT id, type, key, payload, attempts, created_at, ?, ? FROM jobs "
+                    "WHERE id = ? AND locked_by = ?",
+                    (time.time(), message, job.id, self._holder),
+                )
+                connection.execute("DELETE FROM jobs WHERE id = ? AND locked_by = ?", (job.id, self._holder))
+
+            self._transaction(bury)
+            return
+
+        delay = min(JOBS_MAX_BACKOFF_SECONDS, JOBS_RETRY_SECONDS * 2 ** (job.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning("Job %s (%s) failed, retry %d/%d in %.1fs: %s",
+                       job.id, job.type, job.attempts, job.max_attempts - 1, delay, message)
+        try:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'queued', run_at = ?, locked_by = NULL, locked_until = NULL, "
+                "last_error = ? WHERE id = ? AND locked_by = ?",
+                (time.time() + delay, message, job.id, self._holder),
+            )
+        except sqlite3.IntegrityError:
+            # The same key was queued again meanwhile; that job replaces this one
+            self._connection().execute("DELETE FROM jobs WHERE id = ? AND locked_by = ?", (job.id, self._holder))
+
+    def _dispatch(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(JOBS_POLL_SECONDS)
+            self._wake.clear()
+            with self._lock:
+                capacity = self.workers - self._active
+            if capacity <= 0 or not self.handlers:
+                continue
+            try:
+                claimed = self._claim(capacity)
+            except Exception:
+                logger.exception("Could not claim jobs from %s", self.path)
+                continue
+            for job in claimed:
+                with self._lock:
+                    self._active += 1
+                self._executor.submit(self._run_job, job)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        for spec in self.handlers.values():
+            if spec.every:
+                self.enqueue(spec.name, key=spec.name)
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._thread = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops claiming jobs and waits for the running ones to finish."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def reset_after_fork(self) -> None:
+        self._local = threading.local()
+        self._thread = None
+        self._executor = None
+        self._active = 0
+        self._holder = f"{os.getpid()}-{id(self)}"
+
+    # -- admin --
+
+    def dead_jobs(self, limit: int = 100) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT id, type, key, payload, attempts, created_at, failed_at, error FROM dead_jobs "
+            "ORDER BY failed_at DESC LIMIT ?", (limit,),
+        ).fetchall()
+        return [
+            {"id": job_id, "type": job_type, "key": key, "payload": decode(payload), "attempts": attempts,
+             "createdAt": created_at, "failedAt": failed_at, "error": error}
+            for job_id, job_type, key, payload, attempts, created_at, failed_at, error in rows
+        ]
+
+    def retry_dead(self, job_id: int) -> bool:
+        """Moves a dead job back to the queue with its attempts reset."""
+        def revive(connection: sqlite3.Connection) -> bool:
+            row = connection.execute("SELECT type FROM dead_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            spec = self.handlers.get(row[0])
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO jobs (id, type, key, payload, max_attempts, run_at, created_at) "
+                "SELECT id, type, key, payload, ?, ?, created_at FROM dead_jobs WHERE id = ?",
+                (spec.max_attempts if spec else JOBS_MAX_ATTEMPTS, time.time(), job_id),
+            )
+            if cursor.rowcount:
+                connection.execute("DELETE FROM dead_jobs WHERE id = ?", (job_id,))
+            return bool(cursor.rowcount)
+
+        revived = self._transaction(revive)
+        if revived:
+            self._wake.set()
+        return revived
+
+    def stats(self) -> dict:
+        connection = self._connection()
+        now = time.time()
+        types: Dict[str, dict] = {}
+
+        def entry(name: str) -> dict:
+            spec = self.handlers.get(name)
+            return types.setdefault(name, {
+                "queued": 0, "scheduled": 0, "running": 0, "dead": 0, "oldestQueuedSeconds": 0.0,
+                "concurrency": spec.concurrency if spec else None,
+            })
+
+        for name, status, due, count, oldest in connection.execute(
+            "SELECT type, status, run_at <= ?, COUNT(*), MIN(run_at) FROM jobs GROUP BY type, status, run_at <= ?",
+            (now, now),
+        ):
+            if status == "running":
+                entry(name)["running"] += count
+            elif due:
+                entry(name)["queued"] += count
+                entry(name)["oldestQueuedSeconds"] = round(now - oldest, 3)
+            else:
+                entry(name)["scheduled"] += count
+        for name, count in connection.execute("SELECT type, COUNT(*) FROM dead_jobs GROUP BY type"):
+            entry(name)["dead"] = count
+        with self._lock:
+            for name, samples in self._latency.items():
+                waits = sorted(sample[0] for sample in samples)
+                runs = sorted(sample[1] for sample in samples)
+                entry(name).update({
+                    "waitSecondsP50": round(_percentile(waits, 0.5), 3),
+                    "waitSecondsP95": round(_percentile(waits, 0.95), 3),
+                    "runSecondsP50": round(_percentile(runs, 0.5), 3),
+                    "runSecondsP95": round(_percentile(runs, 0.95), 3),
+                })
+            return {
+                "enabled": JOBS_ENABLED,
+                "workers": self.workers,
+                "active": self._active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "types": types,
+            }
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+queue = JobQueue(JOBS_PATH)
+
+
+def handler(name: str, concurrency: int = 1, max_attempts: int = JOBS_MAX_ATTEMPTS,
+            lease_seconds: float = 300.0, every: Optional[float] = None):
+    """Registers the decorated function as the handler for `name` jobs."""
+    def register(function: Callable[[dict], None]) -> Callable[[dict], None]:
+        queue.register(name, function, concurrency, max_attempts, lease_seconds, every)
+        return function
+    return register
+
+
+def enqueue(job_type: str, payload: Optional[dict] = None, **kwargs) -> Optional[int]:
+    return queue.enqueue(job_type, payload, **kwargs)
+
+
+def start() -> None:
+    if JOBS_ENABLED:
+        queue.start()
+        logger.info("Job queue at %s (%d workers)", JOBS_PATH, queue.workers)
+
+
+def stop() -> None:
+    if JOBS_ENABLED:
+        queue.stop()
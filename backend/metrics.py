@@ -0,0 +1,249 @@
+"""
+In-process metrics exposed in the Prometheus text format at /metrics.
+
+- http_requests_total / http_request_duration_seconds per method, route
+  template (e.g. /api/work-orders/{work_order_id}) and status;
+- http_requests_in_flight;
+- threadpool_busy_threads / threadpool_max_threads for the AnyIO worker
+  pool that runs the sync routes;
+- firestore_slots_in_use / firestore_slots_limit / firestore_slot_waits_total
+  for the FIRESTORE_MAX_CONCURRENCY cap (see concurrency.py);
+- write_behind_pending / write_behind_oldest_seconds /
+  write_behind_dead_letters when WRITE_BEHIND_ENABLED (see write_behind.py);
+- progress_updates_total / progress_writes_total for the progress
+  coalescer (see progress_coalescer.py);
+- idempotency_replays_total / idempotency_conflicts_total for
+  Idempotency-Key handling (see idempotency.py);
+- firestore_operations_total, firestore_documents_total and
+  firestore_rpc_duration_seconds per collection and operation, fed by
+  firestore_instrumentation.
+
+The collectors are deliberately small: one lock and a couple of list
+updates per observation, no external dependency. Values are per process;
+with several workers each one exposes its own series.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import anyio.to_thread
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from concurrency import firestore_slots
+from firestore_instrumentation import add_observer
+from progress_coalescer import progress_coalescer
+import idempotency
+import write_behind
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RPC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount: float) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self, value=None) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_number(self.value if value is None else value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"), REQUEST_BUCKETS)
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+
+firestore_operations = Counter(
+    "firestore_operations_total", "Firestore RPCs by collection and operation.", ("collection", "op"))
+firestore_documents = Counter(
+    "firestore_documents_total", "Firestore documents read or written by collection and operation.",
+    ("collection", "op"))
+firestore_latency = Histogram(
+    "firestore_rpc_duration_seconds", "Firestore RPC latency by collection and operation.",
+    ("collection", "op"), RPC_BUCKETS)
+
+
+def observe_firestore(collection: str, op: str, docs: int, seconds: float) -> None:
+    labels = (collection, op)
+    firestore_operations.inc(labels)
+    firestore_documents.inc(labels, docs)
+    firestore_latency.observe(labels, seconds)
+
+
+add_observer(observe_firestore)
+
+
+def _route_template(scope: Scope) -> str:
+    # The router stores the matched route in the scope; using its template
+    # instead of the raw path keeps label cardinality bounded.
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_in_flight.add(1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.add(-1)
+            route = _route_template(scope)
+            http_requests.inc((scope["method"], route, status))
+            http_latency.observe((scope["method"], route), elapsed)
+
+
+def render() -> str:
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    lines: List[str] = []
+    for metric in (http_requests, http_latency, firestore_operations, firestore_documents, firestore_latency):
+        lines.extend(metric.render())
+    lines.extend(http_in_flight.render())
+    lines.extend(Gauge("threadpool_busy_threads", "AnyIO worker threads currently in use.")
+                 .render(limiter.borrowed_tokens))
+    lines.extend(Gauge("threadpool_max_threads", "AnyIO worker thread limit.")
+                 .render(limiter.total_tokens))
+    lines.extend(Gauge("firestore_slots_in_use", "Firestore RPCs holding a concurrency slot.")
+                 .render(firestore_slots.in_use))
+    lines.extend(Gauge("firestore_slots_limit", "FIRESTORE_MAX_CONCURRENCY (0 = unlimited).")
+                 .render(firestore_slots.limit))
+    lines.extend((
+        "# HELP firestore_slot_waits_total Firestore RPCs that had to wait for a slot.",
+        "# TYPE firestore_slot_waits_total counter",
+        f"firestore_slot_waits_total {firestore_slots.waits}",
+    ))
+    progress = progress_coalescer.stats()
+    lines.extend((
+        "# HELP progress_updates_total Work order progress updates acknowledged.",
+        "# TYPE progress_updates_total counter",
+        f"progress_updates_total {progress['updates']}",
+        "# HELP progress_writes_total Coalesced progress writes sent to storage.",
+        "# TYPE progress_writes_total counter",
+        f"progress_writes_total {progress['writes']}",
+    ))
+    keys = idempotency.store.stats()
+    lines.extend((
+        "# HELP idempotency_replays_total Retried requests answered with a stored response.",
+        "# TYPE idempotency_replays_total counter",
+        f"idempotency_replays_total {keys['replays']}",
+        "# HELP idempotency_conflicts_total Idempotency-Key requests rejected as in progress or mismatched.",
+        "# TYPE idempotency_conflicts_total counter",
+        f"idempotency_conflicts_total {keys['conflicts']}",
+    ))
+    if write_behind.WRITE_BEHIND_ENABLED:
+        journal = write_behind.journal.stats()
+        lines.extend(Gauge("write_behind_pending", "Journalled writes not yet committed to Firestore.")
+                     .render(journal["pending"]))
+        lines.extend(Gauge("write_behind_oldest_seconds", "Age of the oldest uncommitted write.")
+                     .render(journal["oldestPendingSeconds"]))
+        lines.extend(Gauge("write_behind_dead_letters", "Writes Firestore rejected (dead_letter table).")
+                     .render(journal["deadLetters"]))
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    # Async so the threadpool gauge reads the limiter from the event loop
+    # and a saturated pool cannot delay the scrape.
+    return Response(render(), media_type=CONTENT_TYPE)
@@ -139,6 +139,7 @@ class Asset(BaseModel):
     criticality: str = "medium"
     specifications: Dict = {}
     imageUrl: Optional[str] = None
+    imageThumbUrl: Optional[str] = None
     createdAt: datetime
     updatedAt: datetime
 
@@ -327,6 +328,7 @@ class Location(BaseModel):
     size: int = 0
     floors: int = 0
     imageUrl: Optional[str] = None
+    imageThumbUrl: Optional[str] = None
     assetCount: Optional[int] = 0
     activeWOs: Optional[int] = 0
     createdAt: datetime
@@ -363,6 +365,7 @@ class UserInDB(BaseModel):
     department: str
     phone: str
     active: bool = True
+    tokenVersion: int = 0
     createdAt: datetime
     updatedAt: datetime
 
@@ -381,6 +384,19 @@ class User(BaseModel):
     updatedAt: datetime
 
 
+class TokenRefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class TokenPrincipal(BaseModel):
+    """Caller identity taken from access token claims, without a user lookup"""
+    username: str
+    role: str
+    department: Optional[str] = None
+    sessionId: Optional[str] = None
+    tokenVersion: int = 0
+
+
 # Document Models
 class DocumentCreate(BaseModel):
     name: str
@@ -421,4 +437,28 @@ class Document(BaseModel):
     expiryDate: Optional[datetime] = None
     tags: List[str] = []
     createdAt: datetime
-    updatedAt: datetime
\ No newline at end of file
+    updatedAt: datetime
+
+# Notification Models
+class NotificationSubscription(BaseModel):
+    assignedToMe: bool = True  # alerts for PMs/work orders assigned to the user
+    locations: List[str] = []
+    assetCriticalities: List[str] = []  # critical, high, medium, low
+    kinds: List[str] = []  # pm_due, wo_overdue, low_stock, warranty_expiring; empty = all
+    deliver: bool = True  # False: inbox only, no email/webhook
+
+    def wants(self, kind: str) -> bool:
+        return not self.kinds or kind in self.kinds
+
+
+# Batch Models
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str  # e.g. /api/assets/abc?limit=10
+    headers: Dict[str, str] = {}
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
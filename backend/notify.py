@@ -0,0 +1,352 @@
+"""
+Notification delivery for the alert rules in alerts.py (NOTIFY_ENABLED=1).
+
+Two periodic jobs (see jobs.py) drive it:
+
+- notify_evaluate, every NOTIFY_EVALUATE_SECONDS: runs the rules and
+  records one document per (recipient, event) in the notifications
+  collection. The document id is derived from both, so an alert that is
+  still true on the next run is recognised with one batched read and not
+  sent again. New high-priority alerts are sent at once, one message per
+  recipient per run; the rest wait for the digest.
+- notify_digest, every NOTIFY_DIGEST_SECONDS: sends each recipient one
+  message with everything that waited, so a technician gets at most one
+  digest per hour instead of an email per alert.
+
+A notification is "pending" while its message is queued and becomes
+"sent" only when a notify_deliver job has delivered it. Alerts that no
+configured channel can deliver (no SMTP_HOST or NOTIFY_WEBHOOK_URL, or no
+email address for an smtp-only setup) wait as "digest" and go out with
+the first digest that can deliver them.
+
+Records expire after NOTIFY_RETENTION_DAYS. Give the collection a TTL
+policy so Firestore deletes them:
+
+    gcloud firestore fields ttls update expiresAt \\
+        --collection-group=notifications --enable-ttl
+
+An alert that is still true when its record expires is sent once more.
+
+Every new alert also lands in the recipient's inbox; subscriptions decide
+who else receives it (inbox.py).
+
+Messages go out as notify_deliver jobs, one per channel, so a failing
+webhook is retried without sending the email again. Channels:
+
+- smtp when SMTP_HOST is set (SMTP_PORT, SMTP_USER, SMTP_PASSWORD,
+  SMTP_FROM, SMTP_STARTTLS). Recipients are usernames looked up in the
+  users collection, or plain email addresses. For local testing run
+  `python smtp_sink.py` and set SMTP_HOST=localhost SMTP_PORT=1025;
+- webhook when NOTIFY_WEBHOOK_URL is set: the message is POSTed as JSON.
+
+Other channels can be added with register_channel().
+"""
+import hashlib
+import json
+import logging
+import os
+import smtplib
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+from typing import Dict, Iterable, List, Optional
+
+import inbox
+import jobs
+from alerts import RULES, Alert
+from database import get_database
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_ENABLED = os.environ.get("NOTIFY_ENABLED", "0").lower() in ("1", "true", "yes")
+NOTIFY_EVALUATE_SECONDS = float(os.environ.get("NOTIFY_EVALUATE_SECONDS", "900"))
+NOTIFY_DIGEST_SECONDS = float(os.environ.get("NOTIFY_DIGEST_SECONDS", "3600"))
+NOTIFY_RULES = [rule.strip() for rule in os.environ.get("NOTIFY_RULES", ",".join(RULES)).split(",") if rule.strip()]
+NOTIFY_WEBHOOK_URL = os.environ.get("NOTIFY_WEBHOOK_URL", "")
+NOTIFY_RETENTION_DAYS = int(os.environ.get("NOTIFY_RETENTION_DAYS", "90"))
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_FROM = os.environ.get("SMTP_FROM", "cmms@localhost")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "0").lower() in ("1", "true", "yes")
+
+COLLECTION = "notifications"
+# Firestore limits: 500 writes per batch, 30 values per "in" filter
+BATCH_SIZE = 500
+IN_FILTER_SIZE = 30
+
+
+# -- channels ------------------------------------------------------------------
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class SmtpChannel:
+    name = "smtp"
+
+    def send(self, message: dict) -> None:
+        email = EmailMessage()
+        email["From"] = SMTP_FROM
+        email["To"] = message["email"]
+        email["Subject"] = message["subject"]
+        email.set_content(message["text"])
+        try:
+            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+                if SMTP_STARTTLS:
+                    smtp.starttls()
+                if SMTP_USER:
+                    smtp.login(SMTP_USER, SMTP_PASSWORD)
+                smtp.send_message(email)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+            raise jobs.PermanentJobError(str(e)) from e
+
+
+class WebhookChannel:
+    name = "webhook"
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    def send(self, message: dict) -> None:
+        import requests
+
+        response = requests.post(
+            self.url,
+            data=json.dumps(message, default=_json_default),
+            headers={"Content-Type": "application/json"},
+            timeout=10,
+        )
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            raise jobs.PermanentJobError(f"Webhook rejected the message: HTTP {response.status_code}")
+        response.raise_for_status()
+
+
+CHANNELS: Dict[str, object] = {}
+
+
+def register_channel(channel) -> None:
+    """Adds a channel: any object with a `name` and a send(message) method."""
+    CHANNELS[channel.name] = channel
+
+
+if SMTP_HOST:
+    register_channel(SmtpChannel())
+if NOTIFY_WEBHOOK_URL:
+    register_channel(WebhookChannel(NOTIFY_WEBHOOK_URL))
+
+
+# -- messages ------------------------------------------------------------------
+
+def notification_id(recipient: str, event: str) -> str:
+    return hashlib.sha1(f"{recipient}\n{event}".encode()).hexdigest()
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_emails(db, recipients: Iterable[str]) -> Dict[str, str]:
+    """Email address per recipient; usernames are looked up in users."""
+    emails: Dict[str, str] = {}
+    usernames = []
+    for recipient in set(recipients):
+        if "@" in recipient:
+            emails[recipient] = recipient
+        else:
+            usernames.append(recipient)
+    for chunk in _chunks(sorted(usernames), IN_FILTER_SIZE):
+        for snapshot in db.collection("users").where("username", "in", chunk).stream():
+            user = snapshot.to_dict() or {}
+            if user.get("email") and user.get("active", True):
+                emails[user["username"]] = user["email"]
+    return emails
+
+
+def _format(alerts: List[dict]) -> str:
+    lines = []
+    for alert in sorted(alerts, key=lambda alert: (alert["priority"] != "high", alert["title"])):
+        marker = "[!] " if alert["priority"] == "high" else "- "
+        lines.append(marker + alert["title"])
+    return "\n".join(lines) + "\n"
+
+
+def _message(recipient: str, email: Optional[str], subject: str, alerts: List[dict]) -> dict:
+    return {
+        "recipient": recipient,
+        "email": email,
+        "subject": subject,
+        "text": _format(alerts),
+        "alerts": alerts,
+    }
+
+
+def _channels_for(email: Optional[str]) -> List[str]:
+    return [name for name in CHANNELS if name != "smtp" or email]
+
+
+def _send(messages: List[dict], notification_ids: List[List[str]]) -> int:
+    """
+    Queues one notify_deliver job per message and channel; each job marks
+    the message's notifications sent when it succeeds.
+    """
+    queued = 0
+    for message, ids in zip(messages, notification_ids):
+        for name in _channels_for(message["email"]):
+            jobs.enqueue("notify_deliver", {"channel": name, "message": message, "notifications": ids})
+            queued += 1
+    return queued
+
+
+# -- jobs ----------------------------------------------------------------------
+
+def evaluate(db=None, now: Optional[datetime] = None) -> dict:
+    """
+    Runs the enabled rules, records new (recipient, event) pairs and sends
+    the new high-priority ones. Returns counts for logging.
+    """
+    db = db or get_database()
+    now = now or datetime.utcnow()
+    alerts: List[Alert] = []
+    for name in NOTIFY_RULES:
+        try:
+            alerts.extend(RULES[name](db, now))
+        except Exception:
+            logger.exception("Alert rule %s failed", name)
+
+    subscriptions = inbox.load_subscriptions(db)
+    pairs: Dict[str, tuple] = {}
+    for recipient, alert in inbox.recipients(db, alerts, subscriptions):
+        pairs.setdefault(notification_id(recipient, alert.event), (recipient, alert))
+
+    collection = db.collection(COLLECTION)
+    existing = set()
+    for chunk in _chunks(list(pairs), BATCH_SIZE):
+        existing.update(
+            snapshot.id for snapshot in db.get_all([collection.document(doc_id) for doc_id in chunk])
+            if snapshot.exists
+        )
+    new = [(doc_id, recipient, alert) for doc_id, (recipient, alert) in pairs.items() if doc_id not in existing]
+
+    immediate: Dict[str, List[tuple]] = defaultdict(list)
+    for doc_id, recipient, alert in new:
+        subscription = subscriptions.get(inbox.inbox_id(recipient))
+        if alert.priority == "high" and (subscription is None or subscription.deliver):
+            immediate[recipient].append((doc_id, alert.to_dict()))
+    emails = resolve_emails(db, immediate) if immediate and CHANNELS else {}
+    deliverable = {recipient for recipient in immediate if _channels_for(emails.get(recipient))}
+
+    # Per item: its delivery record, its inbox item and at most one counter
+    expires = now + timedelta(days=NOTIFY_RETENTION_DAYS)
+    for chunk in _chunks(new, BATCH_SIZE // 3):
+        batch = db.batch()
+        for doc_id, recipient, alert in chunk:
+            subscription = subscriptions.get(inbox.inbox_id(recipient))
+            if subscription is not None and not subscription.deliver:
+                status = "inbox"
+            elif alert.priority == "high" and recipient in deliverable:
+                status = "pending"
+            else:
+                status = "digest"
+            batch.set(collection.document(doc_id), {
+                **alert.to_dict(),
+                "recipient": recipient,
+                "status": status,
+                "createdAt": now,
+                "sentAt": None,
+                "expiresAt": expires,
+            })
+        inbox.add_items(db, batch, chunk, now)
+        batch.commit()
+
+    messages, ids = [], []
+    for recipient in sorted(deliverable):
+        items = [item for _, item in immediate[recipient]]
+        messages.append(_message(recipient, emails.get(recipient),
+                                 items[0]["title"] if len(items) == 1 else f"{len(items)} new maintenance alerts",
+                                 items))
+        ids.append([doc_id for doc_id, _ in immediate[recipient]])
+    summary = {"alerts": len(alerts), "new": len(new), "queued": _send(messages, ids)}
+    if len(deliverable) < len(immediate):
+        logger.warning("No channel can deliver alerts to %d recipients; they wait for a digest",
+                       len(immediate) - len(deliverable))
+    logger.info("Alert evaluation: %s", summary)
+    return summary
+
+
+def send_digests(db=None, now: Optional[datetime] = None) -> dict:
+    """
+    Queues one message per recipient with their waiting alerts. Alerts of
+    recipients no channel can reach keep waiting.
+    """
+    db = db or get_database()
+    now = now or datetime.utcnow()
+    waiting: Dict[str, List] = defaultdict(list)
+    for snapshot in db.collection(COLLECTION).where("status", "==", "digest").stream():
+        data = snapshot.to_dict() or {}
+        waiting[data.get("recipient", "")].append(snapshot)
+    waiting.pop("", None)
+    emails = resolve_emails(db, waiting) if waiting and CHANNELS else {}
+    waiting = {recipient: group for recipient, group in waiting.items() if _channels_for(emails.get(recipient))}
+    if not waiting:
+        return {"recipients": 0, "alerts": 0, "queued": 0}
+
+    messages, ids = [], []
+    for recipient, snapshots in waiting.items():
+        items = [
+            {key: value for key, value in (snapshot.to_dict() or {}).items()
+             if key not in ("recipient", "status", "createdAt", "sentAt", "expiresAt")}
+            for snapshot in snapshots
+        ]
+        messages.append(_message(recipient, emails.get(recipient), f"Maintenance digest: {len(items)} alerts", items))
+        ids.append([snapshot.id for snapshot in snapshots])
+    # Queue before marking: a crash in between repeats a digest rather than losing it
+    queued = _send(messages, ids)
+
+    snapshots = [snapshot for group in waiting.values() for snapshot in group]
+    for chunk in _chunks(snapshots, BATCH_SIZE):
+        batch = db.batch()
+        for snapshot in chunk:
+            batch.update(snapshot.reference, {"status": "pending"})
+        batch.commit()
+    summary = {"recipients": len(waiting), "alerts": len(snapshots), "queued": queued}
+    logger.info("Notification digests: %s", summary)
+    return summary
+
+
+def _mark_sent(notification_ids: List[str]) -> None:
+    db = get_database()
+    collection = db.collection(COLLECTION)
+    now = datetime.utcnow()
+    for chunk in _chunks(notification_ids, BATCH_SIZE):
+        batch = db.batch()
+        for doc_id in chunk:
+            batch.update(collection.document(doc_id), {"status": "sent", "sentAt": now})
+        try:
+            batch.commit()
+        except Exception:
+            # One record that expired meanwhile fails the batch; mark the rest
+            for doc_id in chunk:
+                try:
+                    collection.document(doc_id).update({"status": "sent", "sentAt": now})
+                except Exception as e:
+                    logger.warning("Could not mark notification %s sent: %s", doc_id, e)
+
+
+def deliver(payload: dict) -> None:
+    channel = CHANNELS.get(payload["channel"])
+    if channel is None:
+        raise jobs.PermanentJobError(f"Notification channel {payload['channel']!r} is not configured")
+    channel.send(payload["message"])
+    _mark_sent(payload.get("notifications") or [])
+
+
+jobs.queue.register("notify_deliver", deliver, concurrency=4)
+if NOTIFY_ENABLED:
+    jobs.queue.register("notify_evaluate", lambda payload: evaluate(), every=NOTIFY_EVALUATE_SECONDS)
+    jobs.queue.register("notify_digest", lambda payload: send_digests(), every=NOTIFY_DIGEST_SECONDS)
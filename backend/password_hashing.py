@@ -0,0 +1,168 @@
+"""
+bcrypt hashing and verification off the request threadpool.
+
+bcrypt is deliberately CPU-heavy; running it inline in sync routes lets a
+burst of logins occupy every AnyIO worker thread and stall unrelated API
+calls. Hashes are computed in a small dedicated process pool instead, with
+an admission limit: once PASSWORD_QUEUE_LIMIT operations are in flight,
+further logins are rejected immediately with 429 and a Retry-After hint
+rather than queueing behind each other.
+
+The cost factor is set with BCRYPT_ROUNDS. Hashes stored with a different
+cost are transparently re-hashed the next time the user logs in.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("PASSWORD_QUEUE_LIMIT", str(PASSWORD_WORKERS * 8)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_in_flight = 0
+# Exponentially weighted average of one bcrypt operation, used for Retry-After
+_avg_seconds = 0.25
+
+
+@lru_cache(maxsize=None)
+def _context(rounds: int) -> "CryptContext":
+    # Imported here: only the pool processes (and the first login) need it.
+    from passlib.context import CryptContext
+
+    # Pinning min and max to the configured cost makes needs_update() flag
+    # stored hashes of any other cost, in either direction.
+    return CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds,
+    )
+
+
+# -- process pool side ------------------------------------------------------
+
+def _hash(password: str, rounds: int) -> Tuple[str, float]:
+    started = time.perf_counter()
+    hashed = _context(rounds).hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _verify_and_update(password: str, hashed: str, rounds: int) -> Tuple[bool, Optional[str], float]:
+    started = time.perf_counter()
+    try:
+        ok, new_hash = _context(rounds).verify_and_update(password, hashed)
+    except (ValueError, TypeError):
+        # Malformed or unknown hash format in the users collection
+        ok, new_hash = False, None
+    return ok, new_hash, time.perf_counter() - started
+
+
+# -- request side -----------------------------------------------------------
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+    return _executor
+
+
+def _retry_after() -> int:
+    backlog = _in_flight / max(PASSWORD_WORKERS, 1)
+    return max(1, math.ceil(backlog * _avg_seconds))
+
+
+def _admit() -> None:
+    global _in_flight
+    with _lock:
+        if _in_flight >= PASSWORD_QUEUE_LIMIT:
+            retry_after = _retry_after()
+            logger.warning("Password hashing queue full (%d in flight), shedding request", _in_flight)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts in progress, please retry shortly",
+                headers={"Retry-After": str(retry_after)},
+            )
+        _in_flight += 1
+
+
+def _release(seconds: Optional[float] = None) -> None:
+    global _in_flight, _avg_seconds
+    with _lock:
+        _in_flight -= 1
+        if seconds is not None:
+            _avg_seconds = 0.8 * _avg_seconds + 0.2 * seconds
+
+
+def _submit(fn, *args) -> Future:
+    _admit()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _release()
+        raise
+    future.add_done_callback(
+        lambda f: _release(None if f.cancelled() or f.exception() else f.result()[-1])
+    )
+    return future
+
+
+def hash_password(password: str) -> str:
+    """
+    Hashes a password in the pool. Blocks the calling thread; use
+    hash_password_async from async routes.
+    """
+    return _submit(_hash, password, BCRYPT_ROUNDS).result()[0]
+
+
+async def hash_password_async(password: str) -> str:
+    result = await asyncio.wrap_future(_submit(_hash, password, BCRYPT_ROUNDS))
+    return result[0]
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password in the pool. Returns (ok, new_hash) where new_hash
+    is set when the stored hash should be replaced (cost factor changed).
+    """
+    ok, new_hash, _ = _submit(_verify_and_update, password, hashed, BCRYPT_ROUNDS).result()
+    return ok, new_hash
+
+
+async def verify_and_update_async(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    ok, new_hash, _ = await asyncio.wrap_future(
+        _submit(_verify_and_update, password, hashed, BCRYPT_ROUNDS)
+    )
+    return ok, new_hash
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "workers": PASSWORD_WORKERS,
+            "queueLimit": PASSWORD_QUEUE_LIMIT,
+            "inFlight": _in_flight,
+            "avgSeconds": round(_avg_seconds, 4),
+            "rounds": BCRYPT_ROUNDS,
+        }
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,126 @@
+"""
+Per-worker cache of authenticated principals.
+
+get_current_user would otherwise run a Firestore query for every protected
+request. Resolved UserInDB objects are cached by (username, token version)
+for a short TTL. Entries are dropped early when a users-collection snapshot
+listener reports the user changed; bumping a user's tokenVersion also
+invalidates every token issued before the change.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from models import UserInDB
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "1024"))
+AUTH_CACHE_LISTENER = os.environ.get("AUTH_CACHE_LISTENER", "1").lower() in ("1", "true", "yes")
+
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: float, max_entries: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, UserInDB]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, username: str, token_version: int) -> Optional[UserInDB]:
+        key = (username, token_version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, username: str, token_version: int, user: UserInDB) -> None:
+        with self._lock:
+            self._entries[(username, token_version)] = (time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end((username, token_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, username: Optional[str] = None, user_id: Optional[str] = None) -> None:
+        """
+        Drops every cached version of one user, matched by username or by
+        document id (which also catches entries under a username the user
+        has since been renamed from), or the whole cache.
+        """
+        with self._lock:
+            if username is None and user_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [
+                    key for key, (_, user) in self._entries.items()
+                    if (username is not None and key[0] == username) or (user_id is not None and user.id == user_id)
+                ]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            self.invalidations += removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "ttlSeconds": self.ttl_seconds,
+            }
+
+
+principal_cache = PrincipalCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+
+_watch = None
+
+
+def _on_users_snapshot(col_snapshot, changes, read_time) -> None:
+    for change in changes:
+        # The initial snapshot reports every user as ADDED; only later
+        # modifications and removals can make a cached principal stale.
+        if change.type.name in ("MODIFIED", "REMOVED"):
+            # By id as well: after a rename the event only carries the new username
+            username = (change.document.to_dict() or {}).get("username")
+            principal_cache.invalidate(username, change.document.id)
+
+
+def start_users_listener(db) -> None:
+    """
+    Subscribes to the users collection so role changes and deactivations
+    evict cached principals immediately instead of after the TTL.
+    """
+    global _watch
+    if _watch is not None or not AUTH_CACHE_LISTENER:
+        return
+    try:
+        _watch = db.collection("users").on_snapshot(_on_users_snapshot)
+    except Exception as e:
+        logger.warning("Users snapshot listener unavailable, relying on TTL only: %s", e)
+
+
+def stop_users_listener() -> None:
+    global _watch
+    if _watch is not None:
+        _watch.unsubscribe()
+        _watch = None
@@ -0,0 +1,170 @@
+"""
+Coalesces rapid progress updates to the same document.
+
+Mobile clients post work-order progress on every notes keystroke and
+timer tick. submit() merges each call into a per-document pending update
+(later values win field by field) and answers at once with the document
+as it will be stored. One write per document is made per window
+(PROGRESS_COALESCE_SECONDS, counted from the first update in the window,
+so a steady stream of calls cannot postpone it forever). A change of
+status (e.g. to "completed") is written immediately, together with
+everything pending before it.
+
+Only the first call in a window reads the document; the rest are answered
+from the pending copy. Reads of the document elsewhere should go through
+overlay() so clients see their own acknowledged updates.
+
+Only the progress endpoint goes through here: a full PUT flushes what is
+pending and then writes straight through, so an acknowledged edit is
+never held back.
+
+Pending updates live in the worker's memory. They are flushed on
+shutdown, but a crash loses at most one window of progress (combine with
+WRITE_BEHIND_ENABLED for a durable path), and a write that fails with a
+non-transient error is logged and dropped. With several workers, calls for
+one work order may land on different workers, each coalescing its own
+share; fields are still written in window order per worker.
+"""
+import asyncio
+import copy
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+import write_behind
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_COALESCE_SECONDS = float(os.environ.get("PROGRESS_COALESCE_SECONDS", "2.0"))
+MAX_FLUSH_ATTEMPTS = 5
+
+
+class _Pending:
+    __slots__ = ("reference", "document", "fields", "handle", "attempts")
+
+    def __init__(self, reference, document: dict) -> None:
+        self.reference = reference
+        self.document = document
+        self.fields: dict = {}
+        self.handle: Optional[asyncio.TimerHandle] = None
+        self.attempts = 0
+
+
+class ProgressCoalescer:
+    def __init__(self, window_seconds: float = PROGRESS_COALESCE_SECONDS) -> None:
+        self.window = window_seconds
+        self._pending: Dict[str, _Pending] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.updates = 0
+        self.writes = 0
+
+    async def submit(self, reference, fields: dict, load: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """
+        Queues `fields` (an update dict) for the document behind `reference`
+        and returns the document with every pending update applied, or None
+        when it does not exist. `load` reads the document (with id/_id) and
+        is only awaited when nothing is pending for it.
+        """
+        self.updates += 1
+        if self.window <= 0:
+            current = await load()
+            if current is None:
+                return None
+            self.writes += 1
+            return await write_behind.write(reference, "update", fields, current)
+
+        key = reference.path
+        entry = self._pending.get(key)
+        if entry is None:
+            document = await load()
+            if document is None:
+                return None
+            # Another call may have started a window while we were reading
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = _Pending(reference, document)
+                entry.handle = asyncio.get_running_loop().call_later(self.window, self._flush_later, key)
+
+        previous_status = entry.document.get("status")
+        entry.fields.update(fields)
+        entry.document = write_behind.apply_op(entry.document, "update", fields)
+        document = copy.deepcopy(entry.document)
+
+        if "status" in fields and fields["status"] != previous_status:
+            await self.flush(key)
+        return document
+
+    def overlay(self, document: Optional[dict], collection: str = "work_orders") -> Optional[dict]:
+        """Applies pending fields to a document read elsewhere (dict with id)."""
+        if document is None or not self._pending:
+            return document
+        entry = self._pending.get(f"{collection}/{document.get('id') or document.get('_id')}")
+        if entry is None:
+            return document
+        # Copied first: list routes call this from the threadpool
+        return write_behind.apply_op(document, "update", dict(entry.fields))
+
+    async def flush(self, key: str) -> None:
+        """Writes what is pending for `key` (a document path) now."""
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        if entry.handle is not None:
+            entry.handle.cancel()
+        try:
+            await write_behind.write(entry.reference, "update", entry.fields)
+            self.writes += 1
+        except Exception as error:
+            if write_behind.is_transient(error):
+                self._requeue(key, entry)
+            raise
+
+    def discard(self, key: str) -> None:
+        """Drops pending fields, e.g. when the document is deleted."""
+        entry = self._pending.pop(key, None)
+        if entry is not None and entry.handle is not None:
+            entry.handle.cancel()
+
+    async def flush_all(self) -> None:
+        for key in list(self._pending):
+            try:
+                await self.flush(key)
+            except Exception:
+                logger.exception("Could not flush progress for %s", key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush_later(self, key: str) -> None:
+        task = asyncio.ensure_future(self._flush_quietly(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_quietly(self, key: str) -> None:
+        try:
+            await self.flush(key)
+        except Exception:
+            logger.exception("Coalesced progress write for %s failed", key)
+
+    def _requeue(self, key: str, entry: _Pending) -> None:
+        entry.attempts += 1
+        if entry.attempts >= MAX_FLUSH_ATTEMPTS:
+            logger.error("Dropping progress for %s after %d attempts: %s", key, entry.attempts, entry.fields)
+            return
+        newer = self._pending.get(key)
+        if newer is not None:
+            # Fields that arrived meanwhile win over the failed ones
+            newer.fields = {**entry.fields, **newer.fields}
+            return
+        self._pending[key] = entry
+        entry.handle = asyncio.get_running_loop().call_later(self.window, self._flush_later, key)
+
+    def stats(self) -> dict:
+        return {
+            "windowSeconds": self.window,
+            "pending": len(self._pending),
+            "updates": self.updates,
+            "writes": self.writes,
+        }
+
+
+progress_coalescer = ProgressCoalescer()
@@ -0,0 +1,312 @@
+"""
+Token-bucket rate limiting and a Firestore read-quota guard
+(RATE_LIMIT_ENABLED=1; off by default).
+
+Three checks run before a request under /api reaches a router:
+
+- per-client buckets, one per (client, route rule), so a single kiosk
+  polling one endpoint in a loop is throttled without affecting others;
+- optional per-route buckets shared by all clients;
+- a global Firestore reads-per-second budget. It is debited with the
+  documents actually read (reported by firestore_instrumentation), so one
+  request that reads 1000 documents costs 1000 tokens. When the budget is
+  overdrawn, requests are shed until it has refilled.
+
+With FIRESTORE_DAILY_READ_QUOTA set, GET requests are also shed once this
+process has used FIRESTORE_QUOTA_SHED_RATIO of the daily quota, leaving
+the remainder for writes. Counts are per process.
+
+Route rules come from RATE_LIMIT_RULES, a JSON list such as
+[{"method": "GET", "path": "/api/work-orders", "rate": 1, "burst": 5}].
+A rule matches its exact path only, so the list rule above does not
+cover GET /api/work-orders/{id}; add "prefix": true to cover everything
+below the path as well. The longest matching path wins; requests matching
+no rule use RATE_LIMIT_RATE/RATE_LIMIT_BURST per client. Rejected
+requests get a 429 with Retry-After.
+
+Clients are keyed by peer address. Behind a proxy, or when a whole plant
+sits behind one NAT address, set RATE_LIMIT_TRUST_PROXY=1 so the first
+X-Forwarded-For address is used instead.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from firestore_instrumentation import add_observer
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "0").lower() in ("1", "true", "yes")
+RATE_LIMIT_RATE = float(os.environ.get("RATE_LIMIT_RATE", "20"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "100"))
+RATE_LIMIT_TRUST_PROXY = os.environ.get("RATE_LIMIT_TRUST_PROXY", "").lower() in ("1", "true", "yes")
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get("RATE_LIMIT_MAX_CLIENTS", "10000"))
+RATE_LIMIT_PREFIX = os.environ.get("RATE_LIMIT_PREFIX", "/api")
+
+FIRESTORE_READS_PER_SECOND = float(os.environ.get("FIRESTORE_READS_PER_SECOND", "500"))
+FIRESTORE_READS_BURST = float(os.environ.get("FIRESTORE_READS_BURST", "5000"))
+FIRESTORE_DAILY_READ_QUOTA = int(os.environ.get("FIRESTORE_DAILY_READ_QUOTA", "0"))
+FIRESTORE_QUOTA_SHED_RATIO = float(os.environ.get("FIRESTORE_QUOTA_SHED_RATIO", "0.9"))
+# Firestore daily quotas reset at midnight Pacific time
+FIRESTORE_QUOTA_TIMEZONE = os.environ.get("FIRESTORE_QUOTA_TIMEZONE", "America/Los_Angeles")
+
+# Defaults for the list endpoints that can read whole collections; exact
+# paths, so detail reads fall under the per-client default
+DEFAULT_RULES = [
+    {"method": "GET", "path": "/api/work-orders", "rate": 5, "burst": 30},
+    {"method": "GET", "path": "/api/work-orders/stats/summary", "rate": 1, "burst": 5},
+    {"method": "GET", "path": "/api/locations", "rate": 5, "burst": 30},
+    {"method": "GET", "path": "/api/inventory", "rate": 5, "burst": 30},
+]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "_lock")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float = 1.0) -> Tuple[bool, float]:
+        """
+        Takes amount tokens if available. Returns (allowed, retry_after_seconds).
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True, 0.0
+            return False, (amount - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def debit(self, amount: float) -> None:
+        """Charges usage after the fact; the balance may go negative."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+
+    def available(self) -> Tuple[bool, float]:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens > 0:
+                return True, 0.0
+            # Time until at least one whole token is back
+            return False, (1.0 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def is_idle(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens >= self.capacity
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    method: str
+    path: str
+    rate: float
+    burst: float
+    route_rate: Optional[float] = None
+    route_burst: Optional[float] = None
+    prefix: bool = False
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method not in ("*", method):
+            return False
+        base = self.path.rstrip("/")
+        if path.rstrip("/") == base:
+            return True
+        return self.prefix and path.startswith(base + "/")
+
+
+def load_rules() -> List[RouteRule]:
+    raw = os.environ.get("RATE_LIMIT_RULES")
+    try:
+        rules = json.loads(raw) if raw else DEFAULT_RULES
+    except ValueError as e:
+        logger.error(f"Invalid RATE_LIMIT_RULES, using defaults: {e}")
+        rules = DEFAULT_RULES
+    parsed = [
+        RouteRule(
+            method=rule.get("method", "*").upper(),
+            path=rule["path"],
+            rate=float(rule.get("rate", RATE_LIMIT_RATE)),
+            burst=float(rule.get("burst", rule.get("rate", RATE_LIMIT_BURST))),
+            route_rate=rule.get("routeRate"),
+            route_burst=rule.get("routeBurst", rule.get("routeRate")),
+            prefix=bool(rule.get("prefix", False)),
+        )
+        for rule in rules
+    ]
+    # Longest (most specific) path first
+    return sorted(parsed, key=lambda rule: len(rule.path), reverse=True)
+
+
+class ReadQuota:
+    """Tracks Firestore reads for the per-second budget and the daily quota."""
+
+    def __init__(self) -> None:
+        self.budget = TokenBucket(FIRESTORE_READS_PER_SECOND, FIRESTORE_READS_BURST)
+        self.daily_quota = FIRESTORE_DAILY_READ_QUOTA
+        self.daily_reads = 0
+        self._tz = self._load_timezone()
+        self._resets_at = self._next_reset()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_timezone():
+        if ZoneInfo is None:
+            return None
+        try:
+            return ZoneInfo(FIRESTORE_QUOTA_TIMEZONE)
+        except Exception:
+            logger.warning(f"Unknown FIRESTORE_QUOTA_TIMEZONE {FIRESTORE_QUOTA_TIMEZONE!r}, using UTC")
+            return None
+
+    def _next_reset(self) -> float:
+        now = datetime.now(self._tz) if self._tz else datetime.utcnow()
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return time.time() + (midnight - now).total_seconds()
+
+    def observe(self, collection: str, op: str, docs: int, seconds: float) -> None:
+        if op not in ("get", "query"):
+            return
+        self.budget.debit(docs)
+        with self._lock:
+            self._roll_day()
+            self.daily_reads += docs
+
+    def _roll_day(self) -> None:
+        if time.time() >= self._resets_at:
+            self.daily_reads = 0
+            self._resets_at = self._next_reset()
+
+    def check(self, method: str) -> Tuple[bool, float, str]:
+        if self.daily_quota and method == "GET":
+            with self._lock:
+                self._roll_day()
+                if self.daily_reads >= self.daily_quota * FIRESTORE_QUOTA_SHED_RATIO:
+                    return False, max(self._resets_at - time.time(), 1.0), "Daily read quota nearly exhausted"
+        allowed, retry_after = self.budget.available()
+        if not allowed:
+            return False, retry_after, "Database read budget exceeded"
+        return True, 0.0, ""
+
+
+class RateLimiter:
+    def __init__(self, rules: List[RouteRule]) -> None:
+        self.rules = rules
+        self.quota = ReadQuota()
+        self._client_buckets: Dict[Tuple[str, Optional[RouteRule]], TokenBucket] = {}
+        self._route_buckets: Dict[RouteRule, TokenBucket] = {
+            rule: TokenBucket(rule.route_rate, rule.route_burst)
+            for rule in rules if rule.route_rate
+        }
+        self._lock = threading.Lock()
+        self.rejected = {"client": 0, "route": 0, "quota": 0}
+
+    def _rule_for(self, method: str, path: str) -> Optional[RouteRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def _client_bucket(self, client: str, rule: Optional[RouteRule]) -> TokenBucket:
+        key = (client, rule)
+        bucket = self._client_buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                if len(self._client_buckets) >= RATE_LIMIT_MAX_CLIENTS:
+                    self._prune()
+                bucket = self._client_buckets.setdefault(
+                    key,
+                    TokenBucket(rule.rate, rule.burst) if rule else TokenBucket(RATE_LIMIT_RATE, RATE_LIMIT_BURST),
+                )
+        return bucket
+
+    def _prune(self) -> None:
+        # A full bucket carries no state worth keeping
+        for key in [key for key, bucket in self._client_buckets.items() if bucket.is_idle()]:
+            del self._client_buckets[key]
+
+    def check(self, client: str, method: str, path: str) -> Tuple[bool, float, str]:
+        allowed, retry_after, reason = self.quota.check(method)
+        if not allowed:
+            self.rejected["quota"] += 1
+            return allowed, retry_after, reason
+        rule = self._rule_for(method, path)
+        allowed, retry_after = self._client_bucket(client, rule).take()
+        if not allowed:
+            self.rejected["client"] += 1
+            return False, retry_after, "Too many requests"
+        route_bucket = self._route_buckets.get(rule)
+        if route_bucket is not None:
+            allowed, retry_after = route_bucket.take()
+            if not allowed:
+                self.rejected["route"] += 1
+                return False, retry_after, "Endpoint is busy"
+        return True, 0.0, ""
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._client_buckets),
+            "rejected": dict(self.rejected),
+            "readBudget": round(self.quota.budget.tokens, 1),
+            "dailyReads": self.quota.daily_reads,
+            "dailyReadQuota": self.quota.daily_quota,
+        }
+
+
+limiter = RateLimiter(load_rules())
+add_observer(limiter.quota.observe)
+
+
+def client_key(scope: Scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, rate_limiter: RateLimiter = limiter, prefix: str = RATE_LIMIT_PREFIX) -> None:
+        self.app = app
+        self.limiter = rate_limiter
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix) or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        allowed, retry_after, reason = self.limiter.check(client_key(scope), scope["method"], scope["path"])
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+        response = JSONResponse(
+            {"detail": reason},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
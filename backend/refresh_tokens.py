@@ -0,0 +1,188 @@
+"""
+Refresh tokens with rotation and an in-memory revocation list.
+
+Refresh tokens are opaque random strings. Only their SHA-256 is stored,
+in the refresh_tokens collection, keyed by that hash, so a leaked database
+export cannot be replayed. Every refresh rotates the token: the presented
+one is marked used and a new one is issued in the same session ("family").
+Presenting an already-used token means it was copied, so the whole
+session is revoked.
+
+Revoked sessions are recorded in revoked_sessions and mirrored in a
+per-worker set that a background thread reloads every
+REVOCATION_REFRESH_SECONDS (started with the app; without it the set is
+reloaded inline when stale). Access
+tokens carry their session id, so logout and reuse detection take effect
+for stateless access-token checks without a database read per request.
+"""
+import hashlib
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from google.cloud import firestore
+
+from firestore_codec import to_datetime
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+REVOCATION_REFRESH_SECONDS = float(os.environ.get("REVOCATION_REFRESH_SECONDS", "30"))
+
+TOKENS_COLLECTION = "refresh_tokens"
+REVOKED_COLLECTION = "revoked_sessions"
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _invalid(detail: str = "Invalid refresh token") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+class RevocationList:
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        # session id -> expiry of the session's last refresh token; after
+        # that no token of the session can be valid, so the entry can go
+        self._revoked: Dict[str, datetime] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, session_id: str, expires_at: datetime) -> None:
+        with self._lock:
+            self._revoked[session_id] = expires_at
+
+    def is_revoked(self, db, session_id: Optional[str]) -> bool:
+        if not session_id:
+            return False
+        if self._thread is None and time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self.reload(db)
+        return session_id in self._revoked
+
+    def start(self, get_db: Callable[[], object]) -> None:
+        """Reloads the list every refresh_seconds on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(get_db,), name="revocation-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=5)
+
+    def _run(self, get_db: Callable[[], object]) -> None:
+        while True:
+            try:
+                self.reload(get_db())
+            except Exception as e:
+                logger.warning(f"Could not reload revoked sessions: {e}")
+            if self._stop.wait(self.refresh_seconds):
+                return
+
+    def reload(self, db) -> None:
+        now = datetime.utcnow()
+        try:
+            docs = db.collection(REVOKED_COLLECTION).where("expiresAt", ">", now).stream()
+            revoked = {doc.id: to_datetime(doc.to_dict().get("expiresAt")) for doc in docs}
+        except Exception as e:
+            # Keep serving from the last known list rather than failing auth
+            logger.warning(f"Could not reload revoked sessions: {e}")
+            self._loaded_at = time.monotonic()
+            return
+        with self._lock:
+            # Keep local revocations that have not reached Firestore's index yet
+            for session_id, expires_at in self._revoked.items():
+                if expires_at and expires_at > now:
+                    revoked.setdefault(session_id, expires_at)
+            self._revoked = revoked
+            self._loaded_at = time.monotonic()
+
+
+revocation_list = RevocationList(REVOCATION_REFRESH_SECONDS)
+
+
+def issue(db, user, session_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Creates a refresh token for user. Returns (token, session_id); a new
+    session is started unless session_id is given.
+    """
+    token = secrets.token_urlsafe(32)
+    session_id = session_id or uuid.uuid4().hex
+    now = datetime.utcnow()
+    db.collection(TOKENS_COLLECTION).document(_hash_token(token)).set({
+        "username": user.username,
+        "userId": user.id,
+        "sessionId": session_id,
+        "tokenVersion": user.tokenVersion,
+        "used": False,
+        "expiresAt": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "createdAt": now,
+    })
+    return token, session_id
+
+
+def revoke_session(db, session_id: str) -> None:
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    revocation_list.add(session_id, expires_at)
+    db.collection(REVOKED_COLLECTION).document(session_id).set({
+        "expiresAt": expires_at,
+        "revokedAt": firestore.SERVER_TIMESTAMP,
+    })
+
+
+def _claim(transaction, doc_ref) -> dict:
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise _invalid()
+    data = snapshot.to_dict()
+    if not data.get("used"):
+        transaction.update(doc_ref, {"used": True, "usedAt": firestore.SERVER_TIMESTAMP})
+    return data
+
+
+def rotate(db, token: str) -> dict:
+    """
+    Consumes a refresh token and returns its stored record. Raises 401 if
+    the token is unknown, expired, already used or its session was revoked.
+    Reuse of a consumed token revokes the whole session.
+    """
+    doc_ref = db.collection(TOKENS_COLLECTION).document(_hash_token(token))
+    # Mark the token used atomically so two concurrent refreshes with the
+    # same token cannot both succeed.
+    record = firestore.transactional(_claim)(db.transaction(), doc_ref)
+
+    session_id = record.get("sessionId")
+    if record.get("used"):
+        logger.warning(f"Refresh token reuse for {record.get('username')}, revoking session {session_id}")
+        revoke_session(db, session_id)
+        raise _invalid()
+    if revocation_list.is_revoked(db, session_id):
+        raise _invalid()
+    expires_at = to_datetime(record.get("expiresAt"))
+    if expires_at is None or expires_at <= datetime.utcnow():
+        raise _invalid("Refresh token expired")
+    return record
+
+
+def revoke(db, token: str) -> None:
+    """Revokes the session a refresh token belongs to (logout)."""
+    snapshot = db.collection(TOKENS_COLLECTION).document(_hash_token(token)).get()
+    if snapshot.exists:
+        revoke_session(db, snapshot.to_dict().get("sessionId"))
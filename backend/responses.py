@@ -0,0 +1,96 @@
+"""
+Opt-in fast JSON response path.
+
+With FAST_JSON=1 the list endpoints bypass FastAPI's generic
+validate -> jsonable_encoder -> json.dumps pipeline:
+
+- each response model gets one precompiled TypeAdapter that validates and
+  serializes straight to JSON bytes in pydantic-core;
+- with FAST_JSON_TRUST_STORED=1, documents that were validated by the
+  Create/Update models on write are not re-validated on read and are
+  encoded directly with orjson.
+
+The same flag switches the app to ORJSONResponse and enables response
+compression (see compression.py). The default path is untouched.
+orjson is optional: without it FAST_JSON keeps the stock JSONResponse and
+trusted rows are encoded with json.dumps.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, List
+
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+from firestore_cost import record_rows
+
+try:
+    import orjson
+except ImportError:  # fall back to the stock JSONResponse and json.dumps
+    orjson = None
+
+FAST_JSON = os.environ.get("FAST_JSON", "").lower() in ("1", "true", "yes")
+TRUST_STORED = os.environ.get("FAST_JSON_TRUST_STORED", "").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+DefaultResponseClass = ORJSONResponse if orjson is not None else JSONResponse
+
+
+@lru_cache(maxsize=None)
+def adapter_for(response_type: Any) -> TypeAdapter:
+    """
+    Returns the compiled TypeAdapter for a response type, building it once.
+    """
+    return TypeAdapter(response_type)
+
+
+def precompile(*models) -> None:
+    # Build list adapters at import time so the first request doesn't pay
+    # for schema compilation.
+    for model in models:
+        adapter_for(List[model])
+        adapter_for(model)
+
+
+def _default(value: Any) -> Any:
+    # Firestore hands back datetime subclasses (DatetimeWithNanoseconds)
+    # that orjson refuses to serialize natively.
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def encode_trusted(data: Any) -> bytes:
+    if orjson is None:
+        return json.dumps(data, default=_default, separators=(",", ":")).encode()
+    return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def encode_model(response_type: Any, data: Any) -> bytes:
+    adapter = adapter_for(response_type)
+    return adapter.dump_json(adapter.validate_python(data), by_alias=True)
+
+
+def list_response(model, rows: List[dict], validated: bool = TRUST_STORED):
+    """
+    Returns rows for a List[model] endpoint. Without FAST_JSON the rows are
+    returned unchanged for FastAPI's response_model handling; with it, a
+    ready-encoded JSON Response is returned instead.
+    """
+    record_rows(len(rows))
+    if not FAST_JSON:
+        return rows
+    body = encode_trusted(rows) if validated else encode_model(List[model], rows)
+    return Response(content=body, media_type="application/json")
+
+
+def encoded_list_response(model, rows: List[dict], validated: bool = TRUST_STORED) -> Response:
+    """
+    Like list_response, but always returns ready-encoded JSON, whatever
+    FAST_JSON says. For async routes that call it in the threadpool:
+    FastAPI would otherwise validate and encode the rows on the event loop.
+    """
+    record_rows(len(rows))
+    body = encode_trusted(rows) if FAST_JSON and validated else encode_model(List[model], rows)
+    return Response(content=body, media_type="application/json")
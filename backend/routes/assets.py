@@ -1,55 +1,40 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional, Dict, Any
-from datetime import date, datetime
+from datetime import datetime
 import logging
-import os
-import uuid
-from pathlib import Path
 from models import Asset, AssetCreate, AssetUpdate
-from database import get_database, generate_unique_number, add_timestamps, doc_with_id
+from database import get_database, get_async_database, generate_unique_number, add_timestamps, doc_with_id
+from responses import encoded_list_response, precompile
+from uploads import MAX_IMAGE_BYTES, IMAGE_TYPES
+from blob_store import store_upload, release
+from images import attach_thumbnail_url, schedule_derivatives
+from firestore_codec import codec_for
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/assets", tags=["Assets"])
-
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOADS_DIR = BASE_DIR / "uploads"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-ASSETS_IMAGES_DIR = UPLOADS_DIR / "assets"
-ASSETS_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-
-
-def _datetime_from_date(value: Optional[date]) -> Optional[datetime]:
-    if value and isinstance(value, date) and not isinstance(value, datetime):
-        return datetime.combine(value, datetime.min.time())
-    return value
+precompile(Asset)
+_codec = codec_for(Asset)
 
 
 def _serialize_asset_for_response(asset_dict: Dict[str, Any]) -> Dict[str, Any]:
-    date_fields = [
-        "purchaseDate",
-        "installDate",
-        "warrantyExpiry",
-        "lastMaintenance",
-        "nextMaintenance",
-        "createdAt",
-        "updatedAt",
-    ]
-    for field in date_fields:
-        value = asset_dict.get(field)
-        if isinstance(value, datetime):
-            asset_dict[field] = value.date().isoformat()
-    return asset_dict
+    return attach_thumbnail_url(_codec.decode(asset_dict))
+
+def _asset_list_response(assets: List[Dict[str, Any]]):
+    # Decoding, a thumbnail stat() per row, validation and encoding of up
+    # to 1000 rows; runs in the threadpool
+    return encoded_list_response(Asset, [_serialize_asset_for_response(asset) for asset in assets])
 
 @router.get("", response_model=List[Asset])
-def list_assets(
+async def list_assets(
     location: Optional[str] = None,
     status: Optional[str] = None,
     category: Optional[str] = None,
-    limit: Optional[int] = 100,
+    limit: Optional[int] = Query(100, le=1000),
 ):
-    db = get_database()
+    db = await get_async_database()
 
     query = db.collection("assets")
     if location:
@@ -61,30 +46,29 @@ def list_assets(
     if limit:
         query = query.limit(limit)
 
-    documents = query.stream()
     assets = []
-    for doc in documents:
+    async for doc in query.stream():
         asset = doc_with_id(doc)
         if asset:
             assets.append(asset)
 
-    return assets
+    return await run_in_threadpool(_asset_list_response, assets)
 
 @router.get("/{asset_id}", response_model=Asset)
-def get_asset(asset_id: str):
-    db = get_database()
+async def get_asset(asset_id: str):
+    db = await get_async_database()
 
-    doc = db.collection("assets").document(asset_id).get()
+    doc = await db.collection("assets").document(asset_id).get()
     asset = doc_with_id(doc)
 
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    return asset
+    return _serialize_asset_for_response(asset)
 
 @router.post("", response_model=Asset)
-def create_asset(asset: AssetCreate):
+async def create_asset(asset: AssetCreate):
     try:
-        db = get_database()
+        db = await get_async_database()
         assets_collection = db.collection("assets")
 
         asset_dict = asset.model_dump()
@@ -96,15 +80,13 @@ def create_asset(asset: AssetCreate):
         asset_dict["specifications"] = asset_dict.get("specifications") or {}
 
         today = datetime.utcnow().date()
-        asset_dict["purchaseDate"] = _datetime_from_date(asset_dict.get("purchaseDate") or today)
-        asset_dict["installDate"] = _datetime_from_date(asset_dict.get("installDate") or today)
-        asset_dict["warrantyExpiry"] = _datetime_from_date(asset_dict.get("warrantyExpiry") or today)
+        asset_dict["purchaseDate"] = asset_dict.get("purchaseDate") or today
+        asset_dict["installDate"] = asset_dict.get("installDate") or today
+        asset_dict["warrantyExpiry"] = asset_dict.get("warrantyExpiry") or today
 
         if asset_dict.get("assetNumber") and str(asset_dict["assetNumber"]).strip():
             provided_number = str(asset_dict["assetNumber"]).strip()
-            existing_docs = list(
-                assets_collection.where("assetNumber", "==", provided_number).limit(1).stream()
-            )
+            existing_docs = await assets_collection.where("assetNumber", "==", provided_number).limit(1).get()
             if existing_docs:
                 raise HTTPException(status_code=400, detail="Asset number already exists")
             asset_dict["assetNumber"] = provided_number
@@ -115,12 +97,12 @@ def create_asset(asset: AssetCreate):
         asset_dict["condition"] = "good"
         asset_dict["maintenanceCost"] = 0
         asset_dict["downtime"] = 0
-        asset_dict = add_timestamps(asset_dict)
+        asset_dict = _codec.encode(add_timestamps(asset_dict))
 
         asset_ref = assets_collection.document()
         asset_dict["_id"] = asset_ref.id
         asset_dict["id"] = asset_ref.id
-        asset_ref.set(asset_dict)
+        await asset_ref.set(asset_dict)
 
         return _serialize_asset_for_response(asset_dict)
     except HTTPException:
@@ -130,39 +112,40 @@ def create_asset(asset: AssetCreate):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.put("/{asset_id}", response_model=Asset)
-def update_asset(asset_id: str, asset: AssetUpdate):
-    db = get_database()
+async def update_asset(asset_id: str, asset: AssetUpdate):
+    db = await get_async_database()
 
     asset_ref = db.collection("assets").document(asset_id)
-    existing = asset_ref.get()
+    existing = await asset_ref.get()
     if not existing.exists:
         raise HTTPException(status_code=404, detail="Asset not found")
+    previous_image_url = (existing.to_dict() or {}).get("imageUrl")
 
     update_dict = {k: v for k, v in asset.dict(exclude_unset=True).items() if v is not None}
 
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    date_fields = ["purchaseDate", "installDate", "warrantyExpiry", "lastMaintenance", "nextMaintenance"]
-    for field in date_fields:
-        if field in update_dict:
-            update_dict[field] = _datetime_from_date(update_dict[field])
-
-    update_dict = add_timestamps(update_dict, is_update=True)
+    update_dict = _codec.encode(add_timestamps(update_dict, is_update=True))
 
-    asset_ref.update(update_dict)
-    updated_asset = doc_with_id(asset_ref.get())
+    await asset_ref.update(update_dict)
+    if "imageUrl" in update_dict and update_dict["imageUrl"] != previous_image_url:
+        await run_in_threadpool(release, previous_image_url)
+    updated_asset = doc_with_id(await asset_ref.get())
     return _serialize_asset_for_response(updated_asset)
 
 @router.delete("/{asset_id}")
-def delete_asset(asset_id: str):
-    db = get_database()
+async def delete_asset(asset_id: str):
+    db = await get_async_database()
 
     asset_ref = db.collection("assets").document(asset_id)
-    if not asset_ref.get().exists:
+    existing = await asset_ref.get()
+    if not existing.exists:
         raise HTTPException(status_code=404, detail="Asset not found")
 
-    asset_ref.delete()
+    await asset_ref.delete()
+    # blob_store is file I/O plus sync Firestore calls
+    await run_in_threadpool(release, (existing.to_dict() or {}).get("imageUrl"))
     return {"message": "Asset deleted successfully"}
 
 # Image upload endpoint for existing assets
@@ -174,23 +157,22 @@ def upload_asset_image(asset_id: str, file: UploadFile = File(...)):
     asset = doc_with_id(asset_ref.get())
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    
-    # Save file to disk with correct extension
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    # Ensure we have a valid extension
-    if not file_extension:
-        file_extension = ".jpg"  # default to jpg
-    
-    file_name = f"{asset_id}_{uuid.uuid4()}{file_extension}"
-    file_path = ASSETS_IMAGES_DIR / file_name
-    
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-    
+
+    stored = store_upload(
+        file,
+        max_bytes=MAX_IMAGE_BYTES,
+        default_extension=".jpg",
+        allowed_types=IMAGE_TYPES,
+    )
+    if stored.created:
+        schedule_derivatives(stored.path)
+
     # Update asset with image URL (relative path for static file serving)
-    image_url = f"/uploads/assets/{file_name}"
+    image_url = stored.url
     asset_ref.update({"imageUrl": image_url, "updatedAt": datetime.utcnow()})
+    # The asset keeps a single reference: drop the previous image, or the
+    # duplicate reference when the same picture was uploaded again
+    release(asset.get("imageUrl"))
     updated_asset = doc_with_id(asset_ref.get())
 
     return {"imageUrl": image_url, "asset": _serialize_asset_for_response(updated_asset)}
@@ -199,18 +181,16 @@ def upload_asset_image(asset_id: str, file: UploadFile = File(...)):
 @router.post("/upload")
 def upload_asset_file(file: UploadFile = File(...)):
     """
-    Accepts an image upload and stores it under /uploads/assets.
+    Accepts an image upload and stores it in the shared blob store.
     Returns the public URL that can be persisted on the Asset document.
     """
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="File is required")
-
-    file_extension = os.path.splitext(file.filename)[1] or ".jpg"
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = ASSETS_IMAGES_DIR / unique_filename
-
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-
-    return {"url": f"/uploads/assets/{unique_filename}"}
\ No newline at end of file
+    stored = store_upload(
+        file,
+        max_bytes=MAX_IMAGE_BYTES,
+        default_extension=".jpg",
+        allowed_types=IMAGE_TYPES,
+    )
+    if stored.created:
+        schedule_derivatives(stored.path)
+
+    return {"url": stored.url}
\ No newline at end of file
@@ -1,15 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from typing import List
+from typing import List, Optional
 import os
+import logging
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from models import UserCreate, UserInDB, User
+from models import UserCreate, UserInDB, User, TokenRefreshRequest, TokenPrincipal
 from database import get_database, generate_unique_number, add_timestamps, doc_with_id
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from principal_cache import principal_cache, start_users_listener
+import password_hashing
+import refresh_tokens
 
 # JWT configuration
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -17,17 +18,24 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token", auto_error=False)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 # Available roles
 ROLES = ["Administrator", "Engineering Manager", "CEO", "DGM", "Supervisor", "Technician", "Electrician"]
+# The only role an unauthenticated caller can register with
+SELF_REGISTRATION_ROLE = "Technician"
 
+# bcrypt runs in password_hashing's process pool, never on the request thread
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    ok, _ = password_hashing.verify_and_update(plain_password, hashed_password)
+    return ok
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -39,6 +47,27 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _token_response(db, user: UserInDB, session_id: str = None):
+    refresh_token, session_id = refresh_tokens.issue(db, user, session_id)
+    # Role and department ride along in the token so authorization checks
+    # (see require_roles) can be answered without reading the user.
+    access_token = create_access_token(
+        data={
+            "sub": user.username,
+            "role": user.role,
+            "department": user.department,
+            "ver": user.tokenVersion,
+            "sid": session_id,
+        },
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
 def get_user(db, username: str):
     users = db.collection("users").where("username", "==", username).limit(1).stream()
     for user_doc in users:
@@ -46,16 +75,27 @@ def get_user(db, username: str):
         if user_data:
             return UserInDB(**user_data)
 
-def authenticate_user(db, username: str, password: str):
-    user = get_user(db, username)
+def _store_rehashed_password(db, user: UserInDB, new_hash: str):
+    try:
+        db.collection("users").document(user.id).update({"hashed_password": new_hash})
+        user.hashed_password = new_hash
+    except Exception as e:
+        # The old hash still verifies; try again on the next login
+        logger.warning(f"Error updating password hash for {user.username}: {e}")
+
+async def authenticate_user(db, username: str, password: str):
+    user = await run_in_threadpool(get_user, db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    ok, new_hash = await password_hashing.verify_and_update_async(password, user.hashed_password)
+    if not ok:
         return False
+    if new_hash:
+        await run_in_threadpool(_store_rehashed_password, db, user, new_hash)
     return user
 
 @router.post("/register", response_model=User)
-def register_user(user: UserCreate):
+def register_user(user: UserCreate, token: Optional[str] = Depends(optional_oauth2_scheme)):
     db = get_database()
 
     users_collection = db.collection("users")
@@ -80,6 +120,19 @@ def register_user(user: UserCreate):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid role. Must be one of: {', '.join(ROLES)}"
         )
+    # Anyone may sign up as a technician; other roles are granted by an Administrator
+    if user.role != SELF_REGISTRATION_ROLE:
+        if token is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"Registering a {user.role} requires an Administrator",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if _decode_access_token(token).get("role") != "Administrator":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Insufficient permissions"
+            )
     
     # Hash password
     hashed_password = get_password_hash(user.password)
@@ -95,7 +148,8 @@ def register_user(user: UserCreate):
         "role": user.role,
         "department": user.department,
         "phone": user.phone,
-        "active": True
+        "active": True,
+        "tokenVersion": 0
     }
     user_dict = add_timestamps(user_dict)
 
@@ -107,9 +161,10 @@ def register_user(user: UserCreate):
     return User(**{k: v for k, v in user_dict.items() if k != "hashed_password"})
 
 @router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    db = get_database()
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    # The first call may initialise the Firebase client; keep it off the loop
+    db = await run_in_threadpool(get_database)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -122,15 +177,29 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
             detail="User account is deactivated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.role}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return await run_in_threadpool(_token_response, db, user)
 
-# Dependency to get current user
-def get_current_user(token: str = Depends(oauth2_scheme)):
+@router.post("/refresh")
+def refresh_access_token(request: TokenRefreshRequest):
+    db = get_database()
+    record = refresh_tokens.rotate(db, request.refresh_token)
+    user = get_user(db, record["username"])
+    # Deactivation or a bumped tokenVersion also ends refresh sessions
+    if user is None or not user.active or user.tokenVersion != record.get("tokenVersion", 0):
+        refresh_tokens.revoke_session(db, record["sessionId"])
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return _token_response(db, user, record["sessionId"])
+
+@router.post("/logout")
+def logout(request: TokenRefreshRequest):
+    refresh_tokens.revoke(get_database(), request.refresh_token)
+    return {"message": "Logged out successfully"}
+
+def _decode_access_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -138,18 +207,85 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise credentials_exception
-    except JWTError:
+        payload["ver"] = int(payload.get("ver", 0))
+    except (JWTError, TypeError, ValueError):
+        raise credentials_exception
+    session_id = payload.get("sid")
+    if session_id and refresh_tokens.revocation_list.is_revoked(get_database(), session_id):
         raise credentials_exception
+    return payload
+
+def get_token_principal(token: str = Depends(oauth2_scheme)) -> TokenPrincipal:
+    """Identity from the access token's claims alone; no user lookup"""
+    payload = _decode_access_token(token)
+    return TokenPrincipal(
+        username=payload["sub"],
+        role=payload.get("role", ""),
+        department=payload.get("department"),
+        sessionId=payload.get("sid"),
+        tokenVersion=payload["ver"],
+    )
+
+def require_roles(*roles: str):
+    """
+    Dependency factory that allows only the given ROLES, checked against
+    the token claims.
+    """
+    unknown = set(roles) - set(ROLES)
+    if unknown:
+        raise ValueError(f"Unknown roles: {', '.join(sorted(unknown))}")
+
+    def check_role(principal: TokenPrincipal = Depends(get_token_principal)) -> TokenPrincipal:
+        if principal.role not in roles:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Insufficient permissions"
+            )
+        return principal
+
+    return check_role
+
+# Dependency to get current user
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = _decode_access_token(token)
+    username: str = payload["sub"]
+    token_version = payload["ver"]
+
+    user = principal_cache.get(username, token_version)
+    if user is not None:
+        return user
+
     db = get_database()
+    start_users_listener(db)
     user = get_user(db, username=username)
-    if user is None:
+    # A bumped tokenVersion (role change, deactivation) revokes older tokens
+    if user is None or user.tokenVersion != token_version:
         raise credentials_exception
+    principal_cache.put(username, token_version, user)
     return user
 
 def get_current_active_user(current_user: UserInDB = Depends(get_current_user)):
     if not current_user.active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+
+@router.get("/cache-stats")
+def get_principal_cache_stats(principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    """Hit-rate metrics for this worker's authenticated principal cache"""
+    return principal_cache.stats()
+
+@router.get("/hashing-stats")
+def get_password_hashing_stats(principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    """Queue depth and timing of this worker's bcrypt process pool"""
+    return password_hashing.stats()
+
+@router.get("/me", response_model=TokenPrincipal)
+def read_token_principal(principal: TokenPrincipal = Depends(get_token_principal)):
+    return principal
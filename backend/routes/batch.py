@@ -0,0 +1,134 @@
+"""
+POST /api/batch: several API calls in one round trip.
+
+Detail pages need an asset, its work orders, documents, location and
+alerts; over a slow WAN each sequential request pays the latency again.
+The batch endpoint dispatches every sub-request concurrently through the
+ASGI app in-process (middleware included, so rate limits and metrics
+apply per sub-request) and answers with one status, header set and body
+per item, in request order. Sub-requests do not depend on each other.
+
+At most BATCH_MAX_REQUESTS items per batch; items still running after
+BATCH_TIMEOUT_SECONDS are cancelled and reported as 504.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from models import BatchItem, BatchRequest
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "20"))
+BATCH_TIMEOUT_SECONDS = float(os.environ.get("BATCH_TIMEOUT_SECONDS", "10"))
+
+ALLOWED_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+# Taken from the batch request unless the item sets its own
+FORWARDED_HEADERS = ("authorization", "cookie", "user-agent", "x-forwarded-for", "accept-language")
+
+router = APIRouter(prefix="/batch", tags=["Batch"])
+BATCH_PATH = "/api/batch"
+
+
+def _error(item: BatchItem, status: int, detail: str) -> Dict[str, Any]:
+    return {"id": item.id, "status": status, "headers": {}, "body": {"detail": detail}}
+
+
+def _scope_for(parent: Request, item: BatchItem, method: str, body: bytes) -> dict:
+    path, _, query = item.path.partition("?")
+    headers = {name: value for name, value in parent.headers.items() if name in FORWARDED_HEADERS}
+    if item.body is not None:
+        headers["content-type"] = "application/json"
+    headers.update({name.lower(): value for name, value in item.headers.items()})
+    headers["content-length"] = str(len(body))
+    headers.pop("accept-encoding", None)
+    return {
+        "type": "http",
+        "asgi": parent.scope.get("asgi", {"version": "3.0"}),
+        "http_version": parent.scope.get("http_version", "1.1"),
+        "method": method,
+        "scheme": parent.scope.get("scheme", "http"),
+        "server": parent.scope.get("server"),
+        "client": parent.scope.get("client"),
+        "root_path": parent.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+    }
+
+
+async def _dispatch(parent: Request, item: BatchItem) -> Dict[str, Any]:
+    method = item.method.upper()
+    if method not in ALLOWED_METHODS:
+        return _error(item, 405, f"Method {method} is not allowed in a batch")
+    if not item.path.startswith("/api/"):
+        return _error(item, 400, "Only /api paths can be batched")
+    if item.path.split("?")[0].rstrip("/") == BATCH_PATH:
+        return _error(item, 400, "Batches cannot be nested")
+
+    body = json.dumps(item.body).encode() if item.body is not None else b""
+    request_sent = False
+    status = 500
+    headers: Dict[str, str] = {}
+    chunks: List[bytes] = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Nothing more to read; block like an idle client until cancelled
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", []):
+                name = name.decode("latin-1")
+                if name != "content-length":
+                    headers[name] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await parent.app(_scope_for(parent, item, method, body), receive, send)
+
+    content = b"".join(chunks)
+    payload: Optional[Any] = None
+    if content:
+        if headers.get("content-type", "").startswith("application/json"):
+            payload = json.loads(content)
+        else:
+            payload = content.decode("utf-8", errors="replace")
+    return {"id": item.id, "status": status, "headers": headers, "body": payload}
+
+
+@router.post("")
+async def run_batch(batch: BatchRequest, request: Request):
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="No requests in batch")
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+
+    tasks = [asyncio.ensure_future(_dispatch(request, item)) for item in batch.requests]
+    done, pending = await asyncio.wait(tasks, timeout=BATCH_TIMEOUT_SECONDS)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    responses = []
+    for item, task in zip(batch.requests, tasks):
+        if task in pending:
+            responses.append(_error(item, 504, "Timed out"))
+        elif task.exception() is not None:
+            logger.error("Batch item %s %s failed", item.method, item.path, exc_info=task.exception())
+            responses.append(_error(item, 500, "Internal Server Error"))
+        else:
+            responses.append(task.result())
+    return {"responses": responses}
@@ -1,17 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 import os
 from typing import List, Optional
 from datetime import datetime
 from models import Document, DocumentCreate, DocumentUpdate
 from database import get_database, generate_unique_number, add_timestamps, doc_with_id
+from responses import list_response, precompile
+from firestore_codec import codec_for
+from uploads import MAX_DOCUMENT_BYTES
+from blob_store import store_upload, release, sha256_from_reference
+from static_files import build_file_response, REVALIDATE
 
 router = APIRouter(prefix="/documents", tags=["documents"])
-
-# Ensure documents directory exists
-DOCUMENTS_DIR = "uploaded_documents"
-if not os.path.exists(DOCUMENTS_DIR):
-    os.makedirs(DOCUMENTS_DIR)
+precompile(Document)
+_codec = codec_for(Document)
 
 def get_document_collection(db):
     return db.collection("documents")
@@ -31,7 +32,7 @@ def get_documents(
 
     documents = []
     for doc in query.stream():
-        document = doc_with_id(doc)
+        document = _codec.decode(doc_with_id(doc))
         if document:
             documents.append(document)
 
@@ -43,7 +44,7 @@ def get_documents(
             or search_lower in (doc.get("description", "").lower())
         ]
 
-    return documents
+    return list_response(Document, documents)
 
 @router.post("", response_model=Document)
 def upload_document(
@@ -63,14 +64,9 @@ def upload_document(
     # Generate document number
     document_number = generate_unique_number("documents", "DOC")
 
-    # Save file to disk
-    file_extension = os.path.splitext(file.filename)[1]
-    file_name = f"{document_number}{file_extension}"
-    file_path = os.path.join(DOCUMENTS_DIR, file_name)
-
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
+    # Stream file into the shared blob store
+    stored = store_upload(file, max_bytes=MAX_DOCUMENT_BYTES, default_extension="")
+    file_path = stored.url.lstrip("/")
 
     # Parse tags
     parsed_tags = []
@@ -90,10 +86,10 @@ def upload_document(
     
     document_dict = document_data.model_dump()
     document_dict["documentNumber"] = document_number
-    document_dict["fileType"] = file.content_type
+    document_dict["fileType"] = stored.content_type
     document_dict["fileName"] = file.filename
     document_dict["filePath"] = file_path
-    document_dict["fileSize"] = len(content)
+    document_dict["fileSize"] = stored.size
     document_dict["uploadedBy"] = "Current User"  # This should come from auth
     document_dict["uploadedDate"] = datetime.utcnow()
 
@@ -116,7 +112,7 @@ def get_document(
     collection = get_document_collection(db)
 
     doc = collection.document(document_id).get()
-    document = doc_with_id(doc)
+    document = _codec.decode(doc_with_id(doc))
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
@@ -140,7 +136,7 @@ def update_document(
     update_data = add_timestamps(update_data, is_update=True)
 
     doc_ref.update(update_data)
-    updated_document = doc_with_id(doc_ref.get())
+    updated_document = _codec.decode(doc_with_id(doc_ref.get()))
     return updated_document
 
 @router.delete("/{document_id}")
@@ -156,8 +152,10 @@ def delete_document(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Delete file from disk
-    if os.path.exists(document["filePath"]):
+    # Drop the blob reference, or delete legacy files stored outside the blob store
+    if sha256_from_reference(document["filePath"]):
+        release(document["filePath"])
+    elif os.path.exists(document["filePath"]):
         os.remove(document["filePath"])
 
     doc_ref.delete()
@@ -166,6 +164,7 @@ def delete_document(
 @router.get("/{document_id}/download")
 def download_document(
     document_id: str,
+    request: Request,
     db=Depends(get_database)
 ):
     """Download a document file"""
@@ -179,15 +178,18 @@ def download_document(
     if not os.path.exists(document["filePath"]):
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(
-        path=document["filePath"],
+    return build_file_response(
+        request.headers,
+        document["filePath"],
         filename=document["fileName"],
-        media_type=document["fileType"]
+        media_type=document["fileType"],
+        cache_control=REVALIDATE,
     )
 
 @router.get("/{document_id}/view")
 def view_document(
     document_id: str,
+    request: Request,
     db=Depends(get_database)
 ):
     """View a document file (for supported formats)"""
@@ -201,7 +203,9 @@ def view_document(
     if not os.path.exists(document["filePath"]):
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(
-        path=document["filePath"],
-        media_type=document["fileType"]
+    return build_file_response(
+        request.headers,
+        document["filePath"],
+        media_type=document["fileType"],
+        cache_control=REVALIDATE,
     )
\ No newline at end of file
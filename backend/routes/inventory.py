@@ -3,8 +3,12 @@ from typing import List, Optional
 from datetime import datetime, date
 from models import InventoryItem, InventoryItemCreate, InventoryItemUpdate
 from database import get_database, add_timestamps, doc_with_id
+from responses import list_response, precompile
+from firestore_codec import codec_for
 
 router = APIRouter(prefix="/inventory", tags=["Inventory"])
+precompile(InventoryItem)
+_codec = codec_for(InventoryItem)
 
 @router.get("", response_model=List[InventoryItem])
 def list_inventory(
@@ -29,18 +33,18 @@ def list_inventory(
 
     inventory_items = []
     for doc in documents:
-        item = doc_with_id(doc)
+        item = _codec.decode(doc_with_id(doc))
         if item:
             inventory_items.append(item)
 
-    return inventory_items
+    return list_response(InventoryItem, inventory_items)
 
 @router.get("/{item_id}", response_model=InventoryItem)
 def get_inventory_item(item_id: str):
     db = get_database()
 
     doc = db.collection("inventory").document(item_id).get()
-    item = doc_with_id(doc)
+    item = _codec.decode(doc_with_id(doc))
 
     if not item:
         raise HTTPException(status_code=404, detail="Inventory item not found")
@@ -79,10 +83,10 @@ def update_inventory_item(item_id: str, item: InventoryItemUpdate):
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    update_dict = add_timestamps(update_dict, is_update=True)
+    update_dict = _codec.encode(add_timestamps(update_dict, is_update=True))
     item_ref.update(update_dict)
 
-    updated_item = doc_with_id(item_ref.get())
+    updated_item = _codec.decode(doc_with_id(item_ref.get()))
     return updated_item
 
 @router.delete("/{item_id}")
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+
+from jobs import queue
+from models import TokenPrincipal
+from routes.auth import require_roles
+
+router = APIRouter(prefix="/admin/jobs", tags=["Admin"])
+
+
+@router.get("")
+async def get_job_stats(principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    """Queue depth, waiting and run times, and dead jobs per job type."""
+    return await run_in_threadpool(queue.stats)
+
+
+@router.get("/dead")
+async def list_dead_jobs(limit: int = Query(100, ge=1, le=1000),
+                         principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    return await run_in_threadpool(queue.dead_jobs, limit)
+
+
+@router.post("/dead/{job_id}/retry")
+async def retry_dead_job(job_id: int, principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    if not await run_in_threadpool(queue.retry_dead, job_id):
+        raise HTTPException(status_code=404, detail="Dead job not found")
+    return {"id": job_id, "status": "queued"}
@@ -1,62 +1,78 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from typing import List, Optional
 from datetime import datetime
-import os
-import uuid
-from pathlib import Path
 
 from models import Location, LocationCreate, LocationUpdate
-from database import get_database, generate_unique_number, add_timestamps
+from database import get_async_database, generate_unique_number, add_timestamps
+from responses import encoded_list_response, precompile
+from firestore_codec import codec_for
+from uploads import MAX_IMAGE_BYTES, IMAGE_TYPES
+from blob_store import store_upload, store_upload_async, release
+from images import attach_thumbnail_url, schedule_derivatives
 
 router = APIRouter(prefix="/locations", tags=["Locations"])
+precompile(Location)
+_codec = codec_for(Location)
 
-# Ensure locations images directory exists
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOADS_DIR = BASE_DIR / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
-LOCATIONS_IMAGES_DIR = UPLOADS_DIR / "locations"
-LOCATIONS_IMAGES_DIR.mkdir(exist_ok=True)
+# Locations whose count queries may run at once in one list request
+LIST_COUNT_CONCURRENCY = 16
 
 
-def _count_assets_for_location(db, location_id: str) -> int:
+async def _count_assets_for_location(db, location_id: str) -> int:
     try:
-        return sum(1 for _ in db.collection("assets").where("location", "==", location_id).stream())
+        count = 0
+        async for _ in db.collection("assets").where("location", "==", location_id).stream():
+            count += 1
+        return count
     except Exception:
         return 0
 
 
-def _count_active_work_orders(db, location_id: str) -> int:
+async def _count_active_work_orders(db, location_id: str) -> int:
     try:
         active_statuses = {"open", "in-progress"}
-        work_orders = db.collection("work_orders").where("location", "==", location_id).stream()
-        return sum(1 for doc in work_orders if doc.to_dict().get("status") in active_statuses)
+        count = 0
+        async for doc in db.collection("work_orders").where("location", "==", location_id).stream():
+            if doc.to_dict().get("status") in active_statuses:
+                count += 1
+        return count
     except Exception:
         return 0
 
 
-def _attach_location_counts(db, location_data: dict) -> dict:
+async def _attach_location_counts(db, location_data: dict, thumbnail: bool = True) -> dict:
     location_id = location_data.get("id") or location_data.get("_id")
     if not location_id:
         return location_data
-    location_data["assetCount"] = _count_assets_for_location(db, location_id)
-    location_data["activeWOs"] = _count_active_work_orders(db, location_id)
-    return location_data
+    location_data["assetCount"], location_data["activeWOs"] = await asyncio.gather(
+        _count_assets_for_location(db, location_id),
+        _count_active_work_orders(db, location_id),
+    )
+    return attach_thumbnail_url(location_data) if thumbnail else location_data
+
+
+def _location_list_response(results: List[dict]):
+    # Stat()s each thumbnail, then validates and encodes up to 1000 rows
+    for location in results:
+        attach_thumbnail_url(location)
+    return encoded_list_response(Location, results)
 
 
 @router.get("", response_model=List[Location])
-def list_locations(
+async def list_locations(
     type: Optional[str] = None,
     limit: Optional[int] = Query(100, le=1000),
     skip: Optional[int] = 0
 ):
     try:
-        db = get_database()
+        db = await get_async_database()
         
-        docs = db.collection('locations').stream()
         results = []
-        for doc in docs:
-            data = doc.to_dict()
+        async for doc in db.collection('locations').stream():
+            data = _codec.decode(doc.to_dict())
             data['id'] = doc.id
             data['_id'] = doc.id
             results.append(data)
@@ -71,35 +87,43 @@ def list_locations(
         if limit:
             results = results[:limit]
             
-        # Attach counts
-        for location in results:
-            try:
-                _attach_location_counts(db, location)
-            except Exception as e:
+        # Attach counts, a bounded number of locations at a time (each
+        # streams its assets and work orders)
+        slots = asyncio.Semaphore(LIST_COUNT_CONCURRENCY)
+
+        async def attach_counts(location: dict) -> dict:
+            async with slots:
+                return await _attach_location_counts(db, location, thumbnail=False)
+
+        outcomes = await asyncio.gather(
+            *(attach_counts(location) for location in results), return_exceptions=True
+        )
+        for location, outcome in zip(results, outcomes):
+            if isinstance(outcome, Exception):
                 # If there's an error attaching counts, just continue with default values
                 location["assetCount"] = location.get("assetCount", 0)
                 location["activeWOs"] = location.get("activeWOs", 0)
         
-        return results
+        return await run_in_threadpool(_location_list_response, results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list locations: {str(e)}")
 
 
 @router.get("/{location_id}", response_model=Location)
-def get_location(location_id: str):
+async def get_location(location_id: str):
     try:
-        db = get_database()
+        db = await get_async_database()
         
-        doc = db.collection("locations").document(location_id).get()
+        doc = await db.collection("locations").document(location_id).get()
         if not doc.exists:
             raise HTTPException(status_code=404, detail="Location not found")
         
-        data = doc.to_dict()
+        data = _codec.decode(doc.to_dict())
         data['id'] = doc.id
         data['_id'] = doc.id
         
         try:
-            _attach_location_counts(db, data)
+            await _attach_location_counts(db, data)
         except Exception as e:
             # If there's an error attaching counts, just continue with default values
             data["assetCount"] = data.get("assetCount", 0)
@@ -111,14 +135,14 @@ def get_location(location_id: str):
 
 
 @router.post("", response_model=Location)
-def create_location(location: LocationCreate):
+async def create_location(location: LocationCreate):
     try:
-        db = get_database()
+        db = await get_async_database()
         
         loc_dict = location.dict()
         loc_dict["locationId"] = generate_unique_number("locations", "LOC")
         loc_dict = add_timestamps(loc_dict)
-        update_time, doc_ref = db.collection('locations').add(loc_dict)
+        update_time, doc_ref = await db.collection('locations').add(loc_dict)
         loc_dict['id'] = doc_ref.id
         loc_dict['_id'] = doc_ref.id
         
@@ -126,18 +150,18 @@ def create_location(location: LocationCreate):
         loc_dict["assetCount"] = 0
         loc_dict["activeWOs"] = 0
         
-        return loc_dict
+        return attach_thumbnail_url(loc_dict)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create location: {str(e)}")
 
 
 @router.put("/{location_id}", response_model=Location)
-def update_location(location_id: str, location: LocationUpdate):
+async def update_location(location_id: str, location: LocationUpdate):
     try:
-        db = get_database()
+        db = await get_async_database()
         
         location_ref = db.collection("locations").document(location_id)
-        doc = location_ref.get()
+        doc = await location_ref.get()
         if not doc.exists:
             raise HTTPException(status_code=404, detail="Location not found")
         
@@ -148,16 +172,19 @@ def update_location(location_id: str, location: LocationUpdate):
         
         update_dict = add_timestamps(update_dict, is_update=True)
         
-        location_ref.update(update_dict)
+        await location_ref.update(update_dict)
+        previous_image_url = (doc.to_dict() or {}).get("imageUrl")
+        if "imageUrl" in update_dict and update_dict["imageUrl"] != previous_image_url:
+            await run_in_threadpool(release, previous_image_url)
         
         # Get updated data
-        updated_doc = location_ref.get()
-        updated_data = updated_doc.to_dict()
+        updated_doc = await location_ref.get()
+        updated_data = _codec.decode(updated_doc.to_dict())
         updated_data['id'] = updated_doc.id
         updated_data['_id'] = updated_doc.id
         
         try:
-            _attach_location_counts(db, updated_data)
+            await _attach_location_counts(db, updated_data)
         except Exception as e:
             # If there's an error attaching counts, just continue with default values
             updated_data["assetCount"] = updated_data.get("assetCount", 0)
@@ -169,57 +196,63 @@ def update_location(location_id: str, location: LocationUpdate):
 
 
 @router.delete("/{location_id}")
-def delete_location(location_id: str):
+async def delete_location(location_id: str):
     try:
-        db = get_database()
+        db = await get_async_database()
         
         location_ref = db.collection("locations").document(location_id)
-        if not location_ref.get().exists:
+        doc = await location_ref.get()
+        if not doc.exists:
             raise HTTPException(status_code=404, detail="Location not found")
         
-        location_ref.delete()
+        await location_ref.delete()
+        await run_in_threadpool(release, (doc.to_dict() or {}).get("imageUrl"))
         return {"message": "Location deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete location: {str(e)}")
 
 
 @router.post("/{location_id}/upload-image")
-def upload_location_image(location_id: str, file: UploadFile = File(...)):
+async def upload_location_image(location_id: str, file: UploadFile = File(...)):
     try:
-        db = get_database()
+        db = await get_async_database()
         
         location_ref = db.collection("locations").document(location_id)
-        doc = location_ref.get()
+        doc = await location_ref.get()
         if not doc.exists:
             raise HTTPException(status_code=404, detail="Location not found")
         
-        # Save file to disk with unique filename
-        file_extension = os.path.splitext(file.filename)[1] or ".jpg"
-        unique_filename = f"{location_id}_{uuid.uuid4()}{file_extension}"
-        file_path = LOCATIONS_IMAGES_DIR / unique_filename
-        
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
+        # Stream file into the shared blob store
+        stored = await store_upload_async(
+            file,
+            max_bytes=MAX_IMAGE_BYTES,
+            default_extension=".jpg",
+            allowed_types=IMAGE_TYPES,
+        )
+        if stored.created:
+            schedule_derivatives(stored.path)
         
-        # Update location with image URL
-        image_url = f"/uploads/locations/{unique_filename}"
-        location_ref.update({"imageUrl": image_url, "updatedAt": datetime.utcnow()})
+        # Update location with image URL, dropping the reference to the old one
+        image_url = stored.url
+        await location_ref.update({"imageUrl": image_url, "updatedAt": datetime.utcnow()})
+        await run_in_threadpool(release, (doc.to_dict() or {}).get("imageUrl"))
         
         # Get updated location data
-        updated_doc = location_ref.get()
-        updated_data = updated_doc.to_dict()
+        updated_doc = await location_ref.get()
+        updated_data = _codec.decode(updated_doc.to_dict())
         updated_data['id'] = updated_doc.id
         updated_data['_id'] = updated_doc.id
         
         try:
-            _attach_location_counts(db, updated_data)
+            await _attach_location_counts(db, updated_data)
         except Exception as e:
             # If there's an error attaching counts, just continue with default values
             updated_data["assetCount"] = updated_data.get("assetCount", 0)
             updated_data["activeWOs"] = updated_data.get("activeWOs", 0)
         
         return {"imageUrl": image_url, "location": updated_data}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload location image: {str(e)}")
 
@@ -228,17 +261,19 @@ def upload_location_image(location_id: str, file: UploadFile = File(...)):
 @router.post("/upload")
 def upload_image(file: UploadFile = File(...)):
     try:
-        # Save file to disk with unique filename
-        file_extension = os.path.splitext(file.filename)[1] or ".jpg"
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = LOCATIONS_IMAGES_DIR / unique_filename
-        
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
+        # Stream file into the shared blob store
+        stored = store_upload(
+            file,
+            max_bytes=MAX_IMAGE_BYTES,
+            default_extension=".jpg",
+            allowed_types=IMAGE_TYPES,
+        )
+        if stored.created:
+            schedule_derivatives(stored.path)
         
         # Return the image URL
-        image_url = f"/uploads/locations/{unique_filename}"
-        return {"imageUrl": image_url}
+        return {"imageUrl": stored.url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
\ No newline at end of file
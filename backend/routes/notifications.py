@@ -1,47 +1,41 @@
+import asyncio
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 
-from database import get_database, doc_with_id
+import inbox
+import notify
+from database import get_async_database, get_database, doc_with_id
+from firestore_codec import to_datetime
+from models import NotificationSubscription, TokenPrincipal, UserInDB
+from routes.auth import get_current_active_user, require_roles
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
 
-def _normalize_datetime(value) -> datetime:
-    if isinstance(value, datetime):
-        return value
-    if hasattr(value, "to_datetime"):
-        return value.to_datetime()
-    if value is None:
-        return datetime.utcnow()
-    if hasattr(value, "year"):
-        return datetime.combine(value, datetime.min.time())
-    return datetime.utcnow()
-
-
 @router.get("/alerts")
-def get_upcoming_alerts():
+async def get_upcoming_alerts():
     """
     Return alerts for preventive maintenance schedules that are due within the next three days.
     """
-    db = get_database()
+    db = await get_async_database()
     pm_collection = db.collection("preventive_maintenance")
 
     now = datetime.utcnow()
     horizon = now + timedelta(days=3)
     alerts: List[Dict[str, Any]] = []
 
-    for pm in pm_collection.stream():
+    async for pm in pm_collection.stream():
         pm_data = doc_with_id(pm)
         if not pm_data:
             continue
 
-        next_due = pm_data.get("nextDue")
-        if not next_due:
+        due_date = to_datetime(pm_data.get("nextDue"))
+        if due_date is None:
             continue
 
-        due_date = _normalize_datetime(next_due)
         if now <= due_date <= horizon:
             days_until = max((due_date - now).days, 0)
             alerts.append(
@@ -59,3 +53,131 @@ def get_upcoming_alerts():
     return alerts
 
 
+# Both scan several whole collections, so only administrators may run them
+@router.post("/evaluate")
+async def evaluate_alerts(principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    """
+    Runs the alert rules now instead of waiting for the next scheduled run
+    and sends new high-priority alerts.
+    """
+    return await run_in_threadpool(notify.evaluate)
+
+
+@router.post("/digest")
+async def send_digests(principal: TokenPrincipal = Depends(require_roles("Administrator"))):
+    """Sends the waiting low-priority alerts now."""
+    return await run_in_threadpool(notify.send_digests)
+
+
+def _mark_item_read(transaction, inbox_ref, item_ref, now: datetime) -> Optional[dict]:
+    from firebase_admin import firestore  # deferred with the client, see database.py
+
+    item = inbox.item_with_id(item_ref.get(transaction=transaction))
+    if item is not None and not item.get("read"):
+        transaction.update(item_ref, {"read": True, "readAt": now})
+        transaction.set(inbox_ref, {"unread": firestore.Increment(-1), "updatedAt": now}, merge=True)
+        item.update(read=True, readAt=now)
+    return item
+
+
+def _mark_page_read(transaction, inbox_ref, now: datetime) -> int:
+    from firebase_admin import firestore
+
+    # 499 items per transaction, leaving room for the counter
+    query = inbox_ref.collection(inbox.ITEMS).where("read", "==", False).limit(499)
+    unread = list(transaction.get(query))
+    for snapshot in unread:
+        transaction.update(snapshot.reference, {"read": True, "readAt": now})
+    if unread:
+        transaction.set(inbox_ref, {"unread": firestore.Increment(-len(unread)), "updatedAt": now}, merge=True)
+    return len(unread)
+
+
+def _inbox_ref(db, username: str):
+    return db.collection(inbox.INBOXES).document(inbox.inbox_id(username))
+
+
+def _check_owner(user: UserInDB, username: str) -> None:
+    if username != user.username and user.role != "Administrator":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+
+@router.get("/inbox")
+async def get_inbox(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: UserInDB = Depends(get_current_active_user),
+):
+    """
+    The signed-in user's alerts, newest first, with the unread count. Pass
+    the returned nextCursor to get the next page.
+    """
+    db = await get_async_database()
+    inbox_ref = _inbox_ref(db, user.username)
+    query = inbox_ref.collection(inbox.ITEMS).order_by("sortKey", direction="DESCENDING")
+    if cursor:
+        query = query.start_after({"sortKey": cursor})
+    snapshots, counters = await asyncio.gather(query.limit(limit).get(), inbox_ref.get())
+
+    items = [inbox.item_with_id(snapshot) for snapshot in snapshots]
+    counts = counters.to_dict() if counters.exists else {}
+    return {
+        "items": items,
+        "unread": counts.get("unread", 0),
+        "total": counts.get("total", 0),
+        "nextCursor": items[-1]["sortKey"] if len(items) == limit else None,
+    }
+
+
+@router.post("/inbox/read-all")
+def mark_inbox_read(user: UserInDB = Depends(get_current_active_user)):
+    """
+    Marks every unread item read. Items are flipped and the counter
+    decremented in the same transaction, so concurrent or retried calls
+    cannot count an item twice.
+    """
+    from firebase_admin import firestore
+
+    db = get_database()
+    inbox_ref = _inbox_ref(db, user.username)
+    now = datetime.utcnow()
+    marked = 0
+    while True:
+        count = firestore.transactional(_mark_page_read)(db.transaction(), inbox_ref, now)
+        marked += count
+        if count < 499:
+            return {"marked": marked}
+
+
+@router.post("/inbox/{item_id}/read")
+def mark_inbox_item_read(item_id: str, user: UserInDB = Depends(get_current_active_user)):
+    from firebase_admin import firestore
+
+    db = get_database()
+    inbox_ref = _inbox_ref(db, user.username)
+    item_ref = inbox_ref.collection(inbox.ITEMS).document(item_id)
+    item = firestore.transactional(_mark_item_read)(db.transaction(), inbox_ref, item_ref, datetime.utcnow())
+    if item is None:
+        raise HTTPException(status_code=404, detail="Inbox item not found")
+    return item
+
+
+@router.get("/subscriptions/{username}", response_model=NotificationSubscription)
+async def get_subscription(username: str, user: UserInDB = Depends(get_current_active_user)):
+    _check_owner(user, username)
+    db = await get_async_database()
+    snapshot = await db.collection(inbox.SUBSCRIPTIONS).document(inbox.inbox_id(username)).get()
+    # Users without a subscription get the defaults: their own assignments
+    return NotificationSubscription(**(snapshot.to_dict() if snapshot.exists else {}))
+
+
+@router.put("/subscriptions/{username}", response_model=NotificationSubscription)
+async def update_subscription(
+    username: str,
+    subscription: NotificationSubscription,
+    user: UserInDB = Depends(get_current_active_user),
+):
+    _check_owner(user, username)
+    db = await get_async_database()
+    await db.collection(inbox.SUBSCRIPTIONS).document(inbox.inbox_id(username)).set(subscription.model_dump())
+    return subscription
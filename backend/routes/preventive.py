@@ -4,20 +4,11 @@ from typing import Dict, Any
 from fastapi import APIRouter, HTTPException
 
 from database import get_database, generate_unique_number, add_timestamps, doc_with_id
+from firestore_codec import to_datetime
 
 router = APIRouter(prefix="/pm", tags=["Preventive Maintenance"])
 
 
-def _ensure_datetime(value) -> datetime:
-    if isinstance(value, datetime):
-        return value
-    if hasattr(value, "to_datetime"):
-        return value.to_datetime()
-    if value is None:
-        return datetime.utcnow()
-    return datetime.combine(value, datetime.min.time()) if hasattr(value, "year") else datetime.utcnow()
-
-
 @router.post("/{pm_id}/generate-wo")
 def generate_work_order_from_pm(pm_id: str):
     """
@@ -35,7 +26,7 @@ def generate_work_order_from_pm(pm_id: str):
     work_orders = db.collection("work_orders")
     wo_number = generate_unique_number("work_orders", "WO")
 
-    due_date = _ensure_datetime(pm_data.get("nextDue"))
+    due_date = to_datetime(pm_data.get("nextDue")) or datetime.utcnow()
     estimated_time = pm_data.get("estimatedDuration", 0)
     parts_required = pm_data.get("partsRequired") or []
     tasks = pm_data.get("tasks") or []
@@ -1,20 +1,17 @@
 from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import datetime
-import os
-import uuid
-from pathlib import Path
 from models import ServiceRequest, ServiceRequestCreate, ServiceRequestUpdate
 from database import get_database, generate_unique_number, add_timestamps, doc_with_id
+from responses import list_response, precompile
+from firestore_codec import codec_for
+from uploads import MAX_ATTACHMENT_BYTES
+from blob_store import store_upload_async
 
 router = APIRouter(prefix="/service-requests", tags=["Service Requests"])
-
-# Create uploads directory for service requests
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOADS_DIR = BASE_DIR / "uploads"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-SERVICE_REQUESTS_UPLOADS_DIR = UPLOADS_DIR / "service_requests"
-SERVICE_REQUESTS_UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+precompile(ServiceRequest)
+_codec = codec_for(ServiceRequest)
 
 @router.get("", response_model=List[ServiceRequest])
 def list_service_requests(
@@ -42,18 +39,18 @@ def list_service_requests(
 
     results = []
     for doc in documents:
-        sr = doc_with_id(doc)
+        sr = _codec.decode(doc_with_id(doc))
         if sr:
             results.append(sr)
 
-    return results
+    return list_response(ServiceRequest, results)
 
 @router.get("/{service_request_id}", response_model=ServiceRequest)
 def get_service_request(service_request_id: str):
     db = get_database()
 
     doc = db.collection("service_requests").document(service_request_id).get()
-    sr = doc_with_id(doc)
+    sr = _codec.decode(doc_with_id(doc))
 
     if not sr:
         raise HTTPException(status_code=404, detail="Service request not found")
@@ -95,7 +92,7 @@ def update_service_request(service_request_id: str, service_request: ServiceRequ
     update_dict = add_timestamps(update_dict, is_update=True)
     sr_ref.update(update_dict)
 
-    updated = doc_with_id(sr_ref.get())
+    updated = _codec.decode(doc_with_id(sr_ref.get()))
     return updated
 
 @router.delete("/{service_request_id}")
@@ -118,24 +115,17 @@ async def upload_service_request_file(service_request_id: str, file: UploadFile
     """
     db = get_database()
     
-    # Check if service request exists
+    # Check if service request exists (blocking RPC, keep it off the event loop)
     sr_ref = db.collection("service_requests").document(service_request_id)
-    sr_doc = sr_ref.get()
+    sr_doc = await run_in_threadpool(sr_ref.get)
     if not sr_doc.exists:
         raise HTTPException(status_code=404, detail="Service request not found")
     
-    # Save file to local storage with unique name
-    file_extension = os.path.splitext(file.filename)[1] or ".bin"
-    unique_filename = f"{service_request_id}_{uuid.uuid4()}{file_extension}"
-    file_path = SERVICE_REQUESTS_UPLOADS_DIR / unique_filename
-    
-    # Write file to disk
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Stream file into the shared blob store
+    stored = await store_upload_async(file, max_bytes=MAX_ATTACHMENT_BYTES)
     
     # Store file info in Firestore
-    file_url = f"/uploads/service_requests/{unique_filename}"
+    file_url = stored.url
     
     # Get existing attachments or create new list
     sr_data = sr_doc.to_dict()
@@ -146,12 +136,14 @@ async def upload_service_request_file(service_request_id: str, file: UploadFile
         "fileName": file.filename,
         "fileUrl": file_url,
         "uploadedAt": datetime.utcnow(),
-        "fileSize": len(content)
+        "fileSize": stored.size,
+        "contentType": stored.content_type,
+        "sha256": stored.sha256,
     }
     attachments.append(attachment_info)
     
     # Update service request with new attachment
-    sr_ref.update({
+    await run_in_threadpool(sr_ref.update, {
         "attachments": attachments,
         "updatedAt": datetime.utcnow()
     })
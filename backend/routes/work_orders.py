@@ -1,19 +1,88 @@
+import asyncio
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from typing import List, Optional
-from datetime import datetime, date
+from datetime import datetime
 from models import WorkOrder, WorkOrderCreate, WorkOrderUpdate, WorkOrderProgressUpdate
-from database import get_database, generate_unique_number, add_timestamps, doc_with_id
+from database import get_async_database, generate_unique_number, add_timestamps, doc_with_id
+from responses import encoded_list_response, precompile
+from firestore_codec import codec_for, to_datetime
+import write_behind
+from progress_coalescer import progress_coalescer
 
 router = APIRouter(prefix="/work-orders", tags=["Work Orders"])
+precompile(WorkOrder)
+_codec = codec_for(WorkOrder)
+
+def _queued(wo_ref, fields: Optional[dict] = None) -> JSONResponse:
+    # Journalled without reading the work order (Firestore unreachable):
+    # only the id and the written fields are known
+    body = {**(fields or {}), "id": wo_ref.id, "_id": wo_ref.id}
+    return JSONResponse(status_code=202, content=jsonable_encoder(body))
+
+def _unavailable(error: Exception) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"Work order storage is unreachable: {error}")
+
+def sort_newest_first(documents: list) -> list:
+    """Sorts work order snapshots by createdDate, newest first."""
+    documents.sort(
+        key=lambda doc: to_datetime((doc.to_dict() or {}).get("createdDate")) or datetime.min,
+        reverse=True,
+    )
+    return documents
+
+def summarize_work_orders(snapshots: list, now: datetime) -> dict:
+    """Status counts and overdue total for the stats endpoint."""
+    open_count = 0
+    in_progress = 0
+    completed = 0
+    overdue = 0
+
+    for snap in snapshots:
+        data = snap.to_dict() or {}
+        status = data.get("status")
+        due_date = to_datetime(data.get("dueDate"))
+
+        if status == "open":
+            open_count += 1
+        if status == "in-progress":
+            in_progress += 1
+        if status == "completed":
+            completed += 1
+
+        if status in {"open", "in-progress"} and due_date is not None and due_date < now:
+            overdue += 1
+
+    return {
+        "total": len(snapshots),
+        "open": open_count,
+        "inProgress": in_progress,
+        "completed": completed,
+        "overdue": overdue
+    }
+
+def _page_of_work_orders(snapshots: list, skip: Optional[int], limit: Optional[int]) -> List[dict]:
+    documents = sort_newest_first(snapshots)
+    if skip:
+        documents = documents[skip:]
+    if limit:
+        documents = documents[:limit]
+
+    work_orders = []
+    for doc in documents:
+        wo = _codec.decode(progress_coalescer.overlay(doc_with_id(doc)))
+        if wo:
+            work_orders.append(wo)
+    return work_orders
 
 # Helper function to add asset name to work orders using Firestore lookups
-def add_asset_names_to_work_orders(db, work_orders: List[dict]):
+async def add_asset_names_to_work_orders(db, work_orders: List[dict]):
     asset_ids = {wo.get("assetId") for wo in work_orders if wo.get("assetId")}
-    asset_name_map = {}
-    for asset_id in asset_ids:
-        doc = db.collection("assets").document(asset_id).get()
-        if doc.exists:
-            asset_name_map[asset_id] = doc.to_dict().get("name")
+    # One concurrent get per distinct asset
+    docs = await asyncio.gather(*(db.collection("assets").document(asset_id).get() for asset_id in asset_ids))
+    asset_name_map = {doc.id: doc.to_dict().get("name") for doc in docs if doc.exists}
 
     for wo in work_orders:
         asset_id = wo.get("assetId")
@@ -22,7 +91,7 @@ def add_asset_names_to_work_orders(db, work_orders: List[dict]):
     return work_orders
 
 @router.get("", response_model=List[WorkOrder])
-def list_work_orders(
+async def list_work_orders(
     status: Optional[str] = None,
     priority: Optional[str] = None,
     assignedTo: Optional[str] = None,
@@ -30,7 +99,7 @@ def list_work_orders(
     limit: Optional[int] = Query(100, le=1000),
     skip: Optional[int] = 0
 ):
-    db = get_database()
+    db = await get_async_database()
 
     query = db.collection("work_orders")
     if status:
@@ -42,41 +111,36 @@ def list_work_orders(
     if assetId:
         query = query.where("assetId", "==", assetId)
 
-    documents = list(query.stream())
-    documents.sort(
-        key=lambda doc: (doc.to_dict() or {}).get("createdDate") or datetime.min,
-        reverse=True,
+    # Pending write-behind entries are folded in (no-op when the mode is off)
+    snapshots = await write_behind.overlay(
+        "work_orders", await query.get(),
+        write_behind.equality_match(status=status, priority=priority, assignedTo=assignedTo, assetId=assetId),
     )
-    if skip:
-        documents = documents[skip:]
-    if limit:
-        documents = documents[:limit]
-
-    work_orders = []
-    for doc in documents:
-        wo = doc_with_id(doc)
-        if wo:
-            work_orders.append(wo)
-
-    work_orders = add_asset_names_to_work_orders(db, work_orders)
-    return work_orders
+    # Sorting, decoding, validating and encoding up to 1000 rows is CPU
+    # work; keep it off the event loop
+    work_orders = await run_in_threadpool(_page_of_work_orders, snapshots, skip, limit)
+    work_orders = await add_asset_names_to_work_orders(db, work_orders)
+    return await run_in_threadpool(encoded_list_response, WorkOrder, work_orders)
 
 @router.get("/{work_order_id}", response_model=WorkOrder)
-def get_work_order(work_order_id: str):
-    db = get_database()
+async def get_work_order(work_order_id: str):
+    db = await get_async_database()
 
-    doc = db.collection("work_orders").document(work_order_id).get()
-    wo = doc_with_id(doc)
+    wo_ref = db.collection("work_orders").document(work_order_id)
+    try:
+        wo = _codec.decode(progress_coalescer.overlay(await write_behind.get(wo_ref)))
+    except write_behind.ReadUnavailable as error:
+        raise _unavailable(error)
 
     if not wo:
         raise HTTPException(status_code=404, detail="Work order not found")
 
-    wo_with_asset = add_asset_names_to_work_orders(db, [wo])[0]
+    wo_with_asset = (await add_asset_names_to_work_orders(db, [wo]))[0]
     return wo_with_asset
 
 @router.post("", response_model=WorkOrder)
-def create_work_order(work_order: WorkOrderCreate):
-    db = get_database()
+async def create_work_order(work_order: WorkOrderCreate):
+    db = await get_async_database()
 
     wo_number = generate_unique_number("work_orders", "WO")
 
@@ -87,51 +151,63 @@ def create_work_order(work_order: WorkOrderCreate):
     wo_dict["createdDate"] = datetime.utcnow()
     wo_dict = add_timestamps(wo_dict)
 
+    # The id is assigned locally, so with write-behind on this returns
+    # without waiting for Firestore
     doc_ref = db.collection("work_orders").document()
     wo_dict["_id"] = doc_ref.id
     wo_dict["id"] = doc_ref.id
-    doc_ref.set(wo_dict)
+    await write_behind.write(doc_ref, "set", wo_dict)
 
     return wo_dict
 
 @router.put("/{work_order_id}", response_model=WorkOrder)
-def update_work_order(work_order_id: str, work_order: WorkOrderUpdate):
-    db = get_database()
+async def update_work_order(work_order_id: str, work_order: WorkOrderUpdate):
+    db = await get_async_database()
 
     wo_ref = db.collection("work_orders").document(work_order_id)
-    if not wo_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Work order not found")
-
+    # Pending progress goes first so this update is applied on top of it
+    await progress_coalescer.flush(wo_ref.path)
     update_dict = {k: v for k, v in work_order.dict(exclude_unset=True).items() if v is not None}
 
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
 
     update_dict = add_timestamps(update_dict, is_update=True)
-    wo_ref.update(update_dict)
+    try:
+        current = await write_behind.get(wo_ref)
+    except write_behind.ReadUnavailable:
+        await write_behind.write(wo_ref, "update", update_dict)
+        return _queued(wo_ref, update_dict)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Work order not found")
 
-    updated = doc_with_id(wo_ref.get())
+    updated = _codec.decode(await write_behind.write(wo_ref, "update", update_dict, current))
     return updated
 
 @router.delete("/{work_order_id}")
-def delete_work_order(work_order_id: str):
-    db = get_database()
+async def delete_work_order(work_order_id: str):
+    db = await get_async_database()
 
     wo_ref = db.collection("work_orders").document(work_order_id)
-    if not wo_ref.get().exists:
+    try:
+        exists = await write_behind.get(wo_ref) is not None
+    except write_behind.ReadUnavailable:
+        # Deleting a missing document is a no-op, so journal it unchecked
+        exists = None
+    if exists is False:
         raise HTTPException(status_code=404, detail="Work order not found")
 
-    wo_ref.delete()
+    progress_coalescer.discard(wo_ref.path)
+    await write_behind.write(wo_ref, "delete", None)
+    if exists is None:
+        return JSONResponse(status_code=202, content={"message": "Work order deletion queued"})
     return {"message": "Work order deleted successfully"}
 
 @router.post("/{work_order_id}/progress", response_model=WorkOrder)
-def update_work_order_progress(work_order_id: str, progress: WorkOrderProgressUpdate):
-    db = get_database()
+async def update_work_order_progress(work_order_id: str, progress: WorkOrderProgressUpdate):
+    db = await get_async_database()
 
     wo_ref = db.collection("work_orders").document(work_order_id)
-    if not wo_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Work order not found")
-
     update_dict = progress.dict(exclude_unset=True)
     if not update_dict:
         raise HTTPException(status_code=400, detail="No progress fields provided")
@@ -143,48 +219,22 @@ def update_work_order_progress(work_order_id: str, progress: WorkOrderProgressUp
         update_dict["actualTime"] = float(update_dict["actualTime"])
 
     update_dict = add_timestamps(update_dict, is_update=True)
-    wo_ref.update(update_dict)
-
-    updated = doc_with_id(wo_ref.get())
-    return updated
+    # Acknowledged now, written once per coalescing window
+    try:
+        updated = await progress_coalescer.submit(wo_ref, update_dict, lambda: write_behind.get(wo_ref))
+    except write_behind.ReadUnavailable:
+        # No base document to coalesce onto; journal this call as is
+        await write_behind.write(wo_ref, "update", update_dict)
+        return _queued(wo_ref, update_dict)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Work order not found")
+    return _codec.decode(updated)
 
 
 @router.get("/stats/summary")
-def get_work_order_stats():
-    db = get_database()
+async def get_work_order_stats():
+    db = await get_async_database()
 
-    snapshots = list(db.collection("work_orders").stream())
-    now = datetime.utcnow()
-    total = len(snapshots)
-    open_count = 0
-    in_progress = 0
-    completed = 0
-    overdue = 0
-
-    for snap in snapshots:
-        data = snap.to_dict() or {}
-        status = data.get("status")
-        due_date = data.get("dueDate")
-
-        if status == "open":
-            open_count += 1
-        if status == "in-progress":
-            in_progress += 1
-        if status == "completed":
-            completed += 1
-
-        # Handle both datetime and date objects for due_date comparison
-        if status in {"open", "in-progress"} and due_date is not None:
-            # Convert date to datetime for comparison if needed
-            if isinstance(due_date, date) and not isinstance(due_date, datetime):
-                due_date = datetime.combine(due_date, datetime.min.time())
-            if isinstance(due_date, datetime) and due_date < now:
-                overdue += 1
-
-    return {
-        "total": total,
-        "open": open_count,
-        "inProgress": in_progress,
-        "completed": completed,
-        "overdue": overdue
-    }
+    snapshots = await write_behind.overlay("work_orders", await db.collection("work_orders").get())
+    # A pure-CPU pass over the whole collection; keep it off the event loop
+    return await run_in_threadpool(summarize_work_orders, snapshots, datetime.utcnow())
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, APIRouter
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
@@ -15,16 +16,47 @@ from routes.locations import router as locations_router
 from routes.documents import router as documents_router
 from routes.preventive import router as preventive_router
 from routes.notifications import router as notifications_router
-# Auth router එකත් Import කරන්න (කලින් හැදුවා නම්)
-# from routes import auth
+from routes.batch import router as batch_router
+from routes.jobs import router as jobs_router
+from routes.auth import router as auth_router
 
-from database import connect_to_firestore, close_firestore_connection
+# Routers only import their helpers; firebase_admin is loaded by the
+# warm-up thread (database.start_warmup), and nothing touches the disk
+# until init_storage() runs in the startup hook.
+from database import close_firestore_connection, get_database, ping_firestore, readiness, start_warmup
+from images import shutdown_executor
+from principal_cache import stop_users_listener
+import password_hashing
+import refresh_tokens
+from static_files import CachedStaticFiles
+from responses import FAST_JSON, COMPRESSION_MIN_SIZE, DefaultResponseClass
+from compression import CompressionMiddleware
+from rate_limit import RATE_LIMIT_ENABLED, RateLimitMiddleware
+from metrics import MetricsMiddleware, metrics_endpoint
+from firestore_cost import COST_HEADERS, FirestoreCostMiddleware
+from concurrency import configure_threadpool
+from idempotency import IDEMPOTENCY_ENABLED, REPLAYED_HEADER, IdempotencyMiddleware
+import write_behind
+import jobs
+from progress_coalescer import progress_coalescer
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Create the main app
-app = FastAPI()
+# Create the main app (FAST_JSON=1 opts into orjson encoding and compression)
+app = FastAPI(default_response_class=DefaultResponseClass) if FAST_JSON else FastAPI()
+
+# Innermost: Idempotency-Key replays store the route's uncompressed response
+if IDEMPOTENCY_ENABLED:
+    app.add_middleware(IdempotencyMiddleware)
+
+if FAST_JSON:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Per-client/per-route token buckets and the Firestore read budget.
+# Added before CORS so 429 responses still carry CORS headers.
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # CORS Configuration (must run before routers)
 app.add_middleware(
@@ -33,8 +65,18 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=COST_HEADERS + [REPLAYED_HEADER],
 )
 
+# Per-request Firestore reads/writes/RPCs as X-Firestore-* headers and logs
+app.add_middleware(FirestoreCostMiddleware)
+
+# Outermost, so latency and status include everything below (incl. 429s)
+app.add_middleware(MetricsMiddleware)
+
+# Prometheus scrape endpoint (outside /api, so not rate limited)
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -45,15 +87,36 @@ def root():
 # Include the router in the main app
 app.include_router(api_router)
 
-# Serve static uploads directory
+# Liveness: the process is up and serving. No I/O.
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: Firestore has answered within FIRESTORE_READY_CHECK_SECONDS.
+# 503 while the warm-up RPC is still in flight, so load balancers and
+# autoscalers only route to warm workers.
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    ok = readiness.fresh()
+    if not ok and not readiness.warming:
+        ok = await run_in_threadpool(ping_firestore)
+    return JSONResponse(readiness.snapshot(), status_code=200 if ok else 503)
+
+# Serve static uploads directory (UUID/content-addressed names, cached as immutable)
 UPLOADS_DIR = ROOT_DIR / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
+app.mount("/uploads", CachedStaticFiles(directory=str(UPLOADS_DIR), check_dir=False), name="uploads")
 
 # Serve static uploaded_assets directory
 UPLOADED_ASSETS_DIR = ROOT_DIR / "uploaded_assets"
-UPLOADED_ASSETS_DIR.mkdir(exist_ok=True)
-app.mount("/uploaded_assets", StaticFiles(directory=str(UPLOADED_ASSETS_DIR)), name="uploaded_assets")
+app.mount("/uploaded_assets", CachedStaticFiles(directory=str(UPLOADED_ASSETS_DIR), check_dir=False), name="uploaded_assets")
+
+def init_storage():
+    """
+    Creates the directories served above. Called from the startup hook
+    rather than at import, so importing the app has no side effects.
+    """
+    for directory in (UPLOADS_DIR, UPLOADED_ASSETS_DIR):
+        directory.mkdir(exist_ok=True)
 
 # Include the routes
 app.include_router(work_orders_router, prefix="/api")
@@ -64,7 +127,10 @@ app.include_router(locations_router, prefix="/api")
 app.include_router(documents_router, prefix="/api")
 app.include_router(preventive_router, prefix="/api")
 app.include_router(notifications_router, prefix="/api")
-# app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"]) # Auth තිබුනොත් මේක Uncomment කරන්න
+app.include_router(batch_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+# The router carries its own /auth prefix (token URL: /api/auth/token)
+app.include_router(auth_router, prefix="/api")
 
 # Configure logging
 logging.basicConfig(
@@ -75,10 +141,35 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 def startup_db_client():
-    # Firebase Connection (NO await here!)
-    connect_to_firestore()
+    init_storage()
+    # Client creation and the first RPC run in the background; /readyz
+    # reports when they are done.
+    start_warmup()
+    # WRITE_BEHIND_ENABLED: flusher for the local write journal
+    write_behind.start()
+    # JOBS_ENABLED: background job dispatcher (jobs.py)
+    jobs.start()
+    # Revoked refresh sessions, reloaded off the request path
+    refresh_tokens.revocation_list.start(get_database)
+
+@app.on_event("startup")
+async def startup_threadpool():
+    # THREADPOOL_SIZE; async because the limiter belongs to the event loop
+    configure_threadpool()
+
+@app.on_event("shutdown")
+async def shutdown_progress():
+    # Registered first so pending progress reaches the journal before it stops
+    await progress_coalescer.flush_all()
 
 @app.on_event("shutdown")
 def shutdown_db_client():
     # Close Connection (NO await here!)
-    close_firestore_connection()
\ No newline at end of file
+    # Jobs first: they may still write through the journal
+    jobs.stop()
+    write_behind.stop()
+    close_firestore_connection()
+    shutdown_executor()
+    stop_users_listener()
+    refresh_tokens.revocation_list.stop()
+    password_hashing.shutdown_executor()
\ No newline at end of file
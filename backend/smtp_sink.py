@@ -0,0 +1,97 @@
+"""
+Local SMTP sink for testing notification delivery.
+
+Accepts every message and writes it to a directory as an .eml file
+instead of delivering it:
+
+    cd backend
+    python smtp_sink.py --port 1025 --directory data/outbox
+    SMTP_HOST=localhost SMTP_PORT=1025 NOTIFY_ENABLED=1 uvicorn server:app
+
+Speaks just enough SMTP (HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT)
+for smtplib; no TLS or authentication.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+class SmtpSink:
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.received = 0
+
+    def _store(self, data: bytes) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.received += 1
+        path = self.directory / f"{time.time_ns()}-{self.received}.eml"
+        path.write_bytes(data)
+        return path
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 smtp-sink ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip().upper()
+                if command.startswith("EHLO"):
+                    await reply("250-smtp-sink")
+                    await reply("250 8BITMIME")
+                elif command.startswith(("HELO", "MAIL", "RCPT", "RSET", "NOOP")):
+                    await reply("250 OK")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line in (b".\r\n", b".\n"):
+                            break
+                        # Undo dot-stuffing
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    path = self._store(b"".join(lines))
+                    logger.info("Stored message %s", path.name)
+                    await reply("250 OK")
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, directory: Path) -> None:
+    sink = SmtpSink(directory)
+    server = await asyncio.start_server(sink.handle, host, port)
+    logger.info("SMTP sink on %s:%d, writing to %s", host, port, directory)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--directory", type=Path, default=BASE_DIR / "data" / "outbox")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.directory))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Cache-friendly file serving for uploads and document downloads.
+
+Uploaded files are content-addressed or UUID-named and never change in
+place, so the static mounts serve them with a year-long immutable
+Cache-Control and a strong ETag. Every file response also honours
+conditional requests (304), single byte ranges (206) and precompressed
+.br/.gz siblings for text assets.
+"""
+import gzip
+import mimetypes
+import os
+import shutil
+import stat
+from email.utils import formatdate, parsedate
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # .br siblings are only produced when brotli is installed
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+# Siblings are written off the request path (a job, see blob_store.py);
+# brotli 11 is several times slower than 5-6 for a few percent on uploads
+PRECOMPRESS_GZIP_LEVEL = int(os.environ.get("PRECOMPRESS_GZIP_LEVEL", "6"))
+PRECOMPRESS_BROTLI_QUALITY = int(os.environ.get("PRECOMPRESS_BROTLI_QUALITY", "5"))
+PRECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# Content-Encoding -> sibling suffix, in order of preference
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def precompress(path: Path) -> None:
+    """
+    Writes .gz (and .br when available) siblings next to a text asset,
+    streaming in chunks. Each sibling is written under a temporary name
+    and renamed into place, and is skipped if it would not be smaller
+    than the original.
+    """
+    path = Path(path)
+    size = path.stat().st_size
+
+    gz_path = path.with_name(path.name + ".gz")
+    tmp_path = gz_path.with_name(f".{gz_path.name}.tmp")
+    with open(path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=PRECOMPRESS_GZIP_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, PRECOMPRESS_CHUNK_SIZE)
+    _keep_if_smaller(tmp_path, gz_path, size)
+
+    if brotli is not None:
+        br_path = path.with_name(path.name + ".br")
+        tmp_path = br_path.with_name(f".{br_path.name}.tmp")
+        compressor = brotli.Compressor(quality=PRECOMPRESS_BROTLI_QUALITY)
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            for chunk in iter(lambda: src.read(PRECOMPRESS_CHUNK_SIZE), b""):
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+        _keep_if_smaller(tmp_path, br_path, size)
+
+
+def _keep_if_smaller(tmp_path: Path, sibling: Path, size: int) -> None:
+    if tmp_path.stat().st_size >= size:
+        tmp_path.unlink()
+    else:
+        os.replace(tmp_path, sibling)
+
+
+def strong_etag(path: Path, stat_result: os.stat_result) -> str:
+    # Blob names are the SHA-256 of their content, which makes the perfect
+    # strong validator; anything else falls back to inode metadata.
+    stem = path.name.split(".", 1)[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return f'"{stem}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _accepted_encodings(request_headers: Headers) -> set:
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        token, _, params = part.strip().partition(";")
+        if token and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(token.lower())
+    return accepted
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single "bytes=" range. Returns (start, end) inclusive, or None
+    for anything we serve in full instead (multiple ranges, bad syntax).
+    Raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start = size - int(end_text)
+            end = size - 1
+    except ValueError:
+        return None
+    start = max(start, 0)
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def _is_not_modified(request_headers: Headers, etag: str, last_modified: str) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+    return if_modified_since is not None and if_modified_since >= parsedate(last_modified)
+
+
+class RangeFileResponse(FileResponse):
+    """
+    FileResponse that sends only bytes [start, end] with a 206 status.
+    """
+
+    def __init__(self, path, start: int, end: int, stat_result: os.stat_result, **kwargs) -> None:
+        super().__init__(path, status_code=206, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                more_body = remaining > 0 and len(chunk) > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                if not chunk:
+                    break
+
+
+def build_file_response(
+    request_headers: Headers,
+    path,
+    stat_result: Optional[os.stat_result] = None,
+    *,
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    content_disposition_type: str = "attachment",
+    cache_control: str = IMMUTABLE,
+) -> Response:
+    """
+    Builds a 200/206/304/416 response for a file on disk, picking a
+    precompressed sibling when the client accepts it.
+    """
+    path = Path(path)
+    if stat_result is None:
+        stat_result = os.stat(path)
+    etag = strong_etag(path, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {
+        "cache-control": cache_control,
+        "etag": etag,
+        "last-modified": last_modified,
+        "accept-ranges": "bytes",
+    }
+
+    if media_type is None:
+        media_type = mimetypes.guess_type(filename or path.name)[0] or "text/plain"
+    kwargs = {
+        "media_type": media_type,
+        "filename": filename,
+        "content_disposition_type": content_disposition_type,
+    }
+
+    encoded: Optional[Tuple[Path, os.stat_result]] = None
+    if is_compressible(media_type):
+        headers["vary"] = "Accept-Encoding"
+        accepted = _accepted_encodings(request_headers)
+        for encoding, suffix in _ENCODINGS:
+            if encoding not in accepted:
+                continue
+            sibling = path.with_name(path.name + suffix)
+            try:
+                encoded = (sibling, os.stat(sibling))
+            except FileNotFoundError:
+                continue
+            headers.update({
+                "content-encoding": encoding,
+                "etag": f'{etag[:-1]}-{encoding}"',
+                "accept-ranges": "none",
+            })
+            break
+
+    if _is_not_modified(request_headers, headers["etag"], last_modified):
+        headers.pop("content-encoding", None)
+        return Response(status_code=304, headers=headers)
+
+    if encoded is not None:
+        sibling, sibling_stat = encoded
+        return FileResponse(sibling, headers=headers, stat_result=sibling_stat, **kwargs)
+
+    range_header = request_headers.get("range")
+    if range_header and request_headers.get("if-range", etag) in (etag, last_modified):
+        try:
+            byte_range = _parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{stat_result.st_size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            return RangeFileResponse(path, start, end, stat_result, headers=headers, **kwargs)
+
+    return FileResponse(path, headers=headers, stat_result=stat_result, **kwargs)
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles for immutable uploads: long-lived caching, strong ETags,
+    byte ranges and precompressed siblings. Dot-files (staging/partial
+    uploads) are never served.
+    """
+
+    def __init__(self, *args, cache_control: str = IMMUTABLE, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def lookup_path(self, path: str):
+        if any(part.startswith(".") for part in path.replace("\\", "/").split("/")):
+            return "", None
+        return super().lookup_path(path)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        if not stat.S_ISREG(stat_result.st_mode):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        return build_file_response(
+            Headers(scope=scope),
+            full_path,
+            stat_result,
+            cache_control=self.cache_control,
+        )
@@ -0,0 +1,164 @@
+"""
+Shared upload pipeline for every route that accepts an UploadFile.
+
+Files are streamed in fixed-size chunks into a temporary file next to their
+final location, hashed and sniffed on the way through, and only renamed into
+place once the whole body has been written and is within the route's limit.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+SNIFF_BYTES = 512
+_MB = 1024 * 1024
+
+# Per-route size limits, overridable from the environment (values in MB)
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_UPLOAD_MB", "15")) * _MB
+MAX_DOCUMENT_BYTES = int(os.environ.get("MAX_DOCUMENT_UPLOAD_MB", "50")) * _MB
+MAX_ATTACHMENT_BYTES = int(os.environ.get("MAX_ATTACHMENT_UPLOAD_MB", "25")) * _MB
+
+IMAGE_TYPES = ("image/",)
+
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+]
+
+# Container formats whose real type is better described by the client
+_GENERIC_TYPES = {"application/zip", "application/x-ole-storage", "application/octet-stream"}
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+    content_type: str
+    url: Optional[str] = None
+    created: bool = True
+
+
+def sniff_content_type(head: bytes, declared: Optional[str] = None) -> str:
+    """
+    Detects the content type from the first bytes of a file.
+    Falls back to the client-declared type for generic containers (docx, xlsx).
+    """
+    sniffed = "application/octet-stream"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        sniffed = "image/webp"
+    elif head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        sniffed = "image/heic"
+    else:
+        for signature, content_type in _SIGNATURES:
+            if head.startswith(signature):
+                sniffed = content_type
+                break
+        else:
+            if head and b"\x00" not in head:
+                try:
+                    head.decode("utf-8")
+                    sniffed = "text/plain"
+                except UnicodeDecodeError:
+                    pass
+
+    if sniffed in _GENERIC_TYPES and declared:
+        return declared
+    return sniffed
+
+
+def save_upload(
+    file: UploadFile,
+    dest_dir: Path,
+    stem: str,
+    *,
+    max_bytes: int,
+    default_extension: str = ".bin",
+    allowed_types: Optional[Sequence[str]] = None,
+) -> StoredUpload:
+    """
+    Streams an upload to dest_dir/<stem><ext> without holding it in memory.
+    Blocking: call from a sync route or through save_upload_async.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="File is required")
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    extension = os.path.splitext(file.filename)[1].lower() or default_extension
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp_name = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = file.file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[: SNIFF_BYTES - len(head)]
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+        content_type = sniff_content_type(head, file.content_type)
+        if allowed_types and not content_type.startswith(tuple(allowed_types)):
+            raise HTTPException(status_code=415, detail=f"Unsupported file type: {content_type}")
+
+        final_path = dest_dir / f"{stem}{extension}"
+        os.replace(tmp_name, final_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+    logger.info("Stored upload %s (%d bytes, %s)", final_path.name, size, content_type)
+    return StoredUpload(
+        path=final_path,
+        filename=final_path.name,
+        size=size,
+        sha256=digest.hexdigest(),
+        content_type=content_type,
+    )
+
+
+async def save_upload_async(file: UploadFile, dest_dir: Path, stem: str, **kwargs) -> StoredUpload:
+    """
+    Same as save_upload, but runs the blocking disk I/O in the threadpool so
+    async routes never stall the event loop.
+    """
+    return await run_in_threadpool(save_upload, file, dest_dir, stem, **kwargs)
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size is {max_bytes // _MB} MB",
+    )
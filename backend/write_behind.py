@@ -0,0 +1,630 @@
+"""
+Optional write-behind mode for Firestore writes (WRITE_BEHIND_ENABLED=1).
+
+Writes go through write() and are appended to a local SQLite journal in
+WAL mode. The request returns as soon as the entry is on disk, with the
+id it was assigned locally. A background flusher drains the journal:
+
+- one flusher at a time across worker processes (a lease row in the
+  journal database);
+- entries are coalesced per document (set + update -> set, update +
+  update -> update, anything + delete -> delete, ...) and committed in
+  batches of up to 500 writes;
+- transient errors (unavailable, deadline, aborted, ...) leave the entries
+  in place and back off exponentially; a batch rejected for any other
+  reason is retried one document at a time, and documents that still
+  fail move to the dead_letter table.
+
+Reads through get() and overlay() apply pending entries on top of what
+Firestore returns, so a client sees its own writes before they are
+flushed. get() answers from the journal alone when the pending entries
+start with a full set or a delete. Otherwise it waits at most
+WRITE_BEHIND_READ_TIMEOUT_SECONDS for Firestore and then raises
+ReadUnavailable; routes journal the write anyway and answer 202 without
+the full document. An update of a document that turns out not to exist
+is dead-lettered at flush time.
+
+With the mode off, write() and get() talk to Firestore directly and the
+overlay is a no-op, so routes can use these helpers unconditionally.
+
+Values are stored as JSON (datetimes and dates tagged); Firestore
+sentinels such as SERVER_TIMESTAMP or Increment cannot be journalled.
+"""
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "0") == "1"
+WRITE_BEHIND_PATH = Path(os.environ.get("WRITE_BEHIND_PATH", str(BASE_DIR / "data" / "write_behind.sqlite3")))
+# FULL fsyncs every append; NORMAL survives process crashes but not power loss
+WRITE_BEHIND_SYNC = os.environ.get("WRITE_BEHIND_SYNC", "FULL").upper()
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+BATCH_SIZE = min(int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500")), 500)
+MAX_BACKOFF_SECONDS = float(os.environ.get("WRITE_BEHIND_MAX_BACKOFF_SECONDS", "60"))
+# How long get() waits for Firestore before the caller journals blind
+READ_TIMEOUT_SECONDS = float(os.environ.get("WRITE_BEHIND_READ_TIMEOUT_SECONDS", "1.0"))
+LEASE_SECONDS = 30.0
+
+OPS = ("set", "merge", "update", "delete")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data TEXT,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_doc ON journal (collection, doc_id, seq);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    seq INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data TEXT,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    holder TEXT,
+    expires REAL
+);
+"""
+
+
+# -- encoding ----------------------------------------------------------------
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} values cannot be journalled")
+
+
+def _object_hook(value: dict):
+    if len(value) == 1:
+        if "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if "$date" in value:
+            return date.fromisoformat(value["$date"])
+    return value
+
+
+def encode(data: Optional[dict]) -> Optional[str]:
+    return None if data is None else json.dumps(data, default=_default, separators=(",", ":"))
+
+
+def decode(text: Optional[str]) -> Optional[dict]:
+    return None if text is None else json.loads(text, object_hook=_object_hook)
+
+
+# -- applying and coalescing operations ----------------------------------------
+
+def _deep_merge(target: dict, data: dict) -> dict:
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+def _apply_update(target: dict, data: dict) -> dict:
+    # Keys are field paths; "a.b" updates a nested field
+    for path, value in data.items():
+        node = target
+        *parents, leaf = path.split(".")
+        for part in parents:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[leaf] = copy.deepcopy(value)
+    return target
+
+
+def apply_op(current: Optional[dict], op: str, data: Optional[dict]) -> Optional[dict]:
+    """The document after one write, as Firestore would store it."""
+    if op == "set":
+        return copy.deepcopy(data)
+    if op == "delete":
+        return None
+    if op == "merge":
+        return _deep_merge(copy.deepcopy(current) if current else {}, data)
+    if op == "update":
+        # Firestore rejects updates to missing documents
+        return _apply_update(copy.deepcopy(current), data) if current is not None else None
+    raise ValueError(f"Unknown write-behind op {op!r}")
+
+
+def _paths_overlap(first: Iterable[str], second: Iterable[str]) -> bool:
+    for a in first:
+        for b in second:
+            if a == b or a.startswith(b + ".") or b.startswith(a + "."):
+                return True
+    return False
+
+
+def coalesce(ops: List[Tuple[str, Optional[dict]]]) -> List[Tuple[str, Optional[dict]]]:
+    """
+    Folds the pending writes of one document into as few writes as
+    possible with the same end result. Pairs that cannot be folded safely
+    are kept in order; a batch may write the same document more than once.
+    """
+    folded: List[Tuple[str, Optional[dict]]] = []
+    for op, data in ops:
+        if op in ("set", "delete"):
+            folded = [(op, data)]
+            continue
+        if folded:
+            previous_op, previous = folded[-1]
+            if previous_op == "set":
+                folded[-1] = ("set", apply_op(previous, op, data))
+                continue
+            if previous_op == "delete" and op == "merge":
+                folded[-1] = ("set", copy.deepcopy(data))
+                continue
+            if previous_op == "merge" and op == "merge":
+                folded[-1] = ("merge", _deep_merge(copy.deepcopy(previous), data))
+                continue
+            if previous_op == "update" and op == "update" and not _paths_overlap(
+                [key for key in previous if key not in data], data
+            ):
+                folded[-1] = ("update", {**previous, **data})
+                continue
+        folded.append((op, data))
+    return folded
+
+
+def is_transient(error: Exception) -> bool:
+    try:
+        from google.api_core import exceptions
+    except ImportError:  # pragma: no cover - google-cloud is a hard dependency
+        return isinstance(error, (ConnectionError, TimeoutError))
+    return isinstance(error, (
+        ConnectionError, TimeoutError,
+        exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+        exceptions.TooManyRequests, exceptions.ResourceExhausted, exceptions.Aborted,
+        exceptions.RetryError,
+    ))
+
+
+# -- journal -------------------------------------------------------------------
+
+class PendingSnapshot:
+    """Stands in for a DocumentSnapshot whose data comes from the journal."""
+
+    exists = True
+    reference = None
+
+    def __init__(self, document_id: str, data: dict) -> None:
+        self.id = document_id
+        self._data = data
+
+    def to_dict(self) -> dict:
+        return copy.deepcopy(self._data)
+
+
+class Journal:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._holder = f"{os.getpid()}-{id(self)}"
+        self._backoff = 0.0
+        self.flushed = 0
+        self.coalesced = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # -- connections --
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "pid", None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(f"PRAGMA synchronous={'FULL' if WRITE_BEHIND_SYNC == 'FULL' else 'NORMAL'}")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    # -- request side --
+
+    def append(self, collection: str, doc_id: str, op: str, data: Optional[dict]) -> int:
+        if op not in OPS:
+            raise ValueError(f"Unknown write-behind op {op!r}")
+        cursor = self._connection().execute(
+            "INSERT INTO journal (collection, doc_id, op, data, created_at) VALUES (?, ?, ?, ?, ?)",
+            (collection, doc_id, op, encode(data), time.time()),
+        )
+        if cursor.lastrowid % BATCH_SIZE == 0:
+            self._wake.set()
+        return cursor.lastrowid
+
+    def pending_ops(self, collection: str, doc_id: str) -> List[Tuple[str, Optional[dict]]]:
+        rows = self._connection().execute(
+            "SELECT op, data FROM journal WHERE collection = ? AND doc_id = ? ORDER BY seq",
+            (collection, doc_id),
+        ).fetchall()
+        return [(op, decode(data)) for op, data in rows]
+
+    def pending_documents(self, collection: str) -> Dict[str, List[Tuple[str, Optional[dict]]]]:
+        documents: Dict[str, List[Tuple[str, Optional[dict]]]] = {}
+        for doc_id, op, data in self._connection().execute(
+            "SELECT doc_id, op, data FROM journal WHERE collection = ? ORDER BY seq", (collection,)
+        ):
+            documents.setdefault(doc_id, []).append((op, decode(data)))
+        return documents
+
+    # -- flusher --
+
+    def _acquire_lease(self) -> bool:
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT holder, expires FROM lease WHERE id = 1").fetchone()
+            if row is not None and row[0] != self._holder and row[1] > now:
+                connection.execute("COMMIT")
+                return False
+            connection.execute(
+                "INSERT INTO lease (id, holder, expires) VALUES (1, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET holder = excluded.holder, expires = excluded.expires",
+                (self._holder, now + LEASE_SECONDS),
+            )
+            connection.execute("COMMIT")
+            return True
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _release_lease(self) -> None:
+        self._connection().execute("DELETE FROM lease WHERE id = 1 AND holder = ?", (self._holder,))
+
+    def flush_once(self, db) -> int:
+        """
+        Commits up to 4 x BATCH_SIZE journal entries to `db` (a sync
+        Firestore client). Returns the number of entries removed from the
+        journal. Raises on transient errors, leaving the entries in place.
+        """
+        if not self._acquire_lease():
+            return 0
+        connection = self._connection()
+        rows = connection.execute(
+            "SELECT seq, collection, doc_id, op, data FROM journal ORDER BY seq LIMIT ?", (BATCH_SIZE * 4,)
+        ).fetchall()
+        if not rows:
+            return 0
+
+        # Per document: the seqs it covers and its coalesced writes
+        groups: Dict[Tuple[str, str], Tuple[List[int], List[Tuple[str, Optional[dict]]]]] = {}
+        for seq, collection, doc_id, op, data in rows:
+            seqs, ops = groups.setdefault((collection, doc_id), ([], []))
+            seqs.append(seq)
+            ops.append((op, decode(data)))
+
+        batches: List[List[Tuple[Tuple[str, str], List[int], List[Tuple[str, Optional[dict]]]]]] = [[]]
+        writes_in_batch = 0
+        for key, (seqs, ops) in groups.items():
+            writes = coalesce(ops)
+            if writes_in_batch + len(writes) > BATCH_SIZE and batches[-1]:
+                batches.append([])
+                writes_in_batch = 0
+            batches[-1].append((key, seqs, writes))
+            writes_in_batch += len(writes)
+
+        removed = 0
+        try:
+            for batch in batches:
+                removed += self._flush_batch(db, batch)
+                # Renew the lease; stop if another worker took over
+                if not self._acquire_lease():
+                    break
+        finally:
+            self.flushed += removed
+            self.last_flush_at = time.time()
+        return removed
+
+    def _flush_batch(self, db, batch) -> int:
+        try:
+            self._commit(db, batch)
+        except Exception as error:
+            if is_transient(error):
+                self._record_attempt([seq for _, seqs, _ in batch for seq in seqs], error)
+                raise
+        else:
+            seqs = [seq for _, group_seqs, _ in batch for seq in group_seqs]
+            self._delete(seqs)
+            self.coalesced += len(seqs) - sum(len(writes) for _, _, writes in batch)
+            return len(seqs)
+
+        # One bad document must not hold back the others
+        removed = 0
+        for group in batch:
+            try:
+                self._commit(db, [group])
+            except Exception as error:
+                if is_transient(error):
+                    self._record_attempt(group[1], error)
+                    raise
+                self._dead_letter(group[1], error)
+            else:
+                self._delete(group[1])
+            removed += len(group[1])
+        return removed
+
+    def _commit(self, db, groups) -> None:
+        batch = db.batch()
+        for (collection, doc_id), _, writes in groups:
+            reference = db.collection(collection).document(doc_id)
+            for op, data in writes:
+                if op == "set":
+                    batch.set(reference, data)
+                elif op == "merge":
+                    batch.set(reference, data, merge=True)
+                elif op == "update":
+                    batch.update(reference, data)
+                else:
+                    batch.delete(reference)
+        batch.commit()
+
+    def _executemany(self, sql: str, rows: List[tuple]) -> None:
+        # One transaction (one fsync) for the whole batch
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(sql, rows)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _delete(self, seqs: List[int]) -> None:
+        self._executemany("DELETE FROM journal WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def _record_attempt(self, seqs: List[int], error: Exception) -> None:
+        self._executemany(
+            "UPDATE journal SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+            [(f"{type(error).__name__}: {error}", seq) for seq in seqs],
+        )
+
+    def _dead_letter(self, seqs: List[int], error: Exception) -> None:
+        connection = self._connection()
+        message = f"{type(error).__name__}: {error}"
+        logger.error("Write-behind entries %s rejected by Firestore: %s", seqs, message)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO dead_letter (seq, collection, doc_id, op, data, created_at, failed_at, error) "
+                "SELECT seq, collection, doc_id, op, data, created_at, ?, ? FROM journal WHERE seq = ?",
+                [(time.time(), message, seq) for seq in seqs],
+            )
+            connection.executemany("DELETE FROM journal WHERE seq = ?", [(seq,) for seq in seqs])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _run(self) -> None:
+        from database import get_database
+
+        while not self._stop.is_set():
+            self._wake.wait(self._backoff or FLUSH_INTERVAL_SECONDS)
+            self._wake.clear()
+            try:
+                # Drain while there is a full window left
+                while self.flush_once(get_database()) >= BATCH_SIZE * 4 and not self._stop.is_set():
+                    pass
+            except Exception as error:
+                self.last_error = f"{type(error).__name__}: {error}"
+                self._backoff = min(MAX_BACKOFF_SECONDS, max(FLUSH_INTERVAL_SECONDS, self._backoff * 2))
+                logger.warning("Write-behind flush failed, retrying in %.1fs: %s", self._backoff, self.last_error)
+            else:
+                self._backoff = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._connection()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stops the flusher after one last attempt to drain the journal."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+        try:
+            from database import get_database
+            self.flush_once(get_database())
+        except Exception as error:
+            logger.warning("Write-behind entries left in %s: %s", self.path, error)
+        self._release_lease()
+
+    def reset_after_fork(self) -> None:
+        self._local = threading.local()
+        self._thread = None
+        self._holder = f"{os.getpid()}-{id(self)}"
+
+    def stats(self) -> dict:
+        connection = self._connection()
+        pending, oldest = connection.execute("SELECT COUNT(*), MIN(created_at) FROM journal").fetchone()
+        dead, = connection.execute("SELECT COUNT(*) FROM dead_letter").fetchone()
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "pending": pending,
+            "oldestPendingSeconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "deadLetters": dead,
+            "flushed": self.flushed,
+            "coalesced": self.coalesced,
+            "backoffSeconds": self._backoff,
+            "lastFlushAt": self.last_flush_at,
+            "lastError": self.last_error,
+        }
+
+
+journal = Journal(WRITE_BEHIND_PATH)
+
+
+# -- helpers for routes (async Firestore client) --------------------------------
+
+def _split(reference) -> Tuple[str, str]:
+    collection, doc_id = reference.path.rsplit("/", 1)
+    return collection, doc_id
+
+
+def _with_id(doc_id: str, data: Optional[dict]) -> Optional[dict]:
+    if data is None:
+        return None
+    data = dict(data)
+    data["id"] = doc_id
+    data["_id"] = doc_id  # Maintain compatibility with frontend expecting _id
+    return data
+
+
+def _replay(current: Optional[dict], ops: List[Tuple[str, Optional[dict]]]) -> Optional[dict]:
+    for op, data in ops:
+        current = apply_op(current, op, data)
+    return current
+
+
+class ReadUnavailable(Exception):
+    """Firestore did not answer a read within READ_TIMEOUT_SECONDS."""
+
+
+async def get(reference) -> Optional[dict]:
+    """
+    The document behind an AsyncClient reference with pending writes
+    applied, as a dict with id/_id (like database.doc_with_id), or None.
+    With the mode on, raises ReadUnavailable when the journal cannot
+    answer alone and Firestore is slow or unreachable.
+    """
+    if not WRITE_BEHIND_ENABLED:
+        snapshot = await reference.get()
+        return _with_id(reference.id, snapshot.to_dict() if snapshot.exists else None)
+
+    collection, doc_id = _split(reference)
+    ops = await run_in_threadpool(journal.pending_ops, collection, doc_id)
+    if ops and ops[0][0] in ("set", "delete"):
+        return _with_id(doc_id, _replay(None, ops))
+    try:
+        snapshot = await asyncio.wait_for(reference.get(), READ_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError as error:
+        raise ReadUnavailable(f"No answer for {reference.path} within {READ_TIMEOUT_SECONDS}s") from error
+    except Exception as error:
+        if is_transient(error):
+            raise ReadUnavailable(f"{type(error).__name__}: {error}") from error
+        raise
+    current = snapshot.to_dict() if snapshot.exists else None
+    return _with_id(doc_id, _replay(current, ops))
+
+
+async def write(reference, op: str, data: Optional[dict], current: Optional[dict] = None) -> Optional[dict]:
+    """
+    Writes through the journal (or straight to Firestore with the mode
+    off) and returns the document as it will be stored, computed from
+    `current` (the caller's latest read), with id/_id.
+    """
+    collection, doc_id = _split(reference)
+    if WRITE_BEHIND_ENABLED:
+        # Off the event loop: the append fsyncs
+        await run_in_threadpool(journal.append, collection, doc_id, op, data)
+    elif op == "set":
+        await reference.set(data)
+    elif op == "merge":
+        await reference.set(data, merge=True)
+    elif op == "update":
+        await reference.update(data)
+    elif op == "delete":
+        await reference.delete()
+    else:
+        raise ValueError(f"Unknown write-behind op {op!r}")
+    if current is not None:
+        current = {key: value for key, value in current.items() if key not in ("id", "_id")}
+    return _with_id(doc_id, apply_op(current, op, data))
+
+
+def overlay_snapshots(collection: str, snapshots: List, match: Optional[Callable[[dict], bool]] = None) -> List:
+    """
+    Applies pending writes to query results: updated documents are
+    replaced, deleted ones dropped, and pending documents the query did
+    not return are added when `match` (the query's filters) accepts them.
+    """
+    if not WRITE_BEHIND_ENABLED:
+        return snapshots
+    pending = journal.pending_documents(collection)
+    if not pending:
+        return snapshots
+
+    results = []
+    for snapshot in snapshots:
+        ops = pending.pop(snapshot.id, None)
+        if ops is None:
+            results.append(snapshot)
+            continue
+        data = _replay(snapshot.to_dict(), ops)
+        if data is not None and (match is None or match(data)):
+            results.append(PendingSnapshot(snapshot.id, data))
+    for doc_id, ops in pending.items():
+        # Only documents created locally can be listed without a read
+        if ops[0][0] != "set":
+            continue
+        data = _replay(None, ops)
+        if data is not None and (match is None or match(data)):
+            results.append(PendingSnapshot(doc_id, data))
+    return results
+
+
+async def overlay(collection: str, snapshots: List, match: Optional[Callable[[dict], bool]] = None) -> List:
+    """overlay_snapshots() for async routes; the journal is read in the threadpool."""
+    if not WRITE_BEHIND_ENABLED:
+        return snapshots
+    return await run_in_threadpool(overlay_snapshots, collection, snapshots, match)
+
+
+def equality_match(**filters) -> Optional[Callable[[dict], bool]]:
+    """match= predicate for a query built from == filters (None values ignored)."""
+    active = {field: value for field, value in filters.items() if value is not None}
+    if not active:
+        return None
+    return lambda data: all(data.get(field) == value for field, value in active.items())
+
+
+def start() -> None:
+    if WRITE_BEHIND_ENABLED:
+        journal.start()
+        logger.info("Write-behind journal at %s", WRITE_BEHIND_PATH)
+
+
+def stop() -> None:
+    if WRITE_BEHIND_ENABLED:
+        journal.stop()
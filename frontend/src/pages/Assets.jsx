@@ -410,8 +410,9 @@ const Assets = () => {
                     {asset.imageUrl && (
                       <div className="w-16 h-16 flex-shrink-0">
                         <img
-                          src={`http://localhost:8000${asset.imageUrl}`}
+                          src={`http://localhost:8000${asset.imageThumbUrl || asset.imageUrl}`}
                           alt={asset.name}
+                          loading="lazy"
                           className="w-full h-full object-contain rounded border"
                         />
                       </div>
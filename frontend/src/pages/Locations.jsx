@@ -226,8 +226,9 @@ const Locations = () => {
                   {location.imageUrl ? (
                     <div className="mb-4">
                       <img
-                        src={`http://localhost:8000${location.imageUrl}`}
+                        src={`http://localhost:8000${location.imageThumbUrl || location.imageUrl}`}
                         alt={location.name}
+                        loading="lazy"
                         className="w-full h-48 object-cover rounded-lg"
                       />
                     </div>
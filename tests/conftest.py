@@ -0,0 +1,14 @@
+"""
+Unit tests for the backend modules. Run from the repository root:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# No credentials needed: modules that touch Firestore get the in-memory fake
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+sys.path.insert(0, str(BACKEND_DIR))
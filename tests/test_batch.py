@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from routes import batch
+from routes.batch import router as batch_router
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(batch_router, prefix="/api")
+
+    @app.get("/api/echo")
+    async def echo(request: Request):
+        return {"query": dict(request.query_params), "authorization": request.headers.get("authorization"),
+                "trace": request.headers.get("x-trace")}
+
+    @app.post("/api/echo")
+    async def echo_body(request: Request):
+        return {"method": request.method, "body": await request.json()}
+
+    @app.get("/api/text")
+    async def text():
+        return PlainTextResponse("plain", headers={"X-Custom": "1"})
+
+    @app.get("/api/slow")
+    async def slow():
+        await asyncio.sleep(5)
+        return {}
+
+    @app.get("/api/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        yield client
+
+
+def _run(client, *items, **kwargs):
+    response = client.post("/api/batch", json={"requests": list(items)}, **kwargs)
+    assert response.status_code == 200, response.text
+    return response.json()["responses"]
+
+
+def test_dispatches_items_in_order(client):
+    responses = _run(
+        client,
+        {"id": "a", "path": "/api/echo?limit=5"},
+        {"id": "b", "method": "post", "path": "/api/echo", "body": {"title": "pump"}},
+        {"id": "c", "path": "/api/text"},
+        {"id": "d", "path": "/api/missing"},
+    )
+    assert [response["id"] for response in responses] == ["a", "b", "c", "d"]
+    assert [response["status"] for response in responses] == [200, 200, 200, 404]
+    assert responses[0]["body"]["query"] == {"limit": "5"}
+    assert responses[1]["body"] == {"method": "POST", "body": {"title": "pump"}}
+    assert responses[2]["body"] == "plain"
+    assert responses[2]["headers"]["x-custom"] == "1"
+    assert "content-length" not in responses[2]["headers"]
+
+
+def test_forwards_headers(client):
+    responses = _run(
+        client,
+        {"path": "/api/echo"},
+        {"path": "/api/echo", "headers": {"Authorization": "Bearer item", "X-Trace": "t1"}},
+        headers={"Authorization": "Bearer parent"},
+    )
+    assert responses[0]["body"]["authorization"] == "Bearer parent"
+    assert responses[0]["body"]["trace"] is None
+    assert responses[1]["body"]["authorization"] == "Bearer item"
+    assert responses[1]["body"]["trace"] == "t1"
+
+
+def test_rejects_items_it_cannot_dispatch(client):
+    responses = _run(
+        client,
+        {"method": "OPTIONS", "path": "/api/echo"},
+        {"path": "/docs"},
+        {"method": "POST", "path": "/api/batch/", "body": {"requests": []}},
+    )
+    assert [response["status"] for response in responses] == [405, 400, 400]
+
+
+def test_failing_item_does_not_fail_the_batch(client):
+    responses = _run(client, {"path": "/api/boom"}, {"path": "/api/echo"})
+    assert [response["status"] for response in responses] == [500, 200]
+
+
+def test_slow_items_time_out(client, monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_TIMEOUT_SECONDS", 0.2)
+    responses = _run(client, {"path": "/api/slow"}, {"path": "/api/echo"})
+    assert [response["status"] for response in responses] == [504, 200]
+
+
+def test_batch_size_limits(client, monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_MAX_REQUESTS", 2)
+    assert client.post("/api/batch", json={"requests": []}).status_code == 400
+    too_many = {"requests": [{"path": "/api/echo"}] * 3}
+    assert client.post("/api/batch", json=too_many).status_code == 413
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from pydantic import BaseModel
+
+from firestore_codec import codec_for, to_date, to_datetime
+
+
+class Sample(BaseModel):
+    name: str
+    due: Optional[date] = None
+    created: datetime
+
+
+def test_to_datetime_normalizes_to_naive_utc():
+    aware = DatetimeWithNanoseconds(2026, 10, 19, 12, 30, tzinfo=timezone(timedelta(hours=2)))
+    converted = to_datetime(aware)
+    assert type(converted) is datetime
+    assert converted == datetime(2026, 10, 19, 10, 30)
+    assert to_datetime("2026-10-19T10:30:00Z") == datetime(2026, 10, 19, 10, 30)
+    assert to_datetime(date(2026, 10, 19)) == datetime(2026, 10, 19)
+    assert to_datetime("not a date") is None
+    assert to_datetime(None) is None
+
+
+def test_to_date():
+    assert to_date(date(2026, 10, 19)) == date(2026, 10, 19)
+    assert to_date(datetime(2026, 10, 19, 23, 0)) == date(2026, 10, 19)
+
+
+def test_codec_finds_temporal_fields_once():
+    codec = codec_for(Sample)
+    assert codec is codec_for(Sample)
+    assert codec.date_fields == ("due",)
+    assert codec.datetime_fields == ("created",)
+
+
+def test_encode_decode_round_trip():
+    codec = codec_for(Sample)
+    encoded = codec.encode({"name": "pump", "due": date(2026, 10, 19), "created": datetime(2026, 10, 1, 8)})
+    assert encoded["due"] == datetime(2026, 10, 19)
+
+    stored = {
+        "name": "pump",
+        "due": DatetimeWithNanoseconds(2026, 10, 19, tzinfo=timezone.utc),
+        "created": "2026-10-01T08:00:00+00:00",
+    }
+    decoded = codec.decode(stored)
+    assert decoded == {"name": "pump", "due": date(2026, 10, 19), "created": datetime(2026, 10, 1, 8)}
+    assert type(decoded["due"]) is date
+    assert Sample(**decoded).due == date(2026, 10, 19)
+
+
+def test_decode_passes_through_empty_documents():
+    assert codec_for(Sample).decode(None) is None
+    assert codec_for(Sample).decode({}) == {}
@@ -0,0 +1,52 @@
+import pytest
+from firebase_admin import firestore
+
+import firestore_instrumentation
+from fake_firestore import FakeFirestore
+from firestore_instrumentation import instrument
+
+
+@pytest.fixture
+def calls():
+    recorded = []
+
+    def observer(collection, op, docs, seconds):
+        recorded.append((collection, op, docs))
+
+    firestore_instrumentation.add_observer(observer)
+    yield recorded
+    firestore_instrumentation.remove_observer(observer)
+
+
+@pytest.fixture
+def db():
+    db = instrument(FakeFirestore())
+    db.unwrapped.collection("inboxes").document("bob").set({"unread": 2})
+    db.unwrapped.collection("inboxes").document("bob").collection("items").document("n1").set({"read": False})
+    db.unwrapped.collection("inboxes").document("bob").collection("items").document("n2").set({"read": False})
+    return db
+
+
+def test_get_all(db, calls):
+    inboxes = db.collection("inboxes")
+    found = [snapshot.exists for snapshot in db.get_all([inboxes.document("bob"), inboxes.document("eve")])]
+    assert found == [True, False]
+    assert calls == [("inboxes", "get", 2)]
+
+
+def test_transaction_reads_and_commit(db, calls):
+    inbox = db.collection("inboxes").document("bob")
+    items = inbox.collection("items")
+
+    @firestore.transactional
+    def mark_all_read(transaction):
+        unread = list(transaction.get(items.where("read", "==", False)))
+        counter = next(iter(transaction.get(inbox)))
+        for snapshot in unread:
+            transaction.update(snapshot.reference, {"read": True})
+        transaction.update(inbox, {"unread": counter.to_dict()["unread"] - len(unread)})
+        return len(unread)
+
+    assert mark_all_read(db.transaction()) == 2
+    assert calls == [("items", "query", 2), ("inboxes", "get", 1), ("transaction", "commit", 3)]
+    assert inbox.get().to_dict() == {"unread": 0}
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import database
+import idempotency
+from fake_firestore import FakeFirestore
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+
+
+@pytest.fixture
+def db():
+    fake = FakeFirestore()
+    previous = database.set_database(fake)
+    yield fake
+    database.db_instance.db = previous
+    database.db_instance.async_db = database.db_instance.async_loop = None
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.status = 201
+        self.delay = 0.0
+
+
+def _make_app(counter: Counter) -> FastAPI:
+    """One worker: its own app and store over the shared fake Firestore."""
+    app = FastAPI()
+
+    @app.post("/api/items")
+    async def create_item(request: Request):
+        counter.calls += 1
+        body = await request.body()
+        await asyncio.sleep(counter.delay)
+        return JSONResponse({"n": counter.calls, "size": len(body)}, status_code=counter.status)
+
+    @app.get("/api/items")
+    async def list_items():
+        counter.calls += 1
+        return {"n": counter.calls}
+
+    app.add_middleware(IdempotencyMiddleware, idempotency_store=IdempotencyStore())
+    return app
+
+
+@pytest.fixture
+def counter():
+    return Counter()
+
+
+@pytest.fixture
+def app(db, counter):
+    return _make_app(counter)
+
+
+@pytest.fixture
+def client(app):
+    with TestClient(app) as client:
+        yield client
+
+
+def _post(client, key, body=None, **kwargs):
+    return client.post("/api/items", json=body if body is not None else {"title": "pump"},
+                       headers={"Idempotency-Key": key}, **kwargs)
+
+
+def test_retry_is_replayed(client, counter):
+    first = _post(client, "k1")
+    second = _post(client, "k1")
+    assert first.status_code == second.status_code == 201
+    assert first.json() == second.json() == {"n": 1, "size": 16}
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.headers["content-type"] == "application/json"
+    assert counter.calls == 1
+
+
+def test_record_is_shared_between_workers(client, counter):
+    _post(client, "k1")
+    # Another worker has an empty cache and finds the record in Firestore
+    with TestClient(_make_app(counter)) as second_worker:
+        replay = _post(second_worker, "k1")
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.json() == {"n": 1, "size": 16}
+    assert counter.calls == 1
+
+
+def test_keys_are_scoped_to_the_path(client, counter):
+    _post(client, "k1")
+    assert client.post("/api/other", json={}, headers={"Idempotency-Key": "k1"}).status_code == 404
+    assert _post(client, "k2").json()["n"] == 2
+
+
+def test_different_body_with_same_key_is_rejected(client, counter):
+    _post(client, "k1")
+    assert _post(client, "k1", {"title": "valve"}).status_code == 422
+    other_query = client.post("/api/items?draft=1", json={"title": "pump"}, headers={"Idempotency-Key": "k1"})
+    assert other_query.status_code == 422
+    assert counter.calls == 1
+
+
+def test_concurrent_retry_waits_and_replays(app, counter):
+    counter.delay = 0.2
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/api/items", json={"title": "pump"}, headers={"Idempotency-Key": "k1"})
+                for _ in range(3)
+            ))
+
+    responses = asyncio.run(scenario())
+    assert [response.json() for response in responses] == [{"n": 1, "size": 16}] * 3
+    assert sorted(response.headers.get("idempotent-replayed", "") for response in responses) == ["", "true", "true"]
+    assert counter.calls == 1
+
+
+def test_pending_key_held_elsewhere_is_a_conflict(client, counter, db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.1)
+    now = datetime.now(timezone.utc)
+    db.collection(idempotency.COLLECTION).document(idempotency._document_id("/api/items", "k1")).set({
+        "state": "pending",
+        "fingerprint": "other worker",
+        "lockedUntil": now + timedelta(seconds=60),
+        "expiresAt": now + timedelta(hours=1),
+    })
+    busy = _post(client, "k1")
+    assert busy.status_code == 409
+    assert busy.headers["retry-after"] == "1"
+    assert counter.calls == 0
+
+
+def test_abandoned_claim_is_taken_over(client, counter, db):
+    now = datetime.now(timezone.utc)
+    db.collection(idempotency.COLLECTION).document(idempotency._document_id("/api/items", "k1")).set({
+        "state": "pending",
+        "fingerprint": "crashed worker",
+        "lockedUntil": now - timedelta(seconds=1),
+        "expiresAt": now + timedelta(hours=1),
+    })
+    assert _post(client, "k1").status_code == 201
+    assert counter.calls == 1
+
+
+def test_server_errors_are_not_stored(client, counter):
+    counter.status = 503
+    assert _post(client, "k1").status_code == 503
+    counter.status = 201
+    retry = _post(client, "k1")
+    assert retry.status_code == 201
+    assert "idempotent-replayed" not in retry.headers
+    assert counter.calls == 2
+
+
+def test_requests_without_a_key_run_every_time(client, counter):
+    client.post("/api/items", json={})
+    client.post("/api/items", json={})
+    client.get("/api/items", headers={"Idempotency-Key": "k1"})
+    assert counter.calls == 3
+
+
+def test_multipart_passes_through(client, counter):
+    for _ in range(2):
+        response = client.post("/api/items", files={"file": ("a.txt", b"abc")}, headers={"Idempotency-Key": "k1"})
+        assert response.status_code == 201
+    assert counter.calls == 2
+
+
+def test_oversized_body(client, counter, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_REQUEST_BYTES", 64)
+    assert _post(client, "k1", {"notes": "x" * 100}).status_code == 413
+    assert counter.calls == 0
+
+
+def test_invalid_key(client, counter):
+    assert _post(client, "x" * 256).status_code == 400
+    assert counter.calls == 0
@@ -0,0 +1,14 @@
+import images
+
+
+def test_iter_images_walks_blob_shards(tmp_path):
+    for name in ("ab/cd/a.jpg", "ab/cd/thumbs/a_thumb.webp", ".staging/b.png", "ab/ef/c.PNG", "ab/ef/d.txt"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+    found = [path.relative_to(tmp_path).as_posix() for path in images.iter_images([tmp_path])]
+    assert found == ["ab/cd/a.jpg", "ab/ef/c.PNG"]
+
+
+def test_iter_images_skips_missing_directories(tmp_path):
+    assert list(images.iter_images([tmp_path / "missing"])) == []
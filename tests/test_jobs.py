@@ -0,0 +1,170 @@
+import time
+
+import pytest
+
+import jobs
+from jobs import JobQueue, PermanentJobError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3", workers=4)
+    queue.register("thumbnail", lambda payload: None, concurrency=2, max_attempts=3)
+    queue.register("email", lambda payload: None, concurrency=1)
+    return queue
+
+
+def _row(queue, job_id):
+    return queue._connection().execute(
+        "SELECT status, attempts, run_at, locked_by, last_error FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+
+
+class TestEnqueue:
+    def test_duplicate_key_is_ignored_while_queued(self, queue):
+        first = queue.enqueue("email", {"to": "a"}, key="digest")
+        assert first is not None
+        assert queue.enqueue("email", {"to": "b"}, key="digest") is None
+        assert queue.enqueue("email", {"to": "c"}) is not None
+
+    def test_max_attempts_comes_from_handler(self, queue):
+        job_id = queue.enqueue("thumbnail")
+        max_attempts, = queue._connection().execute(
+            "SELECT max_attempts FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        assert max_attempts == 3
+
+
+class TestClaim:
+    def test_claims_due_jobs_with_payload(self, queue):
+        job_id = queue.enqueue("email", {"to": "a"})
+        claimed, = queue._claim(4)
+        assert (claimed.id, claimed.type, claimed.payload, claimed.attempts) == (job_id, "email", {"to": "a"}, 1)
+        status, attempts, _, locked_by, _ = _row(queue, job_id)
+        assert (status, attempts, locked_by) == ("running", 1, queue._holder)
+        assert queue._claim(4) == []
+
+    def test_skips_delayed_jobs(self, queue):
+        queue.enqueue("email", delay=60)
+        assert queue._claim(4) == []
+
+    def test_respects_type_concurrency(self, queue):
+        for _ in range(3):
+            queue.enqueue("thumbnail")
+        assert len(queue._claim(4)) == 2
+        assert queue._claim(4) == []
+
+    def test_respects_capacity(self, queue):
+        queue.enqueue("thumbnail")
+        queue.enqueue("thumbnail")
+        queue.enqueue("email")
+        assert len(queue._claim(1)) == 1
+        assert len(queue._claim(2)) == 2
+
+    def test_ignores_unregistered_types(self, queue):
+        queue.enqueue("unknown")
+        assert queue._claim(4) == []
+
+    def test_reclaims_expired_lease(self, queue):
+        job_id = queue.enqueue("email")
+        queue._claim(4)
+        queue._connection().execute("UPDATE jobs SET locked_until = ? WHERE id = ?", (time.time() - 1, job_id))
+        reclaimed, = queue._claim(4)
+        assert (reclaimed.id, reclaimed.attempts) == (job_id, 2)
+
+
+class TestFail:
+    def test_retries_with_backoff(self, queue):
+        job_id = queue.enqueue("thumbnail")
+        job, = queue._claim(4)
+        queue._fail(job, RuntimeError("boom"))
+        status, attempts, run_at, locked_by, last_error = _row(queue, job_id)
+        assert (status, attempts, locked_by) == ("queued", 1, None)
+        assert run_at > time.time()
+        assert last_error == "RuntimeError: boom"
+        assert queue.failed == 1
+
+    def test_buries_after_max_attempts(self, queue):
+        job_id = queue.enqueue("thumbnail", {"path": "a.png"})
+        for _ in range(3):
+            queue._connection().execute("UPDATE jobs SET run_at = 0 WHERE id = ?", (job_id,))
+            job, = queue._claim(4)
+            queue._fail(job, RuntimeError("boom"))
+        assert _row(queue, job_id) is None
+        dead, = queue.dead_jobs()
+        assert (dead["id"], dead["attempts"], dead["payload"]) == (job_id, 3, {"path": "a.png"})
+        assert dead["error"] == "RuntimeError: boom"
+
+    def test_permanent_error_buries_at_once(self, queue):
+        job_id = queue.enqueue("thumbnail")
+        job, = queue._claim(4)
+        queue._fail(job, PermanentJobError("bad input"))
+        assert _row(queue, job_id) is None
+        assert [dead["id"] for dead in queue.dead_jobs()] == [job_id]
+
+    def test_requeued_key_replaces_failed_job(self, queue):
+        first = queue.enqueue("email", key="digest")
+        job, = queue._claim(4)
+        second = queue.enqueue("email", key="digest")
+        queue._fail(job, RuntimeError("boom"))
+        assert _row(queue, first) is None
+        assert _row(queue, second)[0] == "queued"
+
+    def test_ignores_job_taken_over_by_another_worker(self, queue):
+        job_id = queue.enqueue("email")
+        job, = queue._claim(4)
+        queue._connection().execute("UPDATE jobs SET locked_by = 'other' WHERE id = ?", (job_id,))
+        queue._fail(job, PermanentJobError("bad input"))
+        assert _row(queue, job_id)[0] == "running"
+        assert queue.dead_jobs() == []
+
+
+class TestRetryDead:
+    def test_requeues_with_attempts_reset(self, queue):
+        job_id = queue.enqueue("thumbnail", {"path": "a.png"})
+        job, = queue._claim(4)
+        queue._fail(job, PermanentJobError("bad input"))
+
+        assert queue.retry_dead(job_id)
+        status, attempts, run_at, _, _ = _row(queue, job_id)
+        assert (status, attempts) == ("queued", 0)
+        assert run_at <= time.time()
+        assert queue.dead_jobs() == []
+        revived, = queue._claim(4)
+        assert (revived.id, revived.payload, revived.max_attempts) == (job_id, {"path": "a.png"}, 3)
+
+    def test_unknown_job(self, queue):
+        assert not queue.retry_dead(12345)
+
+    def test_keeps_dead_job_while_key_is_queued(self, queue):
+        job_id = queue.enqueue("email", key="digest")
+        job, = queue._claim(4)
+        queue._fail(job, PermanentJobError("bad input"))
+        queue.enqueue("email", key="digest")
+
+        assert not queue.retry_dead(job_id)
+        assert [dead["id"] for dead in queue.dead_jobs()] == [job_id]
+
+
+def test_run_job_deletes_completed_job(queue):
+    seen = []
+    queue.register("email", seen.append)
+    job_id = queue.enqueue("email", {"to": "a"})
+    job, = queue._claim(4)
+    queue._active = 1
+    queue._run_job(job)
+    assert seen == [{"to": "a"}]
+    assert _row(queue, job_id) is None
+    assert queue.completed == 1
+    stats = queue.stats()
+    assert (stats["completed"], stats["active"]) == (1, 0)
+
+
+def test_backoff_is_capped(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_MAX_BACKOFF_SECONDS", 10.0)
+    job_id = queue.enqueue("email", max_attempts=50)
+    queue._connection().execute("UPDATE jobs SET attempts = 40 WHERE id = ?", (job_id,))
+    job, = queue._claim(4)
+    queue._fail(job, RuntimeError("boom"))
+    run_at = _row(queue, job_id)[2]
+    assert run_at <= time.time() + 10.0
@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions
+
+import progress_coalescer
+import write_behind
+from fake_firestore import AsyncFakeFirestore, FakeFirestore
+from progress_coalescer import ProgressCoalescer
+
+
+@pytest.fixture(autouse=True)
+def write_through(monkeypatch):
+    monkeypatch.setattr(write_behind, "WRITE_BEHIND_ENABLED", False)
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    db.collection("work_orders").document("wo1").set({"status": "open", "notes": "", "progress": 0})
+    return db
+
+
+class Loads:
+    """Counts reads of the document, like the route's load callback."""
+
+    def __init__(self, reference) -> None:
+        self.reference = reference
+        self.count = 0
+
+    async def __call__(self):
+        self.count += 1
+        return await write_behind.get(self.reference)
+
+
+def _stored(db):
+    return db.collection("work_orders").document("wo1").get().to_dict()
+
+
+def test_merges_updates_within_window(db):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=60)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        load = Loads(reference)
+
+        first = await coalescer.submit(reference, {"notes": "a", "progress": 10}, load)
+        second = await coalescer.submit(reference, {"notes": "ab"}, load)
+        assert first["notes"] == "a"
+        assert (second["notes"], second["progress"], second["id"]) == ("ab", 10, "wo1")
+        # Answered from the pending copy, nothing written yet
+        assert load.count == 1
+        assert _stored(db)["notes"] == ""
+
+        await coalescer.flush("work_orders/wo1")
+        assert _stored(db) == {"status": "open", "notes": "ab", "progress": 10}
+        assert coalescer.stats() == {"windowSeconds": 60, "pending": 0, "updates": 2, "writes": 1}
+
+    asyncio.run(scenario())
+
+
+def test_flushes_when_window_ends(db):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=0.05)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        await coalescer.submit(reference, {"progress": 50}, Loads(reference))
+        await asyncio.sleep(0.2)
+        assert _stored(db)["progress"] == 50
+        assert coalescer.stats()["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_status_change_writes_at_once(db):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=60)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        load = Loads(reference)
+        await coalescer.submit(reference, {"notes": "done"}, load)
+        # Same status again is not a change
+        await coalescer.submit(reference, {"status": "open"}, load)
+        assert _stored(db)["notes"] == ""
+
+        await coalescer.submit(reference, {"status": "completed", "progress": 100}, load)
+        assert _stored(db) == {"status": "completed", "notes": "done", "progress": 100}
+        assert coalescer.stats()["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_missing_document(db):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=60)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("nope")
+        assert await coalescer.submit(reference, {"progress": 1}, Loads(reference)) is None
+        assert coalescer.stats()["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_zero_window_writes_through(db):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=0)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        document = await coalescer.submit(reference, {"progress": 5}, Loads(reference))
+        assert document["progress"] == 5
+        assert _stored(db)["progress"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_overlay_and_discard(db):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=60)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        await coalescer.submit(reference, {"progress": 30}, Loads(reference))
+
+        read = {"id": "wo1", "status": "open", "progress": 0}
+        assert coalescer.overlay(read)["progress"] == 30
+        assert read["progress"] == 0
+        assert coalescer.overlay({"id": "other", "progress": 0})["progress"] == 0
+        assert coalescer.overlay(None) is None
+
+        coalescer.discard("work_orders/wo1")
+        assert coalescer.overlay(read)["progress"] == 0
+        await coalescer.flush_all()
+        assert _stored(db)["progress"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_transient_failure_is_requeued(db, monkeypatch):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=60)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        load = Loads(reference)
+        await coalescer.submit(reference, {"progress": 40}, load)
+
+        write = write_behind.write
+
+        async def unavailable(*args, **kwargs):
+            raise exceptions.ServiceUnavailable("down")
+
+        monkeypatch.setattr(write_behind, "write", unavailable)
+        with pytest.raises(exceptions.ServiceUnavailable):
+            await coalescer.flush("work_orders/wo1")
+        assert coalescer.stats()["pending"] == 1
+
+        # Newer fields win over the ones that failed
+        await coalescer.submit(reference, {"notes": "x", "progress": 45}, load)
+        monkeypatch.setattr(write_behind, "write", write)
+        await coalescer.flush_all()
+        assert _stored(db) == {"status": "open", "notes": "x", "progress": 45}
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_attempts(db, monkeypatch):
+    async def scenario():
+        coalescer = ProgressCoalescer(window_seconds=60)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("wo1")
+        await coalescer.submit(reference, {"progress": 40}, Loads(reference))
+
+        async def unavailable(*args, **kwargs):
+            raise exceptions.ServiceUnavailable("down")
+
+        monkeypatch.setattr(write_behind, "write", unavailable)
+        for _ in range(progress_coalescer.MAX_FLUSH_ATTEMPTS):
+            with pytest.raises(exceptions.ServiceUnavailable):
+                await coalescer.flush("work_orders/wo1")
+        assert coalescer.stats()["pending"] == 0
+
+    asyncio.run(scenario())
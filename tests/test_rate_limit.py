@@ -0,0 +1,61 @@
+import json
+
+import rate_limit
+from rate_limit import RateLimiter, RouteRule, TokenBucket
+
+
+def test_token_bucket_takes_until_empty():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.take() == (True, 0.0)
+    assert bucket.take() == (True, 0.0)
+    allowed, retry_after = bucket.take()
+    assert not allowed
+    assert 0 < retry_after <= 1
+
+
+def test_token_bucket_debit_can_go_negative():
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.debit(10)
+    allowed, retry_after = bucket.available()
+    assert not allowed
+    assert retry_after > 5
+
+
+def test_route_rule_exact_match():
+    rule = RouteRule(method="GET", path="/api/work-orders", rate=1, burst=1)
+    assert rule.matches("GET", "/api/work-orders")
+    assert rule.matches("GET", "/api/work-orders/")
+    assert not rule.matches("GET", "/api/work-orders/abc")
+    assert not rule.matches("POST", "/api/work-orders")
+
+
+def test_route_rule_prefix_match():
+    rule = RouteRule(method="*", path="/api/uploads", rate=1, burst=1, prefix=True)
+    assert rule.matches("POST", "/api/uploads/abc")
+    assert rule.matches("GET", "/api/uploads")
+    assert not rule.matches("GET", "/api/uploads-archive")
+
+
+def test_load_rules_orders_most_specific_first(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_RULES", json.dumps([
+        {"path": "/api", "rate": 50, "prefix": True},
+        {"method": "get", "path": "/api/work-orders/stats/summary", "rate": 1},
+    ]))
+    rules = rate_limit.load_rules()
+    assert [rule.path for rule in rules] == ["/api/work-orders/stats/summary", "/api"]
+    assert rules[0].method == "GET"
+    assert rules[0].burst == 1
+
+
+def test_limiter_separates_clients_and_routes():
+    rule = RouteRule(method="GET", path="/api/locations", rate=0.001, burst=1, route_rate=0.001, route_burst=2)
+    limiter = RateLimiter([rule])
+    assert limiter.check("a", "GET", "/api/locations")[0]
+    allowed, _, reason = limiter.check("a", "GET", "/api/locations")
+    assert not allowed and reason == "Too many requests"
+    assert limiter.check("b", "GET", "/api/locations")[0]
+    allowed, _, reason = limiter.check("c", "GET", "/api/locations")
+    assert not allowed and reason == "Endpoint is busy"
+    # Detail reads fall under the per-client default bucket
+    assert limiter.check("a", "GET", "/api/locations/xyz")[0]
+    assert limiter.stats()["rejected"] == {"client": 1, "route": 1, "quota": 0}
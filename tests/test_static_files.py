@@ -0,0 +1,97 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+
+import static_files
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-9", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert static_files._parse_range(header, 100) == expected
+
+
+def test_parse_range_unsatisfiable():
+    with pytest.raises(ValueError):
+        static_files._parse_range("bytes=200-", 100)
+
+
+def test_is_not_modified():
+    last_modified = "Mon, 19 Oct 2026 10:00:00 GMT"
+    assert static_files._is_not_modified(Headers({"if-none-match": '"x", "abc"'}), '"abc"', last_modified)
+    assert static_files._is_not_modified(Headers({"if-none-match": "*"}), '"abc"', last_modified)
+    assert not static_files._is_not_modified(Headers({"if-none-match": '"other"'}), '"abc"', last_modified)
+    assert static_files._is_not_modified(Headers({"if-modified-since": last_modified}), '"abc"', last_modified)
+    assert not static_files._is_not_modified(
+        Headers({"if-modified-since": "Sun, 18 Oct 2026 10:00:00 GMT"}), '"abc"', last_modified
+    )
+
+
+def test_precompress_keeps_only_smaller_siblings(tmp_path):
+    text = tmp_path / "notes.txt"
+    text.write_bytes(b"inspection notes\n" * 200)
+    tiny = tmp_path / "tiny.txt"
+    tiny.write_bytes(b"x")
+
+    static_files.precompress(text)
+    static_files.precompress(tiny)
+
+    assert gzip.decompress((tmp_path / "notes.txt.gz").read_bytes()) == text.read_bytes()
+    assert not (tmp_path / "tiny.txt.gz").exists()
+    assert not (tmp_path / "tiny.txt.br").exists()
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith(".")]
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "doc.txt").write_bytes(b"0123456789" * 100)
+    (tmp_path / ".partial").write_bytes(b"secret")
+    static_files.precompress(tmp_path / "doc.txt")
+    app = FastAPI()
+    app.mount("/files", static_files.CachedStaticFiles(directory=tmp_path), name="files")
+    return TestClient(app)
+
+
+def test_serves_with_immutable_caching_and_conditional_requests(client):
+    response = client.get("/files/doc.txt", headers={"accept-encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == static_files.IMMUTABLE
+    assert "content-encoding" not in response.headers
+
+    revalidated = client.get(
+        "/files/doc.txt",
+        headers={"accept-encoding": "identity", "if-none-match": response.headers["etag"]},
+    )
+    assert revalidated.status_code == 304
+
+
+def test_serves_precompressed_sibling(client):
+    response = client.get("/files/doc.txt", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == b"0123456789" * 100
+
+
+def test_byte_ranges(client):
+    partial = client.get("/files/doc.txt", headers={"accept-encoding": "identity", "range": "bytes=10-14"})
+    assert partial.status_code == 206
+    assert partial.content == b"01234"
+    assert partial.headers["content-range"] == "bytes 10-14/1000"
+
+    unsatisfiable = client.get("/files/doc.txt", headers={"accept-encoding": "identity", "range": "bytes=5000-"})
+    assert unsatisfiable.status_code == 416
+
+
+def test_dot_files_are_not_served(client):
+    assert client.get("/files/.partial").status_code == 404
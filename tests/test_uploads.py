@@ -0,0 +1,62 @@
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+import uploads
+from uploads import save_upload, sniff_content_type
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+def _upload(data: bytes, filename: str = "photo.png", content_type: str = "image/png", size=None) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename, size=size,
+                      headers=Headers({"content-type": content_type}))
+
+
+@pytest.mark.parametrize("head, declared, expected", [
+    (PNG, None, "image/png"),
+    (b"\xff\xd8\xff\xe0rest", "image/png", "image/jpeg"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", None, "image/webp"),
+    (b"%PDF-1.7", None, "application/pdf"),
+    (b"PK\x03\x04rest", "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+     "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    (b"PK\x03\x04rest", None, "application/zip"),
+    (b"plain notes", "image/png", "text/plain"),
+    (b"\x00\x01\x02", None, "application/octet-stream"),
+])
+def test_sniff_content_type(head, declared, expected):
+    assert sniff_content_type(head, declared) == expected
+
+
+def test_save_upload_streams_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 16)
+    stored = save_upload(_upload(PNG), tmp_path, "abc", max_bytes=1024, allowed_types=uploads.IMAGE_TYPES)
+    assert stored.path == tmp_path / "abc.png"
+    assert stored.path.read_bytes() == PNG
+    assert (stored.size, stored.content_type) == (len(PNG), "image/png")
+    assert stored.sha256 == hashlib.sha256(PNG).hexdigest()
+    assert [path.name for path in tmp_path.iterdir()] == ["abc.png"]
+
+
+def test_default_extension(tmp_path):
+    stored = save_upload(_upload(b"notes", filename="README"), tmp_path, "abc", max_bytes=1024,
+                         default_extension=".txt")
+    assert stored.filename == "abc.txt"
+
+
+@pytest.mark.parametrize("upload, status", [
+    (lambda: _upload(PNG * 20), 413),
+    (lambda: _upload(PNG, size=10_000), 413),
+    (lambda: _upload(b""), 400),
+    (lambda: _upload(b"%PDF-1.7", filename="x.pdf"), 415),
+    (lambda: _upload(PNG, filename=""), 400),
+])
+def test_rejected_uploads_leave_nothing_behind(tmp_path, monkeypatch, upload, status):
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 16)
+    with pytest.raises(HTTPException) as error:
+        save_upload(upload(), tmp_path, "abc", max_bytes=1024, allowed_types=uploads.IMAGE_TYPES)
+    assert error.value.status_code == status
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from google.api_core import exceptions
+
+import write_behind
+from fake_firestore import AsyncFakeFirestore, FakeFirestore
+from write_behind import Journal, apply_op, coalesce
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return Journal(tmp_path / "write_behind.sqlite3")
+
+
+class TestApplyOp:
+    def test_set_replaces_document(self):
+        assert apply_op({"a": 1}, "set", {"b": 2}) == {"b": 2}
+
+    def test_delete(self):
+        assert apply_op({"a": 1}, "delete", None) is None
+
+    def test_merge_is_deep(self):
+        current = {"a": {"x": 1, "y": 2}, "b": 1}
+        assert apply_op(current, "merge", {"a": {"y": 3}}) == {"a": {"x": 1, "y": 3}, "b": 1}
+        assert current == {"a": {"x": 1, "y": 2}, "b": 1}
+
+    def test_merge_creates_missing_document(self):
+        assert apply_op(None, "merge", {"a": 1}) == {"a": 1}
+
+    def test_update_takes_field_paths(self):
+        assert apply_op({"a": {"x": 1}}, "update", {"a.y": 2, "b": 3}) == {"a": {"x": 1, "y": 2}, "b": 3}
+
+    def test_update_of_missing_document(self):
+        assert apply_op(None, "update", {"a": 1}) is None
+
+    def test_unknown_op(self):
+        with pytest.raises(ValueError):
+            apply_op({}, "upsert", {})
+
+
+class TestCoalesce:
+    def test_set_then_updates_fold_into_set(self):
+        ops = [("set", {"a": 1}), ("update", {"b": 2}), ("merge", {"c": 3})]
+        assert coalesce(ops) == [("set", {"a": 1, "b": 2, "c": 3})]
+
+    def test_delete_discards_earlier_writes(self):
+        assert coalesce([("update", {"a": 1}), ("merge", {"b": 2}), ("delete", None)]) == [("delete", None)]
+
+    def test_merge_after_delete_becomes_set(self):
+        assert coalesce([("delete", None), ("merge", {"a": 1})]) == [("set", {"a": 1})]
+
+    def test_merges_fold(self):
+        assert coalesce([("merge", {"a": {"x": 1}}), ("merge", {"a": {"y": 2}})]) == [
+            ("merge", {"a": {"x": 1, "y": 2}})
+        ]
+
+    def test_disjoint_updates_fold(self):
+        assert coalesce([("update", {"a": 1}), ("update", {"b": 2})]) == [("update", {"a": 1, "b": 2})]
+
+    def test_later_update_of_same_field_wins(self):
+        assert coalesce([("update", {"a": 1}), ("update", {"a": 2})]) == [("update", {"a": 2})]
+
+    def test_overlapping_paths_are_kept_in_order(self):
+        ops = [("update", {"a.x": 1}), ("update", {"a": {"y": 2}})]
+        assert coalesce(ops) == ops
+
+    def test_update_after_merge_is_kept(self):
+        ops = [("merge", {"a": 1}), ("update", {"b": 2})]
+        assert coalesce(ops) == ops
+
+    def test_same_end_result(self):
+        ops = [
+            ("merge", {"a": {"x": 1}}), ("update", {"a.x": 2}), ("update", {"b": 1}),
+            ("update", {"a": {"z": 3}}), ("merge", {"c": 1}), ("merge", {"c": 2}),
+        ]
+        current = {"a": {"x": 0, "y": 0}, "d": 1}
+        expected = current
+        for op, data in ops:
+            expected = apply_op(expected, op, data)
+        folded = current
+        for op, data in coalesce(ops):
+            folded = apply_op(folded, op, data)
+        assert folded == expected
+
+
+def test_encoding_round_trips_datetimes():
+    data = {"when": datetime(2024, 5, 1, 12, 30), "nested": {"n": 1}}
+    assert write_behind.decode(write_behind.encode(data)) == data
+
+
+class TestJournal:
+    def test_append_rejects_unknown_op(self, journal):
+        with pytest.raises(ValueError):
+            journal.append("work_orders", "a", "upsert", {})
+
+    def test_pending_ops(self, journal):
+        journal.append("work_orders", "a", "set", {"n": 1})
+        journal.append("work_orders", "b", "set", {"n": 2})
+        journal.append("work_orders", "a", "update", {"n": 3})
+        assert journal.pending_ops("work_orders", "a") == [("set", {"n": 1}), ("update", {"n": 3})]
+        assert set(journal.pending_documents("work_orders")) == {"a", "b"}
+
+    def test_flush_once_writes_and_empties_journal(self, journal):
+        db = FakeFirestore()
+        db.collection("work_orders").document("b").set({"status": "open", "n": 0})
+        journal.append("work_orders", "a", "set", {"n": 1})
+        journal.append("work_orders", "a", "update", {"n": 2})
+        journal.append("work_orders", "b", "update", {"status": "completed"})
+        journal.append("assets", "c", "merge", {"name": "Pump"})
+
+        assert journal.flush_once(db) == 4
+        assert db.collection("work_orders").document("a").get().to_dict() == {"n": 2}
+        assert db.collection("work_orders").document("b").get().to_dict() == {"status": "completed", "n": 0}
+        assert db.collection("assets").document("c").get().to_dict() == {"name": "Pump"}
+        assert journal.pending_ops("work_orders", "a") == []
+        assert journal.coalesced == 1
+        assert journal.stats()["pending"] == 0
+        assert journal.flush_once(db) == 0
+
+    def test_rejected_document_is_dead_lettered(self, journal):
+        db = FakeFirestore()
+        journal.append("work_orders", "missing", "update", {"n": 1})
+        journal.append("work_orders", "a", "set", {"n": 1})
+
+        # The update of a missing document fails the batch; the rest still lands
+        assert journal.flush_once(db) == 2
+        assert db.collection("work_orders").document("a").get().to_dict() == {"n": 1}
+        stats = journal.stats()
+        assert stats["pending"] == 0
+        assert stats["deadLetters"] == 1
+
+    def test_transient_error_keeps_entries(self, journal):
+        class Unavailable(FakeFirestore):
+            def batch(self):
+                raise exceptions.ServiceUnavailable("down")
+
+        journal.append("work_orders", "a", "set", {"n": 1})
+        with pytest.raises(exceptions.ServiceUnavailable):
+            journal.flush_once(Unavailable())
+        assert journal.pending_ops("work_orders", "a") == [("set", {"n": 1})]
+        attempts, = journal._connection().execute("SELECT attempts FROM journal").fetchone()
+        assert attempts == 1
+
+        db = FakeFirestore()
+        assert journal.flush_once(db) == 1
+        assert db.collection("work_orders").document("a").get().to_dict() == {"n": 1}
+
+    def test_lease_held_by_another_journal(self, tmp_path):
+        path = tmp_path / "write_behind.sqlite3"
+        first, second = Journal(path), Journal(path)
+        first.append("work_orders", "a", "set", {"n": 1})
+        assert first._acquire_lease()
+        assert second.flush_once(FakeFirestore()) == 0
+        assert second.pending_ops("work_orders", "a") == [("set", {"n": 1})]
+
+
+class TestGet:
+    @pytest.fixture(autouse=True)
+    def enabled(self, monkeypatch, journal):
+        monkeypatch.setattr(write_behind, "WRITE_BEHIND_ENABLED", True)
+        monkeypatch.setattr(write_behind, "READ_TIMEOUT_SECONDS", 0.05)
+        monkeypatch.setattr(write_behind, "journal", journal)
+
+    def test_applies_pending_ops(self, journal):
+        db = FakeFirestore()
+        db.collection("work_orders").document("a").set({"status": "open", "n": 0})
+        journal.append("work_orders", "a", "update", {"n": 1})
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("a")
+        document = asyncio.run(write_behind.get(reference))
+        assert document == {"status": "open", "n": 1, "id": "a", "_id": "a"}
+
+    def test_slow_firestore_raises_read_unavailable(self):
+        db = FakeFirestore(latency_ms=500)
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("a")
+        with pytest.raises(write_behind.ReadUnavailable):
+            asyncio.run(write_behind.get(reference))
+
+    def test_journal_answers_without_firestore(self, journal):
+        db = FakeFirestore(latency_ms=500)
+        journal.append("work_orders", "a", "set", {"n": 1})
+        reference = AsyncFakeFirestore(db).collection("work_orders").document("a")
+        assert asyncio.run(write_behind.get(reference)) == {"n": 1, "id": "a", "_id": "a"}